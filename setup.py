@@ -3,6 +3,7 @@ from setuptools import setup, find_packages
 setup(name='ubergrid',
       version='0.1.dev',
       packages=find_packages(exclude=["test/", "sample/"]),
+      package_data={"ubergrid": ["resources/*.java"]},
       license='MIT',
       author="Tim Renner",
       classifiers = [
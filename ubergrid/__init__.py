@@ -1 +1,2 @@
-from .ubergrid import read_results, read_results_frame, get_model
\ No newline at end of file
+from .ubergrid import read_results, read_results_frame, get_model, \
+    cache_info, cache_clear, set_cache_limits
\ No newline at end of file
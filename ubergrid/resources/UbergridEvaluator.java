@@ -0,0 +1,207 @@
+import java.io.*;
+import java.util.*;
+
+import org.dmg.pmml.FieldName;
+import org.dmg.pmml.PMML;
+import org.jpmml.evaluator.*;
+import org.jpmml.model.PMMLUtil;
+
+/**
+ * A long lived PMML evaluator for timing ubergrid models.
+ *
+ * It reads one tab separated command per line on stdin: the PMML file, the
+ * input file, the output file, the number of warmup passes and the number
+ * of timed passes. Each command is answered with one tab separated line on
+ * stdout, either "ok", the number of records, the load time and the mean
+ * time of a timed pass in seconds, or "error" and a message.
+ *
+ * Input files are parsed once per process, so neither JVM startup nor csv
+ * parsing is part of the timing.
+ */
+public class UbergridEvaluator {
+
+    private static Map<String, List<Map<String, String>>> inputs =
+        new HashMap<>();
+
+    public static void main(String[] args) throws Exception {
+        BufferedReader commands = new BufferedReader(
+            new InputStreamReader(System.in, "UTF-8"));
+        String command;
+        while((command = commands.readLine()) != null) {
+            String response;
+            try {
+                response = time(command.split("\t"));
+            } catch(Exception e) {
+                response = "error\t" + String.valueOf(e).replaceAll("\\s+", " ");
+            }
+            System.out.println(response);
+            System.out.flush();
+        }
+    }
+
+    /**
+     * Parses a csv file with a header. Fields can be quoted, with commas,
+     * newlines and doubled quotes inside the quotes.
+     */
+    static List<List<String>> parseCsv(Reader reader) throws IOException {
+        BufferedReader in = new BufferedReader(reader);
+        List<List<String>> records = new ArrayList<>();
+        List<String> record = new ArrayList<>();
+        StringBuilder field = new StringBuilder();
+        boolean quoted = false;
+        int c;
+        while((c = in.read()) != -1) {
+            if(quoted) {
+                if(c == '"') {
+                    in.mark(1);
+                    int next = in.read();
+                    if(next == '"') {
+                        field.append('"');
+                    } else {
+                        quoted = false;
+                        if(next != -1) {
+                            in.reset();
+                        }
+                    }
+                } else {
+                    field.append((char)c);
+                }
+            } else if(c == '"') {
+                quoted = true;
+            } else if(c == ',') {
+                record.add(field.toString());
+                field.setLength(0);
+            } else if(c == '\n') {
+                record.add(field.toString());
+                field.setLength(0);
+                addRecord(records, record);
+                record = new ArrayList<>();
+            } else if(c != '\r') {
+                field.append((char)c);
+            }
+        }
+        if(field.length() > 0 || !record.isEmpty()) {
+            record.add(field.toString());
+            addRecord(records, record);
+        }
+        return records;
+    }
+
+    private static void addRecord(List<List<String>> records,
+                                  List<String> record) {
+        // Blank lines aren't records.
+        if(record.size() > 1 || !record.get(0).isEmpty()) {
+            records.add(record);
+        }
+    }
+
+    private static String quoteCsv(Object value) {
+        String field = String.valueOf(value);
+        if(field.contains(",") || field.contains("\"") ||
+            field.contains("\n")) {
+            return "\"" + field.replace("\"", "\"\"") + "\"";
+        }
+        return field;
+    }
+
+    private static List<Map<String, String>> read(String inputFile)
+        throws IOException {
+        List<Map<String, String>> rows = inputs.get(inputFile);
+        if(rows != null) {
+            return rows;
+        }
+
+        List<List<String>> records;
+        try(Reader in = new InputStreamReader(
+            new FileInputStream(inputFile), "UTF-8")) {
+            records = parseCsv(in);
+        }
+
+        List<String> header = records.get(0);
+        rows = new ArrayList<>(records.size() - 1);
+        for(List<String> record : records.subList(1, records.size())) {
+            Map<String, String> row = new HashMap<>();
+            for(int ii = 0; ii < header.size() && ii < record.size(); ii++) {
+                row.put(header.get(ii).trim(), record.get(ii));
+            }
+            rows.add(row);
+        }
+        inputs.put(inputFile, rows);
+        return rows;
+    }
+
+    private static List<Map<FieldName, ?>> evaluate(
+        Evaluator evaluator, List<Map<String, String>> rows) {
+        List<InputField> inputFields = evaluator.getInputFields();
+        List<Map<FieldName, ?>> results = new ArrayList<>(rows.size());
+        for(Map<String, String> row : rows) {
+            Map<FieldName, FieldValue> arguments = new LinkedHashMap<>();
+            for(InputField inputField : inputFields) {
+                FieldName name = inputField.getName();
+                arguments.put(name, inputField.prepare(row.get(name.getValue())));
+            }
+            results.add(evaluator.evaluate(arguments));
+        }
+        return results;
+    }
+
+    private static String time(String[] command) throws Exception {
+        String pmmlFile = command[0];
+        String inputFile = command[1];
+        String outputFile = command[2];
+        int warmup = Integer.parseInt(command[3]);
+        int repeats = Integer.parseInt(command[4]);
+
+        List<Map<String, String>> rows = read(inputFile);
+
+        long loadStart = System.nanoTime();
+        PMML pmml;
+        try(InputStream in = new FileInputStream(pmmlFile)) {
+            pmml = PMMLUtil.unmarshal(in);
+        }
+        Evaluator evaluator =
+            ModelEvaluatorFactory.newInstance().newModelEvaluator(pmml);
+        evaluator.verify();
+        long loadTime = System.nanoTime() - loadStart;
+
+        for(int ii = 0; ii < warmup; ii++) {
+            evaluate(evaluator, rows);
+        }
+
+        List<Map<FieldName, ?>> results = null;
+        long totalTime = 0;
+        for(int ii = 0; ii < repeats; ii++) {
+            long start = System.nanoTime();
+            results = evaluate(evaluator, rows);
+            totalTime += System.nanoTime() - start;
+        }
+
+        // The predictions are written outside of the timed passes.
+        try(PrintWriter out = new PrintWriter(new FileWriter(outputFile))) {
+            List<FieldName> fields = new ArrayList<>();
+            for(TargetField targetField : evaluator.getTargetFields()) {
+                fields.add(targetField.getName());
+            }
+            for(OutputField outputField : evaluator.getOutputFields()) {
+                fields.add(outputField.getName());
+            }
+            StringJoiner header = new StringJoiner(",");
+            for(FieldName field : fields) {
+                header.add(quoteCsv(field));
+            }
+            out.println(header);
+            for(Map<FieldName, ?> result : results) {
+                StringJoiner line = new StringJoiner(",");
+                for(FieldName field : fields) {
+                    line.add(quoteCsv(
+                        EvaluatorUtil.decode(result.get(field))));
+                }
+                out.println(line);
+            }
+        }
+
+        return "ok\t" + rows.size() +
+            "\t" + (loadTime / 1e9) +
+            "\t" + (totalTime / 1e9 / Math.max(repeats, 1));
+    }
+}
@@ -9,9 +9,13 @@ import numpy as np
 from pandas import DataFrame, read_csv
 from sklearn.datasets import make_classification, make_regression
 from sklearn.ensemble import GradientBoostingClassifier
-from sklearn.linear_model import SGDRegressor
+from sklearn.linear_model import SGDRegressor, Lasso, LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.base import clone
+from sklearn.preprocessing import StandardScaler
 from sklearn.externals import joblib
 from sklearn.model_selection import train_test_split, ParameterGrid
+from sklearn.metrics import SCORERS
 
 import ubergrid_core as ug
 
@@ -228,6 +232,9 @@ class UbergridCoreUnitTest(TestCase):
             "train_log_loss",
             "train_roc_auc",
             "train_average_precision",
+            "train_predict_prediction_time",
+            "train_predict_proba_prediction_time",
+            "train_decision_function_prediction_time",
             "train_total_prediction_time",
             "train_total_prediction_records"
         ]
@@ -235,6 +242,19 @@ class UbergridCoreUnitTest(TestCase):
         self.assertEqual(sorted(list(results.keys())), 
                          sorted(result_keys_truth))
 
+        # Validate that the metrics computed from the shared predictions match
+        # the scikit-learn scorers.
+        for metric in search_params['scoring']:
+            self.assertAlmostEqual(SCORERS[metric](estimator, X, y),
+                                   results["train_" + metric])
+
+        # The total is the time spent in every prediction method.
+        self.assertAlmostEqual(
+            sum(value for key, value in results.items()
+                if key.endswith("_prediction_time") and
+                   key != "train_total_prediction_time"),
+            results["train_total_prediction_time"])
+
         # Validate that the ValueError is raised.
         with self.assertRaises(ValueError):
             bad_grid_search_context = grid_search_context
@@ -264,6 +284,7 @@ class UbergridCoreUnitTest(TestCase):
         # The values will change each time - making sure we can call all the
         # metrics successfully is the goal.
         result_keys_truth = [
+            "train_predict_prediction_time",
             "train_total_prediction_time",
             "train_total_prediction_records",
             "train_f1_micro",
@@ -301,6 +322,7 @@ class UbergridCoreUnitTest(TestCase):
         # of the fields in the result set are present.
 
         result_keys_truth = [
+            "train_predict_prediction_time",
             "train_total_prediction_time",
             "train_total_prediction_records",
             "train_neg_mean_absolute_error",
@@ -345,6 +367,9 @@ class UbergridCoreUnitTest(TestCase):
            "training_log_loss",
            "training_roc_auc",
            "training_average_precision",
+           "training_predict_prediction_time",
+           "training_predict_proba_prediction_time",
+           "training_decision_function_prediction_time",
            "training_total_prediction_time",
            "training_total_prediction_records",
            "training_time_total"
@@ -355,6 +380,78 @@ class UbergridCoreUnitTest(TestCase):
         
         search_param_file.close()
     
+    def test_scoring_sample(self):
+        estimator = joblib.load('classification/classifier.pkl')
+        training_data = read_csv('classification/train.csv')
+        X = training_data[[c for c in training_data.columns if c != 'target']]
+        y = training_data[['target']]
+
+        sample = ug._training_scoring_sample(
+            X, y, {'size': 40, 'random_state': 3, 'stratify': True})
+        self.assertEqual(40, sample['size'])
+        self.assertEqual(3, sample['random_state'])
+        self.assertEqual(
+            sample['rows'].tolist(),
+            ug._training_scoring_sample(
+                X, y, {'size': 40, 'random_state': 3, 'stratify': True})\
+                ['rows'].tolist())
+        
+        grid_search_context = {
+            'metrics': ['accuracy'],
+            'fit_params': {},
+            'X_train': X,
+            'y_train': y,
+            'training_scoring_sample': sample
+        }
+
+        # The training set is scored on the sample.
+        _, results = ug._train_model(estimator, grid_search_context)
+        self.assertEqual(40, results['training_total_prediction_records'])
+
+        # A partition is scored on the sampled rows it contains.
+        rows = np.arange(50)
+        X_sample, y_sample = ug._scoring_sample(
+            X.iloc[rows], y.iloc[rows], rows, grid_search_context)
+        self.assertEqual(
+            sample['rows'][sample['rows'] < 50].tolist(),
+            X_sample.index.tolist())
+        
+        # Without a sample, nothing changes.
+        X_all, _ = ug._scoring_sample(X, y, None, {})
+        self.assertIs(X, X_all)
+
+    def test_benchmark_model(self):
+        training_data = read_csv('classification/train.csv')
+        X_train = \
+            training_data[[c for c in training_data.columns if c != 'target']]
+        y_train = training_data['target']
+        estimator = GradientBoostingClassifier(n_estimators=20)
+        estimator.fit(X_train, y_train)
+
+        grid_search_context = {
+            'X_train': X_train,
+            'y_train': y_train,
+            'validation_file': None,
+            'benchmark': {
+                'batch_sizes': [1, 32, "full"],
+                'warmup': 1,
+                'trials': 5
+            }
+        }
+
+        results = ug._benchmark_model(estimator, grid_search_context)
+        
+        for batch_size in [1, 32, "full"]:
+            prefix = "benchmark_{}".format(batch_size)
+            self.assertTrue(0 <= results[prefix + "_p50_latency"] <=
+                                 results[prefix + "_p95_latency"] <=
+                                 results[prefix + "_p99_latency"])
+            self.assertGreater(results[prefix + "_rows_per_second"], 0)
+        self.assertEqual(12, len(results))
+
+        # No benchmark, no results.
+        self.assertEqual({}, ug._benchmark_model(estimator, {}))
+
     def test_cross_validate(self):
         # Read the stuff we need.
         estimator = joblib.load('classification/classifier.pkl')
@@ -400,6 +497,9 @@ class UbergridCoreUnitTest(TestCase):
             "cross_validation_roc_auc",
             "cross_validation_average_precision",
            
+            "cross_validation_predict_prediction_time",
+            "cross_validation_predict_proba_prediction_time",
+            "cross_validation_decision_function_prediction_time",
             "cross_validation_total_prediction_time",
             "cross_validation_total_prediction_records",
            
@@ -411,6 +511,9 @@ class UbergridCoreUnitTest(TestCase):
             "cross_validation_roc_auc_all",
             "cross_validation_average_precision_all",
            
+            "cross_validation_predict_prediction_time_all",
+            "cross_validation_predict_proba_prediction_time_all",
+            "cross_validation_decision_function_prediction_time_all",
             "cross_validation_total_prediction_time_all",
             "cross_validation_total_prediction_records_all",
            
@@ -422,6 +525,9 @@ class UbergridCoreUnitTest(TestCase):
             "cross_validation_training_roc_auc",
             "cross_validation_training_average_precision",
            
+            "cross_validation_training_predict_prediction_time",
+            "cross_validation_training_predict_proba_prediction_time",
+            "cross_validation_training_decision_function_prediction_time",
             "cross_validation_training_total_prediction_time",
             "cross_validation_training_total_prediction_records",
             "cross_validation_training_time_total",
@@ -434,6 +540,9 @@ class UbergridCoreUnitTest(TestCase):
             "cross_validation_training_roc_auc_all",
             "cross_validation_training_average_precision_all",
            
+            "cross_validation_training_predict_prediction_time_all",
+            "cross_validation_training_predict_proba_prediction_time_all",
+            "cross_validation_training_decision_function_prediction_time_all",
             "cross_validation_training_total_prediction_time_all",
             "cross_validation_training_total_prediction_records_all",
             "cross_validation_training_time_total_all"
@@ -443,6 +552,733 @@ class UbergridCoreUnitTest(TestCase):
             sorted(list(results.keys())),
             sorted(result_keys_truth))
 
+    def test_cross_validate_pruning(self):
+        estimator = joblib.load('classification/classifier.pkl')
+
+        search_param_file = open('classification/search_params.json', 'r')
+        search_params = json.load(search_param_file)
+        search_param_file.close()
+        estimator.set_params(**ParameterGrid(search_params['param_grid'])[0])
+
+        training_data = read_csv('classification/train.csv')
+        X_train = \
+            training_data[[c for c in training_data.columns if c != 'target']]
+        y_train = training_data[['target']]
+
+        grid_search_context = {
+            'cross_validation': 3,
+            'X_train': X_train,
+            'y_train': y_train,
+            'metrics': search_params['scoring'],
+            'fit_params': search_params['fit_params'],
+            'pruning': {
+                'method': 'threshold',
+                'metric': 'accuracy',
+                'threshold': 2.0
+            }
+        }
+
+        # Nothing has an accuracy over 2, so the model is pruned after the
+        # first fold.
+        results = ug._cross_validate(estimator, 0, grid_search_context)
+        self.assertTrue(results['pruned'])
+        self.assertEqual(len(results['cross_validation_accuracy_all']), 1)
+
+        # Everything has an accuracy over -1, so every fold runs.
+        grid_search_context['pruning']['threshold'] = -1.0
+        results = ug._cross_validate(estimator, 0, grid_search_context)
+        self.assertFalse(results['pruned'])
+        self.assertEqual(len(results['cross_validation_accuracy_all']), 3)
+
+        # The median pruner waits for enough completed models.
+        pruning = {'method': 'median', 'metric': 'accuracy', 'min_completed': 2}
+        fold_results = [{'cross_validation_accuracy': 0.5}]
+        self.assertFalse(ug._should_prune(fold_results, [[0.9]], pruning))
+        self.assertTrue(
+            ug._should_prune(fold_results, [[0.9, 0.1], [0.8, 0.2]], pruning))
+        self.assertFalse(
+            ug._should_prune(fold_results, [[0.1, 0.9], [0.2, 0.8]], pruning))
+
+    def test_halving_schedule(self):
+        self.assertEqual(
+            [(27, 10), (9, 30), (3, 90), (1, 270)],
+            ug._halving_schedule(27, {"min_resource": 10}, 1000))
+
+        # Test that the schedule stops when the resource is maxed out.
+        self.assertEqual(
+            [(10, 100), (4, 300), (2, 500)],
+            ug._halving_schedule(10, {"min_resource": 100, "factor": 3}, 500))
+
+    def test_incremental_chains(self):
+        models = list(enumerate(ParameterGrid({
+            "n_estimators": [300, 100, 200],
+            "max_depth": [2, 4, 6]
+        })))
+
+        # Models that only differ in n_estimators are chained, smallest 
+        # first.
+        chains, singles = ug._incremental_chains(
+            GradientBoostingClassifier(), models, "auto", ["accuracy"])
+        self.assertEqual(len(chains), 3)
+        self.assertEqual(singles, [])
+        for chain_mode, chain in chains:
+            self.assertEqual(chain_mode, "warm_start")
+            self.assertEqual([params['n_estimators'] for _, params in chain],
+                             [100, 200, 300])
+
+        # Staged chains, with their estimated training times, are opt in.
+        chains, singles = ug._incremental_chains(
+            GradientBoostingClassifier(), models, "staged", ["accuracy"])
+        self.assertEqual(len(chains), 3)
+        self.assertEqual(singles, [])
+        for chain_mode, chain in chains:
+            self.assertEqual(chain_mode, "staged")
+            self.assertEqual([params['n_estimators'] for _, params in chain],
+                             [100, 200, 300])
+            self.assertEqual(len({params['max_depth'] 
+                                  for _, params in chain}), 1)
+
+        # Nothing is chained when chaining is off, or when the estimator 
+        # can't be warm started along the grid.
+        self.assertEqual(
+            ug._incremental_chains(
+                GradientBoostingClassifier(), models, "none", ["accuracy"]),
+            ([], models))
+        sgd_models = list(enumerate(ParameterGrid({"alpha": [0.1, 0.01]})))
+        self.assertEqual(
+            ug._incremental_chains(
+                SGDRegressor(), sgd_models, "auto", ["r2"]),
+            ([], sgd_models))
+
+        # Regularization paths start from the strongest regularization.
+        path_models = list(enumerate(ParameterGrid({
+            "alpha": [0.01, 1.0, 0.1]
+        })))
+        chains, singles = ug._incremental_chains(
+            Lasso(), path_models, "auto", ["r2"])
+        self.assertEqual(singles, [])
+        self.assertEqual(
+            [(chain_mode, [params['alpha'] for _, params in chain])
+             for chain_mode, chain in chains],
+            [("path", [1.0, 0.1, 0.01])])
+
+    def _run_chains(self, estimator, param_grid, incremental, output_dir):
+        training_file = 'classification/train.csv'
+        training_data = read_csv(training_file)
+        X_train = \
+            training_data[[c for c in training_data.columns if c != 'target']]
+        y_train = training_data[['target']]
+        grid_search_context = {
+            'training_file': training_file,
+            'validation_file': None,
+            'X_train': X_train,
+            'y_train': y_train,
+            'metrics': ['accuracy', 'log_loss'],
+            'fit_params': {},
+            'target_col': 'target',
+            'output_dir': output_dir,
+            'cross_validation': 2
+        }
+        os.mkdir(output_dir)
+
+        models = list(enumerate(ParameterGrid(param_grid)))
+        chains, singles = ug._incremental_chains(
+            estimator, models, incremental, grid_search_context['metrics'])
+        self.assertEqual([], singles)
+        for chain_mode, chain in chains:
+            self.assertEqual(incremental, chain_mode)
+            for run_task, args, kwargs in ug._chain_tasks(
+                estimator, chain, grid_search_context, set(), chain_mode):
+                run_task(*args, **kwargs)
+
+        # Every stage gets its own record, and its saved model is the same
+        # as a model fit from scratch with the same params.
+        model_results = ug._read_model_results(
+            [model_id for model_id, _ in models], grid_search_context)
+        for model_id, params in models:
+            self.assertEqual(model_id, model_results[model_id]['model_id'])
+            self.assertEqual(2, len(
+                model_results[model_id]['cross_validation_accuracy_all']))
+
+            saved_model = joblib.load(model_results[model_id]['model_file'])
+            self.assertEqual(estimator.get_params()['warm_start'],
+                             saved_model.get_params()['warm_start'])
+            cold_model = clone(estimator).set_params(**params)\
+                .fit(X_train, y_train.values.ravel())
+            self.assertTrue(
+                np.allclose(cold_model.predict_proba(X_train),
+                            saved_model.predict_proba(X_train),
+                            atol=1e-4))
+
+        subprocess.run(['rm', '-rf', output_dir])
+
+    def test_warm_start_chain(self):
+        self._run_chains(
+            GradientBoostingClassifier(max_depth=2, random_state=0),
+            {"n_estimators": [10, 20, 30]},
+            "warm_start",
+            TEST_OUTPUT_DIR + "/warm_start_chain")
+
+    def test_path_chain(self):
+        self._run_chains(
+            LogisticRegression(solver="lbfgs", tol=1e-10, max_iter=10000),
+            {"C": [0.01, 0.1, 1.0]},
+            "path",
+            TEST_OUTPUT_DIR + "/path_chain")
+
+    def test_dump_model(self):
+        output_dir = TEST_OUTPUT_DIR + "/dump"
+        os.mkdir(output_dir)
+
+        training_data = read_csv('classification/train.csv')
+        estimator = GradientBoostingClassifier(n_estimators=20)
+        estimator.fit(
+            training_data[[c for c in training_data.columns if c != 'target']],
+            training_data['target'])
+
+        model_file = output_dir + "/model_0.pkl"
+        results = ug._dump_model(estimator, model_file, {})
+        self.assertEqual(os.path.getsize(model_file), 
+                         results["model_file_size"])
+        self.assertFalse(results["model_mmap"])
+        
+        compressed_file = output_dir + "/model_1.pkl"
+        compressed_results = ug._dump_model(
+            estimator, 
+            compressed_file, 
+            {"persistence": {"compress": "zlib", "level": 9}})
+        self.assertLess(compressed_results["model_file_size"],
+                        results["model_file_size"])
+        self.assertEqual(
+            20, joblib.load(compressed_file).get_params()['n_estimators'])
+
+        # Compression levels outside 0 to 9 are rejected before anything is
+        # trained.
+        for level in [-1, 12, 3.5, True]:
+            with self.assertRaises(ValueError):
+                ug._validate_persistence(
+                    {"persistence": {"compress": "zlib", "level": level}},
+                    "search_params.json")
+
+        subprocess.run(['rm', '-rf', output_dir])
+
+    def test_fit_estimator_transformer_cache(self):
+        cache_dir = TEST_OUTPUT_DIR + "/transformer_cache"
+        os.mkdir(cache_dir)
+
+        try:
+            training_data = read_csv('classification/train.csv')
+            X = training_data[
+                [c for c in training_data.columns if c != 'target']]
+            y = training_data['target']
+            grid_search_context = {
+                'fit_params': {},
+                'transformer_cache': {
+                    'dir': cache_dir,
+                    'max_bytes': 2**30,
+                    'fingerprint': "classification/train.csv"
+                }
+            }
+
+            pipeline = Pipeline([("scaler", StandardScaler()),
+                                 ("estimator", LogisticRegression())])
+            # Two disjoint halves of the training set.
+            half = X.shape[0] // 2
+            rows = np.arange(half)
+            other_rows = np.arange(half, 2 * half)
+
+            # The first fit fills the cache, the second only fits the final
+            # step.
+            first = clone(pipeline).set_params(estimator__C=1.0)
+            ug._fit_estimator(
+                first, X.iloc[rows], y.iloc[rows], rows, grid_search_context)
+            cache_files = \
+                [f for f in os.listdir(cache_dir) if f.endswith(".pkl")]
+            self.assertEqual(1, len(cache_files))
+
+            second = clone(pipeline).set_params(estimator__C=0.1)
+            ug._fit_estimator(
+                second, X.iloc[rows], y.iloc[rows], rows, grid_search_context)
+            self.assertEqual(
+                cache_files, 
+                [f for f in os.listdir(cache_dir) if f.endswith(".pkl")])
+            self.assertTrue(
+                np.allclose(first.named_steps['scaler'].mean_,
+                            second.named_steps['scaler'].mean_))
+            self.assertEqual(0.1, second.named_steps['estimator'].C)
+            self.assertTrue(
+                np.allclose(
+                    clone(pipeline).set_params(estimator__C=0.1)\
+                        .fit(X.iloc[rows], y.iloc[rows]).predict_proba(X),
+                    second.predict_proba(X)))
+
+            # Different rows or upstream params are new entries, and the least
+            # recently used entries are evicted past the size limit.
+            ug._fit_estimator(clone(pipeline), 
+                              X.iloc[other_rows], 
+                              y.iloc[other_rows], 
+                              other_rows, 
+                              {**grid_search_context,
+                               'transformer_cache': {
+                                   **grid_search_context['transformer_cache'],
+                                   'max_bytes': 1
+                               }})
+            remaining_files = \
+                [f for f in os.listdir(cache_dir) if f.endswith(".pkl")]
+            self.assertEqual(1, len(remaining_files))
+            self.assertNotEqual(cache_files, remaining_files)
+        finally:
+            subprocess.run(['rm', '-rf', cache_dir])
+
+    def test_folds(self):
+        output_dir = TEST_OUTPUT_DIR + "/folds"
+        os.mkdir(output_dir)
+
+        try:
+            training_file = 'classification/train.csv'
+            training_data = read_csv(training_file)
+            X_train = training_data[
+                [c for c in training_data.columns if c != 'target']]
+            y_train = training_data[['target']]
+            num_rows = len(X_train)
+            grid_search_context = {
+                'output_dir': output_dir,
+                'training_file': training_file,
+                'target_col': 'target',
+                'cross_validation': 3,
+                'X_train': X_train,
+                'y_train': y_train,
+                'fold_cache': 3
+            }
+            cv = {'splitter': "stratified", 'shuffle': True, 'random_state': 7}
+
+            folds_file = ug._write_folds(grid_search_context, cv)
+            self.assertEqual(ug._folds_file(output_dir), folds_file)
+            grid_search_context['folds'] = folds_file
+
+            # The test sets partition the training set, and each fold keeps the
+            # class balance.
+            test_rows = []
+            for fold in range(3):
+                cv_train, cv_test = ug._fold_indices(grid_search_context, fold)
+                self.assertEqual(0, len(np.intersect1d(cv_train, cv_test)))
+                self.assertEqual(num_rows, len(cv_train) + len(cv_test))
+                self.assertLessEqual(
+                    abs(y_train.iloc[cv_test, 0].mean() - 
+                        y_train.iloc[:, 0].mean()), 0.05)
+                test_rows.extend(cv_test)
+            self.assertEqual(list(range(num_rows)), sorted(test_rows))
+
+            # The same settings reuse the file, so shuffled folds don't change
+            # when a search resumes.
+            folds_mtime = os.stat(folds_file).st_mtime_ns
+            ug._write_folds(grid_search_context, cv)
+            self.assertEqual(folds_mtime, os.stat(folds_file).st_mtime_ns)
+
+            # The partitions of a fold are only materialized once.
+            fold_frames = ug._fold_frames(grid_search_context, 0)
+            self.assertIs(fold_frames, ug._fold_frames(grid_search_context, 0))
+            self.assertTrue(
+                X_train.iloc[fold_frames[0]].equals(fold_frames[1]))
+
+            # Training on a subset of the rows keeps them in their folds.
+            training_rows = np.arange(0, num_rows, 2)
+            subset_train, subset_test = ug._fold_indices(
+                {**grid_search_context, 'training_rows': training_rows}, 0)
+            self.assertEqual(
+                len(training_rows), len(subset_train) + len(subset_test))
+            self.assertTrue(
+                np.in1d(training_rows[subset_test], 
+                        ug._fold_indices(grid_search_context, 0)[1]).all())
+        
+            # Only the last fold_cache folds are kept.
+            ug._FOLD_FRAMES.clear()
+            for fold in range(3):
+                ug._fold_frames(grid_search_context, fold)
+            self.assertEqual(3, len(ug._FOLD_FRAMES))
+            ug._fold_frames({**grid_search_context, 'fold_cache': 1}, 0)
+            self.assertEqual(1, len(ug._FOLD_FRAMES))
+
+            # Group folds take the groups separately from the features.
+            groups = np.arange(num_rows) % 10
+            os.mkdir(output_dir + "/groups")
+            group_folds_file = ug._write_folds(
+                {**grid_search_context, 'output_dir': output_dir + "/groups"},
+                {'splitter': "group", 'groups': "group"},
+                groups)
+            for fold in range(3):
+                cv_train, cv_test = ug._fold_indices(
+                    {**grid_search_context, 'folds': group_folds_file}, fold)
+                self.assertEqual(
+                    0, len(np.intersect1d(groups[cv_train], groups[cv_test])))
+        finally:
+            ug._FOLD_FRAMES.clear()
+            subprocess.run(['rm', '-rf', output_dir])
+
+    def test_evaluate_stages(self):
+        training_data = read_csv('classification/train.csv')
+        X_train = \
+            training_data[[c for c in training_data.columns if c != 'target']]
+        y_train = training_data[['target']]
+        grid_search_context = {
+            'metrics': ["accuracy", "log_loss", "roc_auc"]
+        }
+
+        estimator = GradientBoostingClassifier(n_estimators=20, random_state=0)
+        estimator.fit(X_train, y_train)
+        # Staged chains are opt-in, so "auto" warm starts instead.
+        self.assertEqual(ug._chain_mode(estimator, "auto", ["roc_auc"]), 
+                         "warm_start")
+        self.assertEqual(ug._chain_mode(estimator, "staged", ["roc_auc"]), 
+                         "staged")
+
+        stage_results = ug._evaluate_stages(
+            estimator, X_train, y_train, [10, 20], grid_search_context, "cv")
+        
+        # The staged scores are the scores of a model fit with that many
+        # estimators, which is the same as the truncated ensemble.
+        small_estimator = \
+            GradientBoostingClassifier(n_estimators=10, random_state=0)
+        small_estimator.fit(X_train, y_train)
+        for stage, stage_estimator in [
+            (10, small_estimator), 
+            (10, ug._truncate_ensemble(estimator, 10)),
+            (20, estimator)]:
+            truth = ug._evaluate_model(stage_estimator, 
+                                       X_train, 
+                                       y_train, 
+                                       grid_search_context, 
+                                       "cv")
+            for metric in grid_search_context['metrics']:
+                self.assertAlmostEqual(stage_results[stage]["cv_" + metric],
+                                       truth["cv_" + metric])
+            self.assertEqual(sorted(stage_results[stage].keys()),
+                             sorted(truth.keys()))
+
+    def test_main_bayesian(self):
+        output_dir = TEST_OUTPUT_DIR + "/bayesian"
+        search_params = {
+            "param_distributions": {
+                "n_estimators": {
+                    "distribution": "randint", "low": 10, "high": 30
+                },
+                "max_depth": [2, 3]
+            },
+            "n_iter": 4,
+            "scoring": ["roc_auc"],
+            "estimator": CLASSIFICATION_DIR + "/classifier.pkl",
+            "search": "bayesian",
+            "bayesian": {
+                "n_initial_points": 2
+            }
+        }
+        search_params_file = CLASSIFICATION_DIR + "/bayesian_params.json"
+        with open(search_params_file, "w") as out:
+            out.write(json.dumps(search_params) + "\n")
+
+        ug._main(search_params_file,
+                 "target",
+                 CLASSIFICATION_DIR + "/train.csv",
+                 output_dir,
+                 validation_file = CLASSIFICATION_DIR + "/test.csv")
+
+        results = [json.loads(l) for l 
+                   in open(output_dir + "/results.json", "r").readlines()]
+        self.assertEqual(4, len(results))
+        for result in results:
+            self.assertTrue(10 <= result["n_estimators"] < 30)
+            self.assertIn(result["max_depth"], [2, 3])
+        
+        suggestions = ug._read_suggestions(output_dir)
+        self.assertEqual([0, 1, 2, 3], sorted(suggestions.keys()))
+        
+        # Test that a restart with a bigger budget rebuilds the surrogate from
+        # the completed models and only trains the new ones.
+        search_params["n_iter"] = 5
+        with open(search_params_file, "w") as out:
+            out.write(json.dumps(search_params) + "\n")
+        
+
+        ug._main(search_params_file,
+                 "target",
+                 CLASSIFICATION_DIR + "/train.csv",
+                 output_dir,
+                 validation_file = CLASSIFICATION_DIR + "/test.csv")
+
+        results = [json.loads(l) for l 
+                   in open(output_dir + "/results.json", "r").readlines()]
+        self.assertEqual(5, len(results))
+        self.assertEqual([0, 1, 2, 3, 4],
+                         sorted(ug._read_suggestions(output_dir).keys()))
+
+        # A search without any iterations has no best model.
+        search_params["n_iter"] = 0
+        with open(search_params_file, "w") as out:
+            out.write(json.dumps(search_params) + "\n")
+        with self.assertRaises(ValueError):
+            ug._main(search_params_file,
+                     "target",
+                     CLASSIFICATION_DIR + "/train.csv",
+                     output_dir + "_empty",
+                     validation_file = CLASSIFICATION_DIR + "/test.csv")
+
+    def test_expected_improvement(self):
+        mean = np.array([0.5, 0.7, 0.9, 0.9])
+        std = np.array([0.1, 0.1, 0.1, 0.0])
+        expected_improvement = \
+            ug._expected_improvement(mean, std, 0.8, 0.0)
+
+        # Higher means improve more, and certain points can't improve.
+        self.assertTrue(expected_improvement[0] < expected_improvement[1])
+        self.assertTrue(expected_improvement[1] < expected_improvement[2])
+        self.assertEqual(0.0, expected_improvement[3])
+
+    def test_main_halving(self):
+        output_dir = TEST_OUTPUT_DIR + "/halving"
+        search_params = {
+            "param_grid": {
+                "max_depth": [2, 4, 6]
+            },
+            "scoring": ["accuracy", "roc_auc"],
+            "estimator": CLASSIFICATION_DIR + "/classifier.pkl",
+            "search": "halving",
+            "halving": {
+                "resource": "n_estimators",
+                "min_resource": 10,
+                "max_resource": 30,
+                "metric": "roc_auc"
+            }
+        }
+        search_params_file = CLASSIFICATION_DIR + "/halving_params.json"
+        with open(search_params_file, "w") as out:
+            out.write(json.dumps(search_params) + "\n")
+
+        ug._main(search_params_file,
+                 "target",
+                 CLASSIFICATION_DIR + "/train.csv",
+                 output_dir,
+                 cross_validation = 3)
+
+        results = [json.loads(l) for l 
+                   in open(output_dir + "/results.json", "r").readlines()]
+        
+        # Three candidates on the first rung, one on the second.
+        self.assertEqual(4, len(results))
+        rung_0 = [r for r in results if r["rung"] == 0]
+        rung_1 = [r for r in results if r["rung"] == 1]
+        self.assertEqual(3, len(rung_0))
+        self.assertEqual(1, len(rung_1))
+        self.assertTrue(all(r["n_estimators"] == 10 for r in rung_0))
+        self.assertEqual(30, rung_1[0]["n_estimators"])
+        
+        # The candidate promoted is the best one on the first rung.
+        best = max(rung_0, key=lambda r: r["cross_validation_roc_auc"])
+        self.assertEqual(best["candidate_id"], rung_1[0]["candidate_id"])
+        self.assertEqual(best["max_depth"], rung_1[0]["max_depth"])
+
+        # Test that the resource can't be in the grid.
+        with self.assertRaises(ValueError):
+            search_params["param_grid"]["n_estimators"] = [10, 20]
+            with open(search_params_file, "w") as out:
+                out.write(json.dumps(search_params) + "\n")
+            ug._main(search_params_file,
+                     "target",
+                     CLASSIFICATION_DIR + "/train.csv",
+                     output_dir)
+
+    def test_read_csv_chunked(self):
+        csv_file = TEST_OUTPUT_DIR + "/chunked.csv"
+        frame = DataFrame({
+            "small_int": [1, 2, 3, 4, 5, 6, 7],
+            "half": [0.5, 1.5, 2.5, 3.5, 4.5, 5.5, 6.5],
+            "color": ["red", "blue", "red", "red", "blue", "red", "green"],
+            "target": ["a", "b", "c", "d", "e", "f", "g"]
+        })[["small_int", "half", "color", "target"]]
+        frame.to_csv(csv_file, index=False)
+
+        schema = ug._infer_schema(csv_file, "target")
+        self.assertEqual(
+            [["small_int", "integer"], 
+             ["half", "float"], 
+             ["color", "category"], 
+             ["target", "object"]],
+            schema)
+
+        # Read it in chunks smaller than the file.
+        chunk_size = ug.CSV_CHUNK_SIZE
+        ug.CSV_CHUNK_SIZE = 3
+        chunked = ug._read_csv_chunked(csv_file, schema)
+        ug.CSV_CHUNK_SIZE = chunk_size
+
+        self.assertEqual(list(frame.columns), list(chunked.columns))
+        self.assertEqual(np.int8, chunked.small_int.dtype)
+        self.assertEqual(np.float32, chunked.half.dtype)
+        self.assertEqual("category", chunked.color.dtype.name)
+        self.assertEqual(list(frame.color), list(chunked.color))
+        self.assertEqual(list(frame.half), list(chunked.half))
+        self.assertEqual(list(frame.small_int), list(chunked.small_int))
+
+        os.remove(csv_file)
+
+    def test_read_input(self):
+        training_data = read_csv('classification/train.csv')
+        npz_file = TEST_OUTPUT_DIR + "/train.npz"
+        np.savez(npz_file, **{column: training_data[column].values
+                              for column in training_data.columns})
+
+        self.assertEqual("npz", ug._file_format(npz_file))
+        self.assertEqual("csv", ug._file_format('classification/train.csv'))
+        self.assertEqual("parquet", ug._file_format("train.parquet"))
+        self.assertEqual("feather", ug._file_format("train.feather"))
+
+        self.assertEqual(sorted(training_data.columns),
+                         sorted(ug._read_columns(npz_file)))
+
+        # Test that the columns are read in the order they're asked for.
+        columns = list(training_data.columns)
+        npz_data = ug._read_input(npz_file, None, "target", columns)
+        self.assertEqual(columns, list(npz_data.columns))
+        self.assertTrue((training_data.values == npz_data.values).all())
+
+        # Test that only the requested columns are read.
+        npz_subset = ug._read_input(npz_file, None, "target", ["target"])
+        self.assertEqual(["target"], list(npz_subset.columns))
+
+        os.remove(npz_file)
+
+    def test_run_fold_and_final(self):
+        # Read the stuff we need.
+        search_param_file = open('classification/search_params.json', 'r')
+        search_params = json.load(search_param_file)
+        search_param_file.close()
+        params = ParameterGrid(search_params['param_grid'])[0]
+
+        model_id = 0
+
+        training_file = 'classification/train.csv'
+        training_data = read_csv(training_file)
+        X_train = \
+            training_data[[c for c in training_data.columns if c != 'target']]
+        y_train = training_data[['target']]
+
+        output_dir = TEST_OUTPUT_DIR + "/tasks"
+        os.mkdir(output_dir)
+
+        grid_search_context = {
+            'training_file': training_file,
+            'validation_file': None,
+            'X_train': X_train,
+            'y_train': y_train,
+            'metrics': search_params['scoring'],
+            'fit_params': search_params['fit_params'],
+            'target_col': 'target',
+            'output_dir': output_dir,
+            'cross_validation': 3
+        }
+
+        # Run the tasks out of order. The results are only written once the
+        # last of them completes.
+        for fold in [2, 0]:
+            ug._run_fold(joblib.load('classification/classifier.pkl'),
+                         params,
+                         model_id,
+                         fold,
+                         grid_search_context)
+        ug._run_final(joblib.load('classification/classifier.pkl'),
+                      params,
+                      model_id,
+                      grid_search_context)
+        
+        self.assertFalse(ug._model_completed(model_id, grid_search_context))
+
+        ug._run_fold(joblib.load('classification/classifier.pkl'),
+                     params,
+                     model_id,
+                     1,
+                     grid_search_context)
+
+        self.assertTrue(ug._model_completed(model_id, grid_search_context))
+        self.assertTrue(
+            os.path.exists("{}/model_{}.pkl".format(output_dir, model_id)))
+        
+        # The intermediate part files should be cleaned up.
+        self.assertEqual([],
+            [f for f in os.listdir(output_dir) if f.startswith("part_")])
+
+        results = ug._read_model_results(
+            [model_id], grid_search_context)[model_id]
+        
+        self.assertEqual(3, len(results["cross_validation_accuracy_all"]))
+        self.assertEqual(model_id, results["model_id"])
+
+    def test_sample_candidates(self):
+        search_params = {
+            "param_distributions": {
+                "learning_rate": {
+                    "distribution": "loguniform", "low": 0.01, "high": 1.0
+                },
+                "max_depth": {
+                    "distribution": "randint", "low": 2, "high": 8
+                },
+                "loss": ["deviance", "exponential"]
+            },
+            "n_iter": 16
+        }
+
+        for sampler in ["random", "lhs", "sobol"]:
+            search_params["sampler"] = sampler
+            candidates = ug._sample_candidates(search_params)
+            
+            self.assertEqual(16, len(candidates))
+            for candidate in candidates:
+                self.assertTrue(0.01 <= candidate["learning_rate"] <= 1.0)
+                self.assertTrue(2 <= candidate["max_depth"] < 8)
+                self.assertIsInstance(candidate["max_depth"], int)
+                self.assertIn(candidate["loss"], ["deviance", "exponential"])
+
+            # The same seed gives the same candidates, so model ids are 
+            # stable when a search is resumed.
+            self.assertEqual(candidates, ug._sample_candidates(search_params))
+
+        # Sobol samples put one point in each of the 16 strata of every
+        # dimension, and the first ones don't change when n_iter is raised.
+        sobol_samples = ug._unit_samples("sobol", 16, 5, 0)
+        for dim in range(5):
+            self.assertEqual(list(range(16)), 
+                             sorted((sobol_samples[:, dim] * 16).astype(int)))
+        self.assertTrue(
+            np.array_equal(sobol_samples, 
+                           ug._unit_samples("sobol", 32, 5, 0)[:16]))
+        with self.assertRaises(ValueError):
+            ug._unit_samples("sobol", 16, len(ug.SOBOL_DIRECTIONS) + 2, 0)
+
+        # Test that unknown distributions raise a ValueError.
+        with self.assertRaises(ValueError):
+            ug._sample_candidates({
+                "param_distributions": {
+                    "max_depth": {"distribution": "nope"}
+                },
+                "n_iter": 2
+            })
+
+    def test_scan_output_dir(self):
+        output_dir = TEST_OUTPUT_DIR + "/scan"
+        os.mkdir(output_dir)
+
+        for file_name in ["model_3.pkl", 
+                          "part_4_fold_1.json",
+                          "part_4_final.json"]:
+            open(output_dir + "/" + file_name, 'w').close()
+        with open(output_dir + "/results.json", 'w') as results_out:
+            results_out.write(json.dumps({"model_id": 3}) + "\n")
+
+        completed_models, completed_parts = ug._scan_output_dir(output_dir)
+
+        self.assertEqual({3}, completed_models)
+        self.assertEqual({(4, "fold_1"), (4, "final")}, completed_parts)
+
+        subprocess.run(['rm', '-rf', output_dir])
+
     def test_train_and_evaluate(self):
         # Read the stuff we need.
         estimator = joblib.load('classification/classifier.pkl')
@@ -502,9 +1338,15 @@ class UbergridCoreUnitTest(TestCase):
            "training_roc_auc",
            "training_average_precision",
            
+           "training_predict_prediction_time",
+           "training_predict_proba_prediction_time",
+           "training_decision_function_prediction_time",
            "training_total_prediction_time",
            "training_total_prediction_records",
            "training_time_total",
+           "model_file_size",
+           "model_serialization_time",
+           "model_mmap",
            
            "validation_accuracy",
            "validation_f1",
@@ -514,6 +1356,9 @@ class UbergridCoreUnitTest(TestCase):
            "validation_roc_auc",
            
            "validation_average_precision",
+           "validation_predict_prediction_time",
+           "validation_predict_proba_prediction_time",
+           "validation_decision_function_prediction_time",
            "validation_total_prediction_time",
            "validation_total_prediction_records",
            
@@ -525,6 +1370,9 @@ class UbergridCoreUnitTest(TestCase):
            "cross_validation_roc_auc",
            "cross_validation_average_precision",
            
+           "cross_validation_predict_prediction_time",
+           "cross_validation_predict_proba_prediction_time",
+           "cross_validation_decision_function_prediction_time",
            "cross_validation_total_prediction_time",
            "cross_validation_total_prediction_records",
            
@@ -536,6 +1384,9 @@ class UbergridCoreUnitTest(TestCase):
            "cross_validation_roc_auc_all",
            "cross_validation_average_precision_all",
            
+           "cross_validation_predict_prediction_time_all",
+           "cross_validation_predict_proba_prediction_time_all",
+           "cross_validation_decision_function_prediction_time_all",
            "cross_validation_total_prediction_time_all",
            "cross_validation_total_prediction_records_all",
            
@@ -547,6 +1398,9 @@ class UbergridCoreUnitTest(TestCase):
            "cross_validation_training_roc_auc",
            "cross_validation_training_average_precision",
            
+           "cross_validation_training_predict_prediction_time",
+           "cross_validation_training_predict_proba_prediction_time",
+           "cross_validation_training_decision_function_prediction_time",
            "cross_validation_training_total_prediction_time",
            "cross_validation_training_total_prediction_records",
            "cross_validation_training_time_total",
@@ -559,6 +1413,9 @@ class UbergridCoreUnitTest(TestCase):
            "cross_validation_training_roc_auc_all",
            "cross_validation_training_average_precision_all",
            
+           "cross_validation_training_predict_prediction_time_all",
+           "cross_validation_training_predict_proba_prediction_time_all",
+           "cross_validation_training_decision_function_prediction_time_all",
            "cross_validation_training_total_prediction_time_all",
            "cross_validation_training_total_prediction_records_all",
            "cross_validation_training_time_total_all",
@@ -576,13 +1433,12 @@ class UbergridCoreUnitTest(TestCase):
         self.assertTrue(
             os.path.exists("{}/model_{}.pkl".format(output_dir, model_id)))
 
-        # Check that the results file exists.
-        self.assertTrue(
-            os.path.exists("{}/results_{}.json".format(output_dir, model_id)))
+        # Check that the results were written.
+        self.assertTrue(ug._model_completed(model_id, grid_search_context))
         
-        # Read in the results file.
-        result_file = open("{}/results_{}.json".format(output_dir, model_id))
-        results = json.load(result_file)
+        # Read in the results.
+        results = ug._read_model_results(
+            [model_id], grid_search_context)[model_id]
 
         self.assertEqual(
             sorted(list(results.keys())),
@@ -604,9 +1460,35 @@ class UbergridCoreUnitTest(TestCase):
 
         # Cleanup.
         search_param_file.close()
-        result_file.close()
         pass
 
+    def test_frame_store(self):
+        training_data = read_csv('classification/train.csv')
+        X_train = \
+            training_data[[c for c in training_data.columns if c != 'target']]
+        y_train = training_data[['target']].astype(int)
+
+        store_dir = TEST_OUTPUT_DIR + "/store"
+        os.mkdir(store_dir)
+
+        grid_search_context = {
+            'X_train': ug._write_frame_store(X_train, store_dir, 'X_train'),
+            'y_train': ug._write_frame_store(y_train, store_dir, 'y_train')
+        }
+
+        # Test that the frames come back out of the store unchanged.
+        X_stored = ug._get_frame(grid_search_context, 'X_train')
+        y_stored = ug._get_frame(grid_search_context, 'y_train')
+
+        self.assertEqual(list(X_train.columns), list(X_stored.columns))
+        self.assertTrue((X_train.values == X_stored.values).all())
+        self.assertTrue((y_train.values == y_stored.values).all())
+
+        # Test that frames passed directly are returned as they are.
+        self.assertIs(X_train, ug._get_frame({'X_train': X_train}, 'X_train'))
+
+        subprocess.run(['rm', '-rf', store_dir])
+
     def test_main(self):
         # Set up the inputs. Thankfully this is a little simpler than the other
         # methods.
@@ -642,9 +1524,15 @@ class UbergridCoreUnitTest(TestCase):
            "training_log_loss",
            "training_roc_auc",
            "training_average_precision",
+           "training_predict_prediction_time",
+           "training_predict_proba_prediction_time",
+           "training_decision_function_prediction_time",
            "training_total_prediction_time",
            "training_total_prediction_records",
            "training_time_total",
+           "model_file_size",
+           "model_serialization_time",
+           "model_mmap",
            "validation_accuracy",
            "validation_f1",
            "validation_precision",
@@ -652,6 +1540,9 @@ class UbergridCoreUnitTest(TestCase):
            "validation_log_loss",
            "validation_roc_auc",
            "validation_average_precision",
+           "validation_predict_prediction_time",
+           "validation_predict_proba_prediction_time",
+           "validation_decision_function_prediction_time",
            "validation_total_prediction_time",
            "validation_total_prediction_records",
            "training_file",
@@ -700,13 +1591,19 @@ class UbergridCoreUnitTest(TestCase):
             self.assertEqual(result["model_id"], model_id)
         
         # Test that the _main function raises a ValueError when the validation
-        # set has different columns.
-        with self.assertRaises(ValueError):
-            ug._main(search_params_file,
-                     target_col,
-                     training_file,
-                     output_dir,
-                     validation_file = MULTICLASS_DIR + "/test.csv")
+        # set has different columns. The columns are checked before anything
+        # is trained, so a resumed run rejects them too.
+        other_validation_file = CLASSIFICATION_DIR + "/other_test.csv"
+        read_csv(validation_file)\
+            .rename(columns={"feature_0": "other_feature"})\
+            .to_csv(other_validation_file, index=False)
+        for columns_output_dir in [TEST_OUTPUT_DIR + "/columns", output_dir]:
+            with self.assertRaises(ValueError):
+                ug._main(search_params_file,
+                         target_col,
+                         training_file,
+                         columns_output_dir,
+                         validation_file = other_validation_file)
 
         # Test that the _main function raises a ValueError when the 
         # search_params_file doesn't exist.
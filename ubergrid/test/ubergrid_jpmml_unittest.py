@@ -128,6 +128,29 @@ class UbergridJPMMLUnitTest(TestCase):
 
         subprocess.run(["rm", "-rf", "output.csv"])
 
+    def test_pmml_current(self) -> None:
+        """ Tests that a PMML file is only up to date if it was written after
+            its model.
+        """
+        model_file = TEST_OUTPUT_DIR + "/model_current.pkl"
+        pmml_file = ugp._pmml_file(model_file)
+        open(model_file, 'w').close()
+
+        # There's no PMML file yet.
+        self.assertFalse(ugp._pmml_current(model_file))
+
+        open(pmml_file, 'w').close()
+        os.utime(model_file, (1000, 1000))
+        os.utime(pmml_file, (2000, 2000))
+        self.assertTrue(ugp._pmml_current(model_file))
+
+        # The model was refit after the PMML file was written.
+        os.utime(model_file, (3000, 3000))
+        self.assertFalse(ugp._pmml_current(model_file))
+
+        os.remove(model_file)
+        os.remove(pmml_file)
+
     def test_time_pmml(self) -> None:
         """ Tests that the _time_pmml function returns the correct values.
         """
@@ -148,13 +171,75 @@ class UbergridJPMMLUnitTest(TestCase):
         pmml_timing_truth_keys = set(
             [
                 "pmml_total_prediction_time",
-                "pmml_total_prediction_records"
+                "pmml_total_prediction_records",
+                "pmml_records_per_second",
+                "pmml_load_time",
+                "pmml_timing_mode"
             ])
         
         self.assertEqual(
             pmml_timing_truth_keys, set(pmml_timing_results.keys()))
         self.assertEqual(
             100, pmml_timing_results['pmml_total_prediction_records'])
+        self.assertEqual(
+            "subprocess", pmml_timing_results['pmml_timing_mode'])
+        # The scratch output is removed.
+        self.assertFalse(os.path.exists(ugp._output_file(pmml_file)))
+
+    def test_time_pmml_session(self) -> None:
+        """ Tests that the evaluator session times models without restarting
+            the JVM.
+        """
+        model_results_file = TEST_OUTPUT_DIR + '/results.json'
+        fin = open(model_results_file, 'r')
+        model_results_all = [json.loads(l) for l in fin]
+        fin.close()
+
+        pmml_files = [ugp._make_pmml(m) for m in model_results_all[:2]]
+
+        work_dir = TEST_OUTPUT_DIR + "/evaluator"
+        os.mkdir(work_dir)
+        evaluator = ugp._start_evaluator(PMML_EVALUATOR, work_dir)
+        self.assertIsNotNone(evaluator)
+
+        for pmml_file in pmml_files:
+            pmml_timing_results = \
+                ugp._time_pmml_session(evaluator,
+                                       pmml_file,
+                                       TEST_INPUT_DIR + '/train.csv',
+                                       warmup=1,
+                                       repeats=2)
+            self.assertEqual(
+                100, pmml_timing_results['pmml_total_prediction_records'])
+            self.assertEqual(
+                "session", pmml_timing_results['pmml_timing_mode'])
+            self.assertGreater(pmml_timing_results['pmml_load_time'], 0)
+            self.assertGreater(
+                pmml_timing_results['pmml_records_per_second'], 0)
+            self.assertFalse(os.path.exists(ugp._output_file(pmml_file)))
+
+        # Quoted fields and CRLF line endings are read as plain csv.
+        quoted_file = work_dir + "/quoted.csv"
+        with open(TEST_INPUT_DIR + '/train.csv', 'r') as train_in, \
+             open(quoted_file, 'w', newline='') as quoted_out:
+            for line in train_in:
+                quoted_out.write(
+                    ",".join('"{}"'.format(f) 
+                             for f in line.strip().split(",")) + "\r\n")
+        pmml_timing_results = \
+            ugp._time_pmml_session(evaluator, pmml_files[0], quoted_file)
+        self.assertEqual(
+            100, pmml_timing_results['pmml_total_prediction_records'])
+        
+        # A model that can't be loaded doesn't end the session.
+        self.assertIsNone(
+            ugp._time_pmml_session(evaluator,
+                                   "not/a/file.pmml",
+                                   TEST_INPUT_DIR + '/train.csv'))
+        self.assertIsNone(evaluator.poll())
+
+        ugp._stop_evaluator(evaluator)
+        subprocess.run(["rm", "-rf", work_dir])
 
     def test_main(self) -> None:
 
@@ -166,6 +251,9 @@ class UbergridJPMMLUnitTest(TestCase):
             [
                 "pmml_total_prediction_time",
                 "pmml_total_prediction_records",
+                "pmml_records_per_second",
+                "pmml_load_time",
+                "pmml_timing_mode",
                 "pmml_file",
 
                 "training_file",
@@ -178,9 +266,15 @@ class UbergridJPMMLUnitTest(TestCase):
                 "training_accuracy",
                 "training_log_loss",
                 "training_roc_auc",
+                "training_predict_prediction_time",
+                "training_predict_proba_prediction_time",
+                "training_decision_function_prediction_time",
                 "training_total_prediction_time",
                 "training_total_prediction_records",
-                "training_time_total"
+                "training_time_total",
+                "model_file_size",
+                "model_serialization_time",
+                "model_mmap"
             ])
         
         results = open(TEST_OUTPUT_DIR + '/results.json', 'r')
@@ -238,4 +332,9 @@ class UbergridJPMMLUnitTest(TestCase):
         with self.assertRaises(ValueError):
             ugp._main(TEST_OUTPUT_DIR,
                       pmml_evaluator = PMML_EVALUATOR,
-                      file_to_evaluate = "not/a/file")
\ No newline at end of file
+                      file_to_evaluate = "not/a/file")
+        with self.assertRaises(ValueError):
+            ugp._main(TEST_OUTPUT_DIR,
+                      pmml_evaluator = PMML_EVALUATOR,
+                      file_to_evaluate = TEST_INPUT_DIR + "/train.csv",
+                      repeats = 0)
\ No newline at end of file
@@ -97,24 +97,32 @@ class UbergridUnitTest(TestCase):
             "target",
             "n_estimators",
             "training_time_total",
+            "model_file_size",
+            "model_serialization_time",
+            "model_mmap",
+            "training_predict_prediction_time",
             "training_total_prediction_time",
             "training_total_prediction_records",
             "training_accuracy",
             
             "cross_validation_accuracy",
+            "cross_validation_predict_prediction_time",
             "cross_validation_total_prediction_time",
             "cross_validation_total_prediction_records",
 
             "cross_validation_accuracy_all",
+            "cross_validation_predict_prediction_time_all",
             "cross_validation_total_prediction_time_all",
             "cross_validation_total_prediction_records_all",
 
             "cross_validation_training_accuracy",
+            "cross_validation_training_predict_prediction_time",
             "cross_validation_training_total_prediction_time",
             "cross_validation_training_total_prediction_records",
             "cross_validation_training_time_total",
             
             "cross_validation_training_accuracy_all",
+            "cross_validation_training_predict_prediction_time_all",
             "cross_validation_training_total_prediction_time_all",
             "cross_validation_training_total_prediction_records_all",
             "cross_validation_training_time_total_all"
@@ -124,6 +132,57 @@ class UbergridUnitTest(TestCase):
         for result in results:
             self.assertEqual(true_results_keys, set(result.keys()))
 
+    def test_results_db(self):
+        self.assertTrue(os.path.exists(TEST_OUTPUT_DIR + "/results.db"))
+
+        with open(TEST_OUTPUT_DIR + "/results.json", "r") as results_in:
+            json_results = [json.loads(l) for l in results_in]
+        
+        # The database holds the same records as results.json.
+        connection = ug._results_connection(TEST_OUTPUT_DIR)
+        self.assertIsNotNone(connection)
+        self.assertEqual(
+            [json_results[0]],
+            ug._query_results(
+                connection, {"n_estimators": json_results[0]["n_estimators"]}))
+        connection.close()
+
+        with self.assertRaises(ValueError):
+            ug._results_connection("not/a/dir")
+
+        self.assertEqual(
+            sorted(json_results, key=lambda r: r["model_id"]),
+            ug.read_results(TEST_OUTPUT_DIR))
+
+    def test_results_db_replaced_log(self):
+        results_file = TEST_OUTPUT_DIR + "/results.json"
+        with open(results_file, "r") as results_in:
+            original_lines = results_in.readlines()
+
+        # Replace the log with a rewrite of the same size, the way the jpmml
+        # command does. The database is rebuilt rather than kept.
+        rewritten = json.loads(original_lines[0])
+        rewritten["target"] = rewritten["target"].upper()
+        tmp_file = results_file + ".tmp"
+        with open(tmp_file, "w") as results_out:
+            results_out.write(json.dumps(rewritten) + "\n")
+            results_out.writelines(original_lines[1:])
+        os.replace(tmp_file, results_file)
+        ugc._sync_results(TEST_OUTPUT_DIR)
+
+        connection = ug._results_connection(TEST_OUTPUT_DIR)
+        self.assertIsNotNone(connection)
+        self.assertEqual(
+            [rewritten],
+            ug._query_results(
+                connection, {"n_estimators": rewritten["n_estimators"]}))
+        connection.close()
+
+        with open(tmp_file, "w") as results_out:
+            results_out.writelines(original_lines)
+        os.replace(tmp_file, results_file)
+        ugc._sync_results(TEST_OUTPUT_DIR)
+
     def test_get_results_frame(self):
         results_frame = ug.read_results_frame(TEST_OUTPUT_DIR)
         
@@ -134,15 +193,21 @@ class UbergridUnitTest(TestCase):
             "target",
             "n_estimators",
             "training_time_total",
+            "model_file_size",
+            "model_serialization_time",
+            "model_mmap",
+            "training_predict_prediction_time",
             "training_total_prediction_time",
             "training_total_prediction_records",
             "training_accuracy",
             
             "cross_validation_accuracy",
+            "cross_validation_predict_prediction_time",
             "cross_validation_total_prediction_time",
             "cross_validation_total_prediction_records",
 
             "cross_validation_training_accuracy",
+            "cross_validation_training_predict_prediction_time",
             "cross_validation_training_total_prediction_time",
             "cross_validation_training_total_prediction_records",
             "cross_validation_training_time_total"
@@ -151,6 +216,29 @@ class UbergridUnitTest(TestCase):
         self.assertEqual(true_columns, set(results_frame.columns))
         self.assertEqual(2, len(results_frame))
 
+    def test_get_results_frame_columns_filters(self):
+        results_frame = ug.read_results_frame(
+            TEST_OUTPUT_DIR,
+            columns = ["model_id", "n_estimators", "training_accuracy"],
+            filters = [("n_estimators", ">", 100)])
+
+        self.assertEqual(["model_id", "n_estimators", "training_accuracy"],
+                         list(results_frame.columns))
+        self.assertEqual([200], list(results_frame["n_estimators"]))
+
+        results_frame = ug.read_results_frame(
+            TEST_OUTPUT_DIR,
+            columns = ["n_estimators"],
+            filters = [("n_estimators", "in", [100, 200])])
+        self.assertEqual([100, 200], sorted(results_frame["n_estimators"]))
+
+        # Test that unknown columns and filter ops raise a ValueError.
+        with self.assertRaises(ValueError):
+            ug.read_results_frame(TEST_OUTPUT_DIR, columns = ["nope"])
+        with self.assertRaises(ValueError):
+            ug.read_results_frame(
+                TEST_OUTPUT_DIR, filters = [("n_estimators", "~", 100)])
+
     def test_get_model(self):
 
         results = ug.read_results(TEST_OUTPUT_DIR)
@@ -174,4 +262,29 @@ class UbergridUnitTest(TestCase):
         # is used.
         model2 = ug.get_model(TEST_OUTPUT_DIR, n_estimators = 100)
 
-        self.assertEqual(100, model2.get_params()['n_estimators'])
\ No newline at end of file
+        self.assertEqual(100, model2.get_params()['n_estimators'])
+
+    def test_get_model_cache(self):
+        ug.cache_clear()
+
+        model = ug.get_model(TEST_OUTPUT_DIR, n_estimators = 100)
+        self.assertEqual(1, ug.cache_info()["models"]["misses"])
+
+        # The second call is served from the cache.
+        self.assertIs(model, ug.get_model(TEST_OUTPUT_DIR, n_estimators = 100))
+        self.assertEqual(1, ug.cache_info()["models"]["hits"])
+        self.assertEqual(1, ug.cache_info()["models"]["entries"])
+
+        # Shrinking the cache evicts the least recently used models.
+        ug.get_model(TEST_OUTPUT_DIR, n_estimators = 200)
+        ug.set_cache_limits("models", max_entries = 1)
+        self.assertEqual(1, ug.cache_info()["models"]["entries"])
+        self.assertIsNot(model, 
+                         ug.get_model(TEST_OUTPUT_DIR, n_estimators = 100))
+
+        with self.assertRaises(ValueError):
+            ug.set_cache_limits("nope", max_entries = 1)
+
+        ug.set_cache_limits("models", max_entries = 16)
+        ug.cache_clear()
+        self.assertEqual(0, ug.cache_info()["models"]["entries"])
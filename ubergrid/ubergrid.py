@@ -1,11 +1,65 @@
 import json
 import os
+import sqlite3
+import threading
+
+from collections import OrderedDict
 
 from sklearn.base import BaseEstimator
 from sklearn.externals import joblib
-from pandas import DataFrame
-from typing import Dict, Any, List, Union
-from toolz import keyfilter, valfilter, compose, complement, curry
+from pandas import DataFrame, Series
+from typing import Dict, Any, List, Union, Optional, Tuple
+from toolz import keyfilter, valfilter, compose, complement, curry, unique
+
+# The filters read_results_frame takes, and their SQL equivalents.
+FILTER_OPS = {
+    "==": lambda column, value: column == value,
+    "!=": lambda column, value: column != value,
+    "<": lambda column, value: column < value,
+    "<=": lambda column, value: column <= value,
+    ">": lambda column, value: column > value,
+    ">=": lambda column, value: column >= value,
+    "in": lambda column, value: column.isin(value),
+    "not in": lambda column, value: ~column.isin(value)
+}
+SQL_OPS = {
+    "==": "=",
+    "!=": "!=",
+    "<": "<",
+    "<=": "<=",
+    ">": ">",
+    ">=": ">=",
+    "in": "IN",
+    "not in": "NOT IN"
+}
+
+# The key in the metadata of results.parquet recording the size, modification
+# time and inode of the results.json it was written from.
+RESULTS_LOG_METADATA = b"ubergrid.results_log"
+
+# The caches get_model keeps: the parsed results of output directories without
+# an up to date results database, and the loaded estimators. Each entry maps a
+# key to the signature of the file it came from, its size in bytes and the
+# value, with the most recently used entry last.
+_CACHES = {
+    "results": {
+        "entries": OrderedDict(),
+        "hits": 0,
+        "misses": 0,
+        "bytes": 0,
+        "max_entries": 8,
+        "max_bytes": 256 * 2**20
+    },
+    "models": {
+        "entries": OrderedDict(),
+        "hits": 0,
+        "misses": 0,
+        "bytes": 0,
+        "max_entries": 16,
+        "max_bytes": 2**30
+    }
+}
+_CACHE_LOCK = threading.Lock()
 
 # Helper functions.
 listfilter = compose(list, filter)
@@ -44,6 +98,86 @@ def _frame_exclude_col(col_name: str) -> bool:
     return col_name.startswith("cross_validation") and \
            col_name.endswith("all")
 
+def _quote_column(column: str) -> str:
+    return '"{}"'.format(column.replace('"', '""'))
+
+def _results_connection(output_dir: str) -> Optional[sqlite3.Connection]:
+    """ Opens the ``results.db`` database in the provided output directory, 
+        if it's up to date with ``results.json``.
+
+        :param output_dir: The name of the output directory of the grid search.
+
+        :returns: 
+            A read only connection to the database, or None if there isn't one
+            or it doesn't hold everything in ``results.json`` (runs from older
+            versions, or results rewritten by the jpmml command).
+
+        :raises ValueError: 
+            If the output directory doesn't have a ``results.json`` file in it.
+    """
+    results_file = output_dir + "/results.json"
+    results_db = output_dir + "/results.db"
+    if not os.path.exists(results_file):
+        raise ValueError("Results file {} does not exist.".format(results_file))
+
+    if not os.path.exists(results_db):
+        return None
+
+    connection = sqlite3.connect("file:{}?mode=ro".format(results_db), 
+                                 uri=True)
+    try:
+        synced = connection.execute(
+            "SELECT size, mtime, inode FROM results_log").fetchone()
+    except sqlite3.Error:
+        synced = None
+
+    results_stat = os.stat(results_file)
+    if synced is None or \
+        tuple(synced) != (results_stat.st_size, 
+                          results_stat.st_mtime_ns,
+                          results_stat.st_ino):
+        connection.close()
+        return None
+    return connection
+
+def _result_columns(connection: sqlite3.Connection) -> Dict[str, str]:
+    return dict(connection.execute(
+        "SELECT name, type FROM result_columns").fetchall())
+
+def _query_results(connection: sqlite3.Connection,
+                   params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """ Reads the records that could match the provided parameters from the
+        results database.
+
+        :param connection: The connection to the results database.
+
+        :param params: The parameters to match.
+
+        :returns: 
+            The records whose columns match the parameters. Parameters without 
+            a column of the same type aren't filtered on here, so the records 
+            still need to be checked with ``_dict_contains``.
+    """
+    columns = _result_columns(connection)
+    numeric_types = {"bool", "integer", "float"}
+
+    conditions = []
+    values = []
+    for param_name, param_value in params.items():
+        column_type = columns.get(param_name)
+        if column_type is None:
+            continue
+        if (isinstance(param_value, (bool, int, float)) and 
+            column_type in numeric_types) or \
+           (isinstance(param_value, str) and column_type == "text"):
+            conditions.append("{} = ?".format(_quote_column(param_name)))
+            values.append(param_value)
+
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+    return [json.loads(record) for (record,) in connection.execute(
+        "SELECT record FROM results {} ORDER BY model_id".format(where),
+        values)]
+
 def read_results(output_dir: str) -> List[Dict[str, Any]]:
     """ Reads the ``results.json`` file from the provided output directory into
         a list of dicts.
@@ -59,6 +193,14 @@ def read_results(output_dir: str) -> List[Dict[str, Any]]:
     
     if not os.path.exists(results_file):
         raise ValueError("Results file {} does not exist.".format(results_file))
+
+    connection = _results_connection(output_dir)
+    if connection is not None:
+        try:
+            return [json.loads(record) for (record,) in connection.execute(
+                "SELECT record FROM results ORDER BY model_id")]
+        finally:
+            connection.close()
     
     results_fin = open(results_file, 'r')
     results = [json.loads(l) for l in results_fin]
@@ -66,22 +208,314 @@ def read_results(output_dir: str) -> List[Dict[str, Any]]:
 
     return results
 
-def read_results_frame(output_dir: str) -> DataFrame:
+def _select_frame(results_frame: DataFrame,
+                  columns: Optional[List[str]],
+                  filters: List[Tuple[str, str, Any]],
+                  exclude_pruned: bool) -> DataFrame:
+    """ Applies the filters and the column selection of ``read_results_frame``
+        to a data frame of the results.
+
+        :param results_frame: The results.
+
+        :param columns: The columns to keep, or None for all of them.
+
+        :param filters: The ``(column, op, value)`` filters to apply.
+
+        :param exclude_pruned: Whether to leave out pruned models.
+
+        :returns: The filtered results with the selected columns.
+
+        :raises ValueError: If a column isn't in the results.
+    """
+    for column in (columns or []) + [column for column, _, _ in filters]:
+        if column not in results_frame.columns:
+            raise ValueError("No results column {}.".format(column))
+
+    keep = Series(True, index=results_frame.index)
+    for column, op, value in filters:
+        keep &= FILTER_OPS[op](results_frame[column], value)
+    if exclude_pruned and "pruned" in results_frame.columns:
+        keep &= results_frame["pruned"] != True
+
+    results_frame = results_frame[keep]
+    if columns is not None:
+        results_frame = results_frame[columns]
+    return results_frame.reset_index(drop=True)
+
+def _read_results_parquet(output_dir: str,
+                          columns: Optional[List[str]],
+                          filters: List[Tuple[str, str, Any]],
+                          exclude_pruned: bool) -> Optional[DataFrame]:
+    """ Reads the results frame from ``results.parquet``, if it's up to date
+        with ``results.json`` and pyarrow is installed. Only the columns that
+        are selected or filtered on are read.
+
+        :returns: The results frame, or None if it can't be read from Parquet.
+    """
+    results_parquet = output_dir + "/results.parquet"
+    if not os.path.exists(results_parquet):
+        return None
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+
+    metadata = pq.read_metadata(results_parquet).metadata or {}
+    results_stat = os.stat(output_dir + "/results.json")
+    if metadata.get(RESULTS_LOG_METADATA) != json.dumps(
+        [results_stat.st_size, 
+         results_stat.st_mtime_ns, 
+         results_stat.st_ino]).encode():
+        return None
+
+    read_columns = None
+    if columns is not None:
+        available_columns = set(pq.read_schema(results_parquet).names)
+        # Missing columns are left for _select_frame to report.
+        read_columns = [
+            column for column in 
+            unique(columns + [column for column, _, _ in filters] + ["pruned"])
+            if column in available_columns
+        ]
+
+    return _select_frame(
+        pq.read_table(results_parquet, columns=read_columns).to_pandas(),
+        columns,
+        filters,
+        exclude_pruned)
+
+def _read_results_db(output_dir: str,
+                     columns: Optional[List[str]],
+                     filters: List[Tuple[str, str, Any]],
+                     exclude_pruned: bool) -> Optional[DataFrame]:
+    """ Reads the results frame from ``results.db``, if it's up to date with
+        ``results.json``. The column selection and the filters are done by
+        the database.
+
+        :returns: The results frame, or None if there's no database to read.
+    """
+    connection = _results_connection(output_dir)
+    if connection is None:
+        return None
+    
+    try:
+        result_columns = _result_columns(connection)
+        frame_columns = columns if columns is not None \
+                        else sorted(result_columns.keys())
+        for column in frame_columns + [column for column, _, _ in filters]:
+            if column not in result_columns:
+                raise ValueError("No results column {}.".format(column))
+
+        conditions = []
+        values = []
+        for column, op, value in filters:
+            if op in {"in", "not in"}:
+                conditions.append("{} {} ({})".format(
+                    _quote_column(column), 
+                    SQL_OPS[op], 
+                    ", ".join(["?"] * len(value))))
+                values.extend(value)
+            else:
+                conditions.append("{} {} ?".format(
+                    _quote_column(column), SQL_OPS[op]))
+                values.append(value)
+        if exclude_pruned and "pruned" in result_columns:
+            conditions.append('"pruned" IS NOT 1')
+
+        rows = connection.execute(
+            "SELECT {} FROM results {} ORDER BY model_id".format(
+                ", ".join(_quote_column(c) for c in frame_columns),
+                "WHERE " + " AND ".join(conditions) if conditions else ""),
+            values).fetchall()
+    finally:
+        connection.close()
+
+    results_frame = DataFrame.from_records(rows, columns=frame_columns)
+    for column in frame_columns:
+        if result_columns[column] == "bool":
+            results_frame[column] = \
+                results_frame[column].map({0: False, 1: True})
+    return results_frame
+
+def read_results_frame(output_dir: str, 
+                       columns: List[str] = None,
+                       filters: List[Tuple[str, str, Any]] = None,
+                       exclude_pruned: bool = False) -> DataFrame:
     """ Reads the results.json file into a pandas DataFrame.
 
         :param output_dir: The name of the output directory of the grid search.
 
+        :param columns: 
+            The columns to read. Defaults to all of them. Only these (and the
+            ones in ``filters``) are read when the results have been written
+            to ``results.parquet`` or ``results.db``.
+
+        :param filters:
+            A list of ``(column, op, value)`` tuples the rows have to match, 
+            where ``op`` is one of ``==``, ``!=``, ``<``, ``<=``, ``>``, 
+            ``>=``, ``in`` or ``not in``.
+
+        :param exclude_pruned:
+            Whether to leave out models whose cross validation was pruned.
+
         :returns: 
             The results as a pandas data frame. Excludes the cross validation 
             run lists (but keeps the cross validation mean values).
 
         :raises ValueError:
             If the output directory doesn't have a ``results.json`` file in it.
+
+        :raises ValueError:
+            If a column or a filter op doesn't exist.
     """
+    if not os.path.exists(output_dir + "/results.json"):
+        raise ValueError("Results file {} does not exist.".format(
+            output_dir + "/results.json"))
+
+    filters = [tuple(f) for f in (filters or [])]
+    for _, op, _ in filters:
+        if op not in FILTER_OPS:
+            raise ValueError("{} is not a filter op. Use one of {}.".format(
+                op, ", ".join(sorted(FILTER_OPS.keys()))))
+
+    # The columnar file is the fastest to read, then the database. Runs that
+    # have neither are read from results.json.
+    for read_frame in [_read_results_parquet, _read_results_db]:
+        results_frame = read_frame(output_dir, columns, filters, exclude_pruned)
+        if results_frame is not None:
+            return results_frame
+
     results = read_results(output_dir)
-    return DataFrame(
-        data = listmap(
-            lambda r: keyfilter(complement(_frame_exclude_col), r), results))
+    return _select_frame(
+        DataFrame(
+            data = listmap(
+                lambda r: keyfilter(complement(_frame_exclude_col), r), 
+                results)),
+        columns,
+        filters,
+        exclude_pruned)
+
+def _file_signature(file_name: str) -> Tuple[int, int]:
+    """ The size and modification time of a file, which change whenever the
+        file is rewritten.
+
+        :param file_name: The name of the file.
+
+        :returns: The size and modification time (in nanoseconds).
+    """
+    file_stat = os.stat(file_name)
+    return file_stat.st_size, file_stat.st_mtime_ns
+
+def _evict(cache: Dict[str, Any]) -> None:
+    """ Evicts the least recently used entries of a cache until it's within
+        its limits. The caller holds the cache lock.
+
+        :param cache: The cache.
+    """
+    while len(cache["entries"]) > cache["max_entries"] or \
+          cache["bytes"] > cache["max_bytes"]:
+        _, (_, size, _) = cache["entries"].popitem(last=False)
+        cache["bytes"] -= size
+
+def _cached(cache_name: str, key: Any, file_name: str, load) -> Any:
+    """ Returns the cached value for a key, loading it if it isn't cached or
+        the file it came from has changed since it was cached.
+
+        :param cache_name: The name of the cache, ``results`` or ``models``.
+
+        :param key: The key of the value in the cache.
+
+        :param file_name: The file the value is loaded from.
+
+        :param load: A function of no arguments that loads the value.
+
+        :returns: The value.
+    """
+    cache = _CACHES[cache_name]
+    signature = _file_signature(file_name)
+    
+    with _CACHE_LOCK:
+        entry = cache["entries"].get(key)
+        if entry is not None and entry[0] == signature:
+            cache["hits"] += 1
+            cache["entries"].move_to_end(key)
+            return entry[2]
+        cache["misses"] += 1
+
+    value = load()
+    
+    # The size of the file stands in for the size of the value. Values too
+    # big for the cache aren't cached.
+    size = signature[0]
+    with _CACHE_LOCK:
+        if key in cache["entries"]:
+            cache["bytes"] -= cache["entries"].pop(key)[1]
+        if size <= cache["max_bytes"]:
+            cache["entries"][key] = (signature, size, value)
+            cache["bytes"] += size
+            _evict(cache)
+    return value
+
+def cache_info() -> Dict[str, Dict[str, int]]:
+    """ Statistics for the caches ``get_model`` keeps.
+
+        :returns: 
+            A dict with a ``results`` entry for the parsed ``results.json`` 
+            files and a ``models`` entry for the loaded estimators. Each has
+            the ``hits``, ``misses``, ``entries`` and ``bytes`` of the cache,
+            and its ``max_entries`` and ``max_bytes``.
+    """
+    with _CACHE_LOCK:
+        return {
+            cache_name: {
+                "hits": cache["hits"],
+                "misses": cache["misses"],
+                "entries": len(cache["entries"]),
+                "bytes": cache["bytes"],
+                "max_entries": cache["max_entries"],
+                "max_bytes": cache["max_bytes"]
+            } for cache_name, cache in _CACHES.items()
+        }
+
+def cache_clear() -> None:
+    """ Empties the caches ``get_model`` keeps and resets their statistics.
+    """
+    with _CACHE_LOCK:
+        for cache in _CACHES.values():
+            cache["entries"].clear()
+            cache["hits"] = 0
+            cache["misses"] = 0
+            cache["bytes"] = 0
+
+def set_cache_limits(cache_name: str, 
+                     max_entries: int = None, 
+                     max_bytes: int = None) -> None:
+    """ Sets the limits of one of the caches ``get_model`` keeps, evicting the
+        least recently used entries that no longer fit.
+
+        :param cache_name: 
+            ``results`` for the parsed ``results.json`` files or ``models`` 
+            for the loaded estimators.
+
+        :param max_entries: The most entries to keep. Unchanged if None.
+
+        :param max_bytes: 
+            The most bytes to keep, measured by the size of the files the 
+            entries came from. Unchanged if None.
+
+        :raises ValueError: If the cache doesn't exist.
+    """
+    if cache_name not in _CACHES:
+        raise ValueError("{} is not a cache. Use one of {}.".format(
+            cache_name, ", ".join(sorted(_CACHES.keys()))))
+
+    with _CACHE_LOCK:
+        cache = _CACHES[cache_name]
+        if max_entries is not None:
+            cache["max_entries"] = max_entries
+        if max_bytes is not None:
+            cache["max_bytes"] = max_bytes
+        _evict(cache)
 
 def get_model(results: Union[str, Dict[str, Any]], **kwargs) -> BaseEstimator:
     """ Obtains the model with the provided parameters from the results.
@@ -93,17 +527,36 @@ def get_model(results: Union[str, Dict[str, Any]], **kwargs) -> BaseEstimator:
         :param **kwargs: 
             The parameters uniquely identifying the model to obtain.
 
-        :returns: The estimator with the corresponding parameters.
+        :returns: 
+            The estimator with the corresponding parameters. Estimators are 
+            cached (see ``cache_info``), so repeated calls return the same 
+            object until its model file changes.
 
         :raises ValueError:
             If the parameters do not match a model in the grid.
 
         :raises ValueError: 
             If the parameters match more than one model in the grid.
+
+        :raises ValueError:
+            If the model was pruned, so it was never fit.
     """
-    # Pull the results if the directory is provided.
+    # Pull the results if the directory is provided. If it has an up to date
+    # results database, only the records matching the indexed parameters are
+    # read.
     if type(results) is str:
-        results = read_results(results) 
+        connection = _results_connection(results)
+        if connection is not None:
+            try:
+                results = _query_results(connection, kwargs)
+            finally:
+                connection.close()
+        else:
+            results = _cached(
+                "results", 
+                os.path.abspath(results + "/results.json"),
+                results + "/results.json",
+                lambda: read_results(results))
     
     contains_args = curry(_dict_contains)(kwargs)
     matching_results = listfilter(contains_args, results)
@@ -117,4 +570,17 @@ def get_model(results: Union[str, Dict[str, Any]], **kwargs) -> BaseEstimator:
             ",".join(["{}={}".format(param_name, param_value)
                       for param_name, param_value in kwargs.items()])))
 
-    return joblib.load(matching_results[0]['model_file'])
\ No newline at end of file
+    if matching_results[0].get("pruned", False):
+        raise ValueError("The model for parameters {} was pruned.".format(
+            ",".join(["{}={}".format(param_name, param_value)
+                      for param_name, param_value in kwargs.items()])))
+
+    # Models written for memory mapping share their arrays across every
+    # process that loads them.
+    model_file = matching_results[0]['model_file']
+    mmap_mode = "r" if matching_results[0].get("model_mmap", False) else None
+    return _cached(
+        "models",
+        (os.path.abspath(model_file), mmap_mode),
+        model_file,
+        lambda: joblib.load(model_file, mmap_mode=mmap_mode))
\ No newline at end of file
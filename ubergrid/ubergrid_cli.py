@@ -45,7 +45,8 @@ def run(search_params_file: str,
 
         TARGET_COL - The name of the target variable column.
 
-        TRAINING_FILE - The name of the training file (csv with headers).
+        TRAINING_FILE - The name of the training file (csv with headers,
+            parquet, feather or npz).
 
         OUTPUT_DIR - The name of the directory that will hold the results.
         If it does not exist, ubergrid will make it.
@@ -70,9 +71,24 @@ def run(search_params_file: str,
               type=str,
               help="The name of the file to evaluate. "
                     "Must be specified with --pmml-evaluator option.")
+@click.option("--n-jobs", "-j", 
+              type=int, 
+              default=1,
+              help="The number of models to convert in parallel.")
+@click.option("--warmup", "-w",
+              type=int,
+              default=ugj.PMML_WARMUP,
+              help="The number of untimed passes over the file per model.")
+@click.option("--repeats", "-r",
+              type=int,
+              default=ugj.PMML_REPEATS,
+              help="The number of timed passes over the file per model.")
 def jpmml(results_dir: str,
           pmml_evaluator: str,
-          file_to_evaluate: str):
+          file_to_evaluate: str,
+          n_jobs: int,
+          warmup: int,
+          repeats: int):
     """ 
     Takes an existing ubergrid search and builds PMML files with JPMML.
 
@@ -80,4 +96,9 @@ def jpmml(results_dir: str,
 
         RESULTS_DIR - The name of the directory with a completed ubergrid run.
     """
-    ugj._main(results_dir, pmml_evaluator, file_to_evaluate)
\ No newline at end of file
+    ugj._main(results_dir, 
+              pmml_evaluator, 
+              file_to_evaluate, 
+              n_jobs = n_jobs,
+              warmup = warmup,
+              repeats = repeats)
\ No newline at end of file
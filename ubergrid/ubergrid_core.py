@@ -1,25 +1,46 @@
 import json
 import os
+import re
+import math
 import logging
-import subprocess
+import fcntl
+import sqlite3
+
+from copy import copy
+from collections import OrderedDict
 
 import numpy as np
 
-from time import time
+from scipy import stats
+
+from time import time, perf_counter
 
-from glob import glob
+from multiprocessing import cpu_count
 
-from pandas import DataFrame, Series, read_csv
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, \
+    wait, FIRST_COMPLETED
 
-from typing import List, Tuple, Dict, Any
+from pandas import DataFrame, Series, read_csv, concat, to_numeric
+from pandas.api.types import union_categoricals, is_bool_dtype, \
+    is_integer_dtype, is_float_dtype, is_numeric_dtype
+
+from typing import List, Tuple, Dict, Any, Set
 
 from toolz import merge_with, identity, keymap, valmap
 
 from sklearn.externals import joblib
 from sklearn.externals.joblib import Parallel, delayed
-from sklearn.model_selection import ParameterGrid, KFold
-from sklearn.metrics import SCORERS
-from sklearn.base import BaseEstimator
+from sklearn.model_selection import ParameterGrid, ParameterSampler, KFold, \
+    StratifiedKFold, GroupKFold, train_test_split
+from sklearn.metrics import accuracy_score, f1_score, recall_score, \
+    precision_score, log_loss, roc_auc_score, average_precision_score, \
+    mean_absolute_error, mean_squared_error, median_absolute_error, r2_score
+from sklearn.base import BaseEstimator, clone
+from sklearn.pipeline import Pipeline
+from sklearn.linear_model import LogisticRegression, Lasso, ElasticNet
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import ConstantKernel, Matern, \
+    WhiteKernel
 
 AVAILABLE_METRICS = {
     "accuracy",
@@ -41,17 +62,394 @@ AVAILABLE_METRICS = {
     "r2"
 }
 
+# Maps each metric to the prediction it's computed from, the metric function,
+# the keyword arguments to the metric function, and the sign to apply to the
+# value. These mirror the scorers in sklearn.metrics.SCORERS, so the values
+# are identical to calling the scorer, but the predictions can be computed
+# once and shared by every metric that needs them.
+METRIC_PREDICTIONS = {
+    "accuracy": ("predict", accuracy_score, {}, 1),
+    "f1": ("predict", f1_score, {}, 1),
+    "recall": ("predict", recall_score, {}, 1),
+    "precision": ("predict", precision_score, {}, 1),
+    "log_loss": ("predict_proba", log_loss, {}, -1),
+    "roc_auc": ("threshold", roc_auc_score, {}, 1),
+    "average_precision": ("threshold", average_precision_score, {}, 1),
+    "f1_micro": ("predict", f1_score, {"average": "micro"}, 1),
+    "f1_macro": ("predict", f1_score, {"average": "macro"}, 1),
+    "precision_micro": ("predict", precision_score, {"average": "micro"}, 1),
+    "precision_macro": ("predict", precision_score, {"average": "macro"}, 1),
+    "recall_micro": ("predict", recall_score, {"average": "micro"}, 1),
+    "recall_macro": ("predict", recall_score, {"average": "macro"}, 1),
+    "neg_mean_absolute_error": ("predict", mean_absolute_error, {}, -1),
+    "neg_mean_squared_error": ("predict", mean_squared_error, {}, -1),
+    "neg_median_absolute_error": ("predict", median_absolute_error, {}, -1),
+    "r2": ("predict", r2_score, {}, 1)
+}
+
+# The ways the parameter space can be searched.
+SEARCH_MODES = {"grid", "random", "halving", "bayesian"}
+
+# The distributions that can be declared in param_distributions, and how to
+# build them from their "low" and "high" (or "loc" and "scale") fields.
+DISTRIBUTIONS = {
+    "uniform": lambda d: stats.uniform(loc=d['low'], scale=d['high']-d['low']),
+    "loguniform": lambda d: stats.reciprocal(d['low'], d['high']),
+    "randint": lambda d: stats.randint(d['low'], d['high']),
+    "normal": lambda d: stats.norm(loc=d['loc'], scale=d['scale'])
+}
+
+# Parameters that grow a model when it's warm started. Warm starting a fit
+# with a bigger value gives the same model as fitting it from scratch.
+WARM_START_PARAMS = ["n_estimators"]
+
+# Parameters that follow a regularization path, and whether the path runs
+# from the biggest value to the smallest (alpha) or the other way around (C)
+# to start from the strongest regularization.
+PATH_PARAMS = {"C": False, "alpha": True}
+
+# The estimators that can be warm started along a regularization path.
+PATH_ESTIMATORS = (LogisticRegression, Lasso, ElasticNet)
+
+# The ways grid points can share work.
+INCREMENTAL_MODES = {"auto", "none", "warm_start", "staged", "path"}
+
+# The attributes of a fit ensemble that have one entry per stage.
+STAGED_ATTRIBUTES = [
+    "estimators_", 
+    "estimator_weights_", 
+    "estimator_errors_", 
+    "train_score_", 
+    "oob_improvement_"
+]
+
+# The batch sizes models are benchmarked with by default, and the methods
+# that can be benchmarked.
+BENCHMARK_BATCH_SIZES = [1, 32, 1024, "full"]
+BENCHMARK_METHODS = {"predict", "predict_proba", "decision_function"}
+
+# The compressors models can be written with.
+COMPRESSORS = {"zlib", "gzip", "bz2", "lzma", "xz"}
+
+# The ways cross validation can be pruned.
+PRUNERS = {"median", "threshold"}
+
+# The cross validation splitters.
+SPLITTERS = {"kfold", "stratified", "group"}
+
+# The default size of the transformer cache in output_dir, in bytes.
+TRANSFORMER_CACHE_MAX_BYTES = 2**30
+
+# The ways param_distributions can be sampled.
+SAMPLERS = {"random", "sobol", "lhs"}
+
+# The degree, polynomial coefficients and initial direction numbers of the
+# Sobol sequence for its second dimension on, from Joe and Kuo (2008). The
+# first dimension is the van der Corput sequence.
+SOBOL_DIRECTIONS = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]),
+    (5, 2, [1, 1, 5, 5, 17]),
+    (5, 4, [1, 1, 5, 5, 5]),
+    (5, 7, [1, 1, 7, 11, 19]),
+    (5, 11, [1, 1, 5, 1, 1]),
+    (5, 13, [1, 1, 1, 3, 11]),
+    (5, 14, [1, 3, 5, 5, 31]),
+    (6, 1, [1, 3, 3, 9, 7, 49]),
+    (6, 13, [1, 1, 1, 15, 21, 21]),
+    (6, 16, [1, 3, 1, 13, 27, 49]),
+    (6, 19, [1, 1, 1, 15, 7, 5]),
+    (6, 22, [1, 3, 1, 15, 13, 25]),
+    (6, 25, [1, 1, 5, 5, 19, 61]),
+    (7, 1, [1, 3, 7, 11, 23, 15, 103]),
+    (7, 4, [1, 3, 7, 13, 13, 15, 69]),
+]
+SOBOL_BITS = 30
+
+# The number of rows to read at once when loading a csv file.
+CSV_CHUNK_SIZE = 100000
+# The number of rows at the top of a csv file used to infer its schema.
+SCHEMA_SAMPLE_ROWS = 10000
+# String columns with fewer unique values than this fraction of the sample are
+# loaded as categories.
+CATEGORY_MAX_FRACTION = 0.5
+
 logging.basicConfig(format="%(asctime)s %(message)s", 
                     datefmt="%Y-%m-%d %H:%M:%S",
                     level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def _evaluate_model(estimator: BaseEstimator, 
-                    X: DataFrame,
-                    y: DataFrame,
-                    grid_search_context: Dict[str, Any],
-                    prefix: str) -> Dict[str, Any]:
-    metrics = grid_search_context['metrics']
+def _infer_schema(file_name: str, target_col: str) -> List[List[str]]:
+    # The schema is the kind of each column, inferred from a sample at the
+    # top of the file.
+    sample = read_csv(file_name, nrows=SCHEMA_SAMPLE_ROWS)
+    
+    schema = []
+    for column in sample.columns:
+        values = sample[column]
+        if is_bool_dtype(values):
+            kind = "bool"
+        elif is_integer_dtype(values):
+            kind = "integer"
+        elif is_float_dtype(values):
+            kind = "float"
+        # Low cardinality strings become categories. The target is left alone
+        # so the labels come out the same as they went in.
+        elif column != target_col and \
+            values.nunique() <= CATEGORY_MAX_FRACTION * len(values):
+            kind = "category"
+        else:
+            kind = "object"
+        schema.append([column, kind])
+
+    return schema
+
+def _load_schema(file_name: str,
+                 target_col: str,
+                 output_dir: str,
+                 save: bool = True) -> List[List[str]]:
+    schema_file = "{}/schema.json".format(output_dir)
+    header = list(read_csv(file_name, nrows=0).columns)
+
+    # Resumed runs reuse the schema from the first run, as long as it's for
+    # the same columns.
+    if os.path.exists(schema_file):
+        with open(schema_file, 'r') as schema_in:
+            schema = json.load(schema_in)
+        if [column for column, _ in schema] == header:
+            logger.info("Using schema in {}.".format(schema_file))
+            return schema
+        logger.info("Schema in {} doesn't match {}, inferring a new one."\
+                    .format(schema_file, file_name))
+
+    logger.info("Inferring schema from the first {} rows of {}.".format(
+        SCHEMA_SAMPLE_ROWS, file_name))
+    schema = _infer_schema(file_name, target_col)
+
+    if save:
+        with open(schema_file, 'w') as schema_out:
+            schema_out.write(json.dumps(schema) + "\n")
+
+    return schema
+
+def _downcast_float(values: Series) -> Series:
+    # Only downcast when it doesn't lose anything.
+    values_32 = values.astype(np.float32)
+    lossless = (values_32.astype(np.float64) == values) | values.isnull()
+    return values_32 if lossless.all() else values
+
+def _downcast_chunk(chunk: DataFrame, schema: List[List[str]]) -> DataFrame:
+    for column, kind in schema:
+        if column not in chunk.columns:
+            continue
+        if kind == "integer":
+            chunk[column] = to_numeric(chunk[column], downcast="integer")
+        elif kind == "float":
+            chunk[column] = _downcast_float(chunk[column])
+    return chunk
+
+def _read_csv_chunked(file_name: str,
+                      schema: List[List[str]],
+                      columns: List[str] = None) -> DataFrame:
+    category_columns = [column for column, kind in schema 
+                        if kind == "category"]
+    
+    # Categories are parsed as categories directly, so the strings are never
+    # all held in memory at once.
+    chunks = [
+        _downcast_chunk(chunk, schema) 
+        for chunk in read_csv(file_name, 
+                              chunksize=CSV_CHUNK_SIZE,
+                              usecols=columns,
+                              dtype={column: "category" 
+                                     for column in category_columns})
+    ]
+    
+    # A file with only a header doesn't produce any chunks.
+    if len(chunks) == 0:
+        return read_csv(file_name, usecols=columns)
+
+    # Each chunk has its own categories, so those columns are assembled
+    # separately from the rest of the frame.
+    category_columns = [column for column in category_columns
+                        if column in chunks[0].columns]
+    frame = concat([chunk.drop(category_columns, axis=1) for chunk in chunks],
+                   ignore_index=True)
+    for column in category_columns:
+        frame[column] = union_categoricals(
+            [chunk[column] for chunk in chunks])
+    
+    return frame[list(chunks[0].columns)]
+
+def _file_format(file_name: str) -> str:
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension in {".parquet", ".pq"}:
+        return "parquet"
+    elif extension in {".feather", ".arrow", ".ipc"}:
+        return "feather"
+    elif extension == ".npz":
+        return "npz"
+    else:
+        return "csv"
+
+def _import_pyarrow(file_name: str):
+    try:
+        import pyarrow.parquet
+        import pyarrow.feather
+    except ImportError:
+        logger.critical("pyarrow is required to read {}.".format(file_name))
+        logger.critical("Install with pip install pyarrow")
+        raise
+    return pyarrow
+
+def _read_columns(file_name: str) -> List[str]:
+    file_format = _file_format(file_name)
+    if file_format == "parquet":
+        pyarrow = _import_pyarrow(file_name)
+        return list(pyarrow.parquet.ParquetFile(file_name).schema.names)
+    elif file_format == "feather":
+        pyarrow = _import_pyarrow(file_name)
+        # Feather files are memory mapped, so this doesn't read the data.
+        return list(
+            pyarrow.feather.read_table(file_name, memory_map=True)\
+                           .schema.names)
+    elif file_format == "npz":
+        # npz files hold one array per column, named by the column.
+        with np.load(file_name) as npz:
+            return list(npz.files)
+    else:
+        return list(read_csv(file_name, nrows=0).columns)
+
+def _read_input(file_name: str,
+                schema: List[List[str]],
+                target_col: str,
+                columns: List[str] = None) -> DataFrame:
+    file_format = _file_format(file_name)
+    logger.info("Reading {} as {}.".format(file_name, file_format))
+    
+    if file_format == "parquet":
+        pyarrow = _import_pyarrow(file_name)
+        return pyarrow.parquet.read_table(file_name, columns=columns)\
+                              .to_pandas()
+    elif file_format == "feather":
+        pyarrow = _import_pyarrow(file_name)
+        return pyarrow.feather.read_table(file_name, columns=columns)\
+                              .to_pandas()
+    elif file_format == "npz":
+        # Arrays in an npz file are only read when they're accessed.
+        with np.load(file_name) as npz:
+            columns = columns if columns is not None else npz.files
+            return DataFrame({column: npz[column] for column in columns},
+                             columns=columns)
+    else:
+        if schema is None:
+            schema = _infer_schema(file_name, target_col)
+        return _read_csv_chunked(file_name, schema, columns)
+
+def _write_frame_store(frame: DataFrame,
+                       store_dir: str,
+                       name: str) -> Dict[str, Any]:
+    # Each dtype's columns are written as one Fortran ordered 2D array. That's
+    # the layout pandas uses internally, so a single dtype frame can be built
+    # directly on top of the memory map without copying it.
+    blocks = []
+    dtype_columns = merge_with(list, 
+        *[{str(dtype): column} for column, dtype in frame.dtypes.items()])
+    for ii, (dtype, columns) in enumerate(sorted(dtype_columns.items())):
+        block_file = "{}/{}_{}.npy".format(store_dir, name, ii)
+        # Replace rather than overwrite the file, in case a previous version
+        # of it is still mapped.
+        tmp_file = "{}.{}.tmp".format(block_file, os.getpid())
+        with open(tmp_file, 'wb') as block_out:
+            np.save(block_out, np.asfortranarray(frame[columns].values))
+        os.replace(tmp_file, block_file)
+        blocks.append({"file": block_file, "columns": columns})
+
+    return {
+        "name": name,
+        "columns": list(frame.columns),
+        "blocks": blocks
+    }
+
+def _load_frame_store(handle: Dict[str, Any]) -> DataFrame:
+    frames = [
+        DataFrame(np.load(block["file"], mmap_mode='r'),
+                  columns=block["columns"],
+                  copy=False)
+        for block in handle["blocks"]
+    ]
+    # Frames with more than one dtype need to be assembled, which copies.
+    return frames[0] if len(frames) == 1 \
+           else concat(frames, axis=1)[handle["columns"]]
+
+# The frames mapped by this process, so each worker only maps a store once.
+_FRAME_STORES = {}
+
+def _get_frame(grid_search_context: Dict[str, Any], key: str) -> DataFrame:
+    frame = grid_search_context[key]
+    # Frames are either in the context directly or referenced by a handle to
+    # the memory mapped store.
+    if isinstance(frame, dict):
+        block_files = tuple(block["file"] for block in frame["blocks"])
+        # The store is rewritten on each run, so remap it if it's changed.
+        signature = tuple((os.stat(block_file).st_ino, 
+                           os.stat(block_file).st_mtime_ns)
+                          for block_file in block_files)
+        if block_files not in _FRAME_STORES or \
+            _FRAME_STORES[block_files][0] != signature:
+            _FRAME_STORES[block_files] = \
+                (signature, _load_frame_store(frame))
+        frame = _FRAME_STORES[block_files][1]
+    return frame
+
+def _training_frames(grid_search_context: Dict[str, Any]) \
+    -> Tuple[DataFrame, DataFrame]:
+    X_train = _get_frame(grid_search_context, 'X_train')
+    y_train = _get_frame(grid_search_context, 'y_train')
+    
+    # Models can be trained on a subset of the training rows (the successive
+    # halving search does this).
+    training_rows = grid_search_context.get('training_rows')
+    if training_rows is not None:
+        X_train = X_train.iloc[training_rows]
+        y_train = y_train.iloc[training_rows]
+
+    return X_train, y_train
+
+def _store_frames(grid_search_context: Dict[str, Any]) -> Dict[str, Any]:
+    output_dir = grid_search_context['output_dir']
+    store_dir = "{}/data".format(output_dir)
+    
+    if not os.path.exists(store_dir):
+        os.mkdir(store_dir)
+
+    frame_keys = ["X_train", "y_train", "X_validation", "y_validation"]
+    store_context = {}
+    for key in frame_keys:
+        frame = grid_search_context[key]
+        if frame is None:
+            continue
+        # Only numeric columns can be memory mapped, so other frames are sent
+        # to the workers as they are.
+        if not all(is_numeric_dtype(dtype) for dtype in frame.dtypes):
+            logger.info(
+                "{} has non-numeric columns, not memory mapping it."\
+                .format(key))
+            continue
+        store_context[key] = _write_frame_store(frame, store_dir, key)
+
+    logger.info("Wrote {} to {}.".format(
+        ", ".join(sorted(store_context.keys())), store_dir))
+    return {
+        **grid_search_context,
+        **store_context
+    }
+
+def _validate_metrics(metrics: List[str]) -> None:
     # Validate that the metrics are in the available list.
     if len(set(metrics) - AVAILABLE_METRICS) != 0:
         logger.critical("{} are not available metrics.".format(
@@ -59,162 +457,645 @@ def _evaluate_model(estimator: BaseEstimator,
         raise ValueError(
             "{} are not available metrics.".format(
             set(metrics) - AVAILABLE_METRICS))
+
+def _prediction_methods(estimator: BaseEstimator,
+                        metrics: List[str]) -> Tuple[Dict[str, str], bool]:
+    # Group the metrics by the prediction they need so each prediction is only
+    # computed once.
+    prediction_types = {METRIC_PREDICTIONS[m][0] for m in metrics}
+
+    # Threshold metrics use the decision function if the estimator has one,
+    # falling back to the positive class probability otherwise (this is what
+    # the threshold scorers do).
+    if "threshold" in prediction_types and \
+        not hasattr(estimator, "decision_function"):
+        prediction_types = (prediction_types - {"threshold"}) | \
+                           {"predict_proba"}
+        threshold_from_proba = True
+    else:
+        threshold_from_proba = False
+
+    methods = {
+        prediction_type: "decision_function" if prediction_type == "threshold"
+                         else prediction_type
+        for prediction_type in prediction_types
+    }
+    return methods, threshold_from_proba
+
+def _make_predictions(estimator: BaseEstimator,
+                      X: DataFrame,
+                      metrics: List[str]) \
+                      -> Tuple[Dict[str, Any], Dict[str, float]]:
+    methods, threshold_from_proba = _prediction_methods(estimator, metrics)
     
-    predict_times = []
-    results = {}
+    predictions = {}
+    prediction_times = {}
+
+    for prediction_type, method in sorted(methods.items()):
+        start = perf_counter()
+        predictions[prediction_type] = getattr(estimator, method)(X)
+        stop = perf_counter()
+
+        prediction_times[method] = stop - start
 
-    # Evaluate the score for each metric.
+    if threshold_from_proba:
+        predictions["threshold"] = predictions["predict_proba"][:, 1]
+
+    return predictions, prediction_times
+
+def _score_predictions(predictions: Dict[str, Any],
+                       y: DataFrame,
+                       metrics: List[str]) -> Dict[str, float]:
+    scores = {}
     for metric in metrics:
-        # We need the scorer function itself, as well as the type of arguments
-        # required by the scorer function.
-        metric_fn = SCORERS[metric]
+        prediction_type, metric_fn, metric_kwargs, sign = \
+            METRIC_PREDICTIONS[metric]
+        scores[metric] = \
+            sign * metric_fn(y, predictions[prediction_type], **metric_kwargs)
+    return scores
 
-        # The make_scorer function returns a scorer, which takes an estimator,
-        # the training set, and the ground truth labels.
-        start = time()
-        results[prefix + "_" + metric] = metric_fn(estimator, X, y)
-        stop = time()
+def _evaluate_model(estimator: BaseEstimator, 
+                    X: DataFrame,
+                    y: DataFrame,
+                    grid_search_context: Dict[str, Any],
+                    prefix: str) -> Dict[str, Any]:
+    metrics = grid_search_context['metrics']
+    _validate_metrics(metrics)
+
+    # Compute each prediction once, then score every metric from the cached
+    # predictions.
+    predictions, prediction_times = _make_predictions(estimator, X, metrics)
+    scores = _score_predictions(predictions, y, metrics)
+
+    return _format_evaluation(scores, prediction_times, X.shape[0], prefix)
+
+def _evaluate_stages(estimator: BaseEstimator,
+                     X: DataFrame,
+                     y: DataFrame,
+                     stages: List[int],
+                     grid_search_context: Dict[str, Any],
+                     prefix: str) -> Dict[int, Dict[str, Any]]:
+    metrics = grid_search_context['metrics']
+    _validate_metrics(metrics)
+    methods, threshold_from_proba = _prediction_methods(estimator, metrics)
+
+    # One pass over the staged predictions scores every stage. The prediction 
+    # time of a stage is the time spent getting to it, which is about what
+    # predicting with a model of that size costs.
+    staged = {
+        prediction_type: getattr(estimator, "staged_" + method)(X)
+        for prediction_type, method in methods.items()
+    }
+    predictions = {}
+    prediction_times = {method: 0.0 for method in methods.values()}
+
+    results = {}
+    for stage in range(1, max(stages) + 1):
+        for prediction_type, method in methods.items():
+            start = perf_counter()
+            # Ensembles that stop early (like AdaBoost on a perfect fit) run
+            # out of stages, and the bigger models are the same as the last
+            # one.
+            predictions[prediction_type] = \
+                next(staged[prediction_type], predictions.get(prediction_type))
+            prediction_times[method] += perf_counter() - start
+
+        if stage in stages:
+            stage_predictions = {**predictions}
+            if threshold_from_proba:
+                stage_predictions["threshold"] = \
+                    stage_predictions["predict_proba"][:, 1]
+            # Staged decision functions keep the column that decision_function
+            # drops for binary problems.
+            if "threshold" in stage_predictions and \
+                stage_predictions["threshold"].ndim == 2 and \
+                stage_predictions["threshold"].shape[1] == 1:
+                stage_predictions["threshold"] = \
+                    stage_predictions["threshold"].ravel()
+            results[stage] = _format_evaluation(
+                _score_predictions(stage_predictions, y, metrics),
+                {**prediction_times},
+                X.shape[0],
+                prefix)
+
+    return results
+
+def _truncate_ensemble(estimator: BaseEstimator,
+                       n_estimators: int) -> BaseEstimator:
+    # The first n_estimators stages of a fit ensemble are the ensemble that 
+    # fitting with n_estimators would give. The copy shares the fit stages
+    # with the original.
+    truncated = copy(estimator)
+    for attribute in STAGED_ATTRIBUTES:
+        if getattr(truncated, attribute, None) is not None:
+            setattr(truncated, 
+                    attribute, 
+                    getattr(truncated, attribute)[:n_estimators])
+    truncated.set_params(n_estimators=n_estimators)
+    return truncated
+
+def _format_evaluation(scores: Dict[str, float],
+                       prediction_times: Dict[str, float],
+                       num_records: int,
+                       prefix: str) -> Dict[str, Any]:
+    results = {
+        prefix + "_" + metric: score for metric, score in scores.items()
+    }
 
-        predict_times += [stop - start]
+    # Prediction time is recorded for each prediction method that was called,
+    # and the total is the time spent in all of them.
+    for method, prediction_time in prediction_times.items():
+        results[prefix + "_" + method + "_prediction_time"] = prediction_time
 
-    results[prefix + "_total_prediction_time"] = \
-        sum(predict_times) / len(predict_times)
-    results[prefix + "_total_prediction_records"] = X.shape[0]
+    results[prefix + "_total_prediction_time"] = sum(prediction_times.values())
+    results[prefix + "_total_prediction_records"] = num_records
 
     return results
 
+def _transformer_cache_key(estimator: Pipeline,
+                           step_fit_params: Dict[str, Dict[str, Any]],
+                           rows: np.ndarray,
+                           grid_search_context: Dict[str, Any]) -> str:
+    transformer_cache = grid_search_context['transformer_cache']
+    # The upstream steps are identified by their class and parameters, and
+    # the data by the training file plus the rows the pipeline is fit on.
+    return joblib.hash([
+        [(name, type(step), step.get_params() if step is not None else None)
+         for name, step in estimator.steps[:-1]],
+        [step_fit_params[name] for name, _ in estimator.steps[:-1]],
+        transformer_cache['fingerprint'],
+        grid_search_context.get('training_rows'),
+        rows
+    ])
+
+def _load_transformers(cache_file: str) -> Any:
+    try:
+        cached = joblib.load(cache_file)
+        # The modification time is the last use, for the LRU eviction.
+        os.utime(cache_file)
+        return cached
+    except (FileNotFoundError, EOFError):
+        # The entry was evicted by another worker.
+        return None
+
+def _evict_transformers(cache_dir: str, 
+                        max_bytes: int,
+                        keep_file: str) -> None:
+    # Entries are evicted least recently used first, under a lock so
+    # concurrent workers don't evict past the limit.
+    with open(os.path.join(cache_dir, ".lock"), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            entries = []
+            for file_name in os.listdir(cache_dir):
+                if not file_name.endswith(".pkl"):
+                    continue
+                cache_file = os.path.join(cache_dir, file_name)
+                try:
+                    cache_stat = os.stat(cache_file)
+                except FileNotFoundError:
+                    continue
+                entries.append(
+                    (cache_stat.st_mtime, cache_stat.st_size, cache_file))
+
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, cache_file in sorted(entries):
+                if total_bytes <= max_bytes:
+                    break
+                if cache_file == keep_file:
+                    continue
+                logger.info("Evicting {} from the transformer cache."\
+                            .format(cache_file))
+                try:
+                    os.remove(cache_file)
+                except FileNotFoundError:
+                    pass
+                total_bytes -= size
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _fit_estimator(estimator: BaseEstimator,
+                   X: DataFrame,
+                   y: DataFrame,
+                   rows: np.ndarray,
+                   grid_search_context: Dict[str, Any]) -> None:
+    # Pipelines reuse the upstream steps from the transformer cache when
+    # they've been fit with the same parameters on the same rows, and only fit
+    # the final step. The rows are the positions of X in the training frames,
+    # or None if it's all of them.
+    fit_params = grid_search_context['fit_params']
+    transformer_cache = grid_search_context.get('transformer_cache')
+    if transformer_cache is None or \
+        not isinstance(estimator, Pipeline) or \
+        len(estimator.steps) < 2 or \
+        any("__" not in param for param in fit_params):
+        estimator.fit(X, y, **fit_params)
+        return
+
+    # Pipeline fit params are addressed to a step as step__param.
+    step_fit_params = {name: {} for name, _ in estimator.steps}
+    for param, value in fit_params.items():
+        step, step_param = param.split("__", 1)
+        step_fit_params[step][step_param] = value
+
+    cache_dir = transformer_cache['dir']
+    cache_file = os.path.join(
+        cache_dir,
+        _transformer_cache_key(
+            estimator, step_fit_params, rows, grid_search_context) + ".pkl")
+
+    cached = _load_transformers(cache_file) \
+             if os.path.exists(cache_file) else None
+    if cached is not None:
+        logger.info("Using cached transformers {}.".format(cache_file))
+        fitted_steps, Xt = cached
+    else:
+        fitted_steps = []
+        Xt = X
+        for name, transformer in estimator.steps[:-1]:
+            if transformer is not None:
+                if hasattr(transformer, "fit_transform"):
+                    Xt = transformer.fit_transform(
+                        Xt, y, **step_fit_params[name])
+                else:
+                    Xt = transformer.fit(Xt, y, **step_fit_params[name])\
+                                    .transform(Xt)
+            fitted_steps.append((name, transformer))
+
+        # Written to a temporary file and renamed, so other workers never
+        # load a partial entry.
+        tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+        joblib.dump((fitted_steps, Xt), tmp_file)
+        os.replace(tmp_file, cache_file)
+        _evict_transformers(cache_dir, 
+                            transformer_cache['max_bytes'], 
+                            cache_file)
+
+    for step_idx, fitted_step in enumerate(fitted_steps):
+        estimator.steps[step_idx] = fitted_step
+
+    final_name, final_estimator = estimator.steps[-1]
+    if final_estimator is not None:
+        final_estimator.fit(Xt, y, **step_fit_params[final_name])
+
+def _training_scoring_sample(X_train: DataFrame,
+                             y_train: DataFrame,
+                             sample: Dict[str, Any]) -> Dict[str, Any]:
+    # The sample is drawn once, over the whole training set, and every model
+    # is scored on it.
+    num_rows = X_train.shape[0]
+    random_state = sample.get('random_state', 0)
+    if sample['size'] >= num_rows:
+        sample_rows = np.arange(num_rows)
+    else:
+        sample_rows, _ = train_test_split(
+            np.arange(num_rows),
+            train_size=sample['size'],
+            random_state=random_state,
+            stratify=y_train.iloc[:, 0].values 
+                     if sample.get('stratify', False) else None)
+    return {
+        "rows": np.sort(sample_rows),
+        "size": len(sample_rows),
+        "random_state": random_state
+    }
+
+def _scoring_sample(X: DataFrame,
+                    y: DataFrame,
+                    rows: np.ndarray,
+                    grid_search_context: Dict[str, Any]) \
+                    -> Tuple[DataFrame, DataFrame]:
+    # The training set metrics are computed on a sample of the training
+    # partition. The rows are the positions of X in the training frames, or
+    # None if it's all of them.
+    sample = grid_search_context.get('training_scoring_sample')
+    if sample is None:
+        return X, y
+
+    # The positions of the partition in the whole training set.
+    training_rows = grid_search_context.get('training_rows')
+    if rows is None:
+        positions = training_rows if training_rows is not None \
+                    else np.arange(X.shape[0])
+    else:
+        positions = training_rows[rows] if training_rows is not None \
+                    else rows
+    
+    sample_positions = np.flatnonzero(np.in1d(positions, sample['rows']))
+    return X.iloc[sample_positions], y.iloc[sample_positions]
+
 def _train_model(estimator: BaseEstimator,
                  grid_search_context: Dict[str, Any]) \
                  -> Tuple[Dict[str, Any], BaseEstimator]:
-    X = grid_search_context['X_train']
-    y = grid_search_context['y_train']
-    fit_params = grid_search_context['fit_params']
+    X, y = _training_frames(grid_search_context)
 
     fit_start = time()
-    estimator.fit(X, y, **fit_params)
+    _fit_estimator(estimator, X, y, None, grid_search_context)
     fit_end = time()
 
-    results = _evaluate_model(estimator, X, y, grid_search_context, "training")
+    X_score, y_score = _scoring_sample(X, y, None, grid_search_context)
+    results = _evaluate_model(
+        estimator, X_score, y_score, grid_search_context, "training")
     results["training_time_total"] = fit_end - fit_start
 
     return estimator, results
 
-def _cross_validate(estimator: BaseEstimator,
-                    model_id: int,
-                    grid_search_context: Dict[str, Any]) -> Dict[str, Any]:
+def _make_splitter(cv: Dict[str, Any], n_splits: int) -> Any:
+    shuffle = cv.get('shuffle', False)
+    random_state = cv.get('random_state') if shuffle else None
+    splitter = cv.get('splitter', "kfold")
+    if splitter == "stratified":
+        return StratifiedKFold(n_splits=n_splits, 
+                               shuffle=shuffle, 
+                               random_state=random_state)
+    elif splitter == "group":
+        return GroupKFold(n_splits=n_splits)
+    else:
+        return KFold(n_splits=n_splits, 
+                     shuffle=shuffle, 
+                     random_state=random_state)
+
+def _folds_file(output_dir: str) -> str:
+    return "{}/folds.npz".format(output_dir)
+
+def _write_folds(grid_search_context: Dict[str, Any],
+                 cv: Dict[str, Any],
+                 groups: np.ndarray = None) -> str:
+    # The folds are computed over the training set once and their indices
+    # written to the output directory, unless they're already there for the
+    # same settings and training data. The groups are the values of the group
+    # splitter's column.
+    output_dir = grid_search_context['output_dir']
+    training_file = grid_search_context['training_file']
     n_splits = grid_search_context['cross_validation']
+    folds_file = _folds_file(output_dir)
+
+    training_stat = os.stat(training_file)
+    spec = json.dumps({
+        "n_splits": n_splits,
+        "splitter": cv.get('splitter', "kfold"),
+        "shuffle": cv.get('shuffle', False),
+        "random_state": cv.get('random_state'),
+        "groups": cv.get('groups'),
+        "training_file": os.path.abspath(training_file),
+        "training_file_size": training_stat.st_size,
+        "training_file_mtime": training_stat.st_mtime_ns,
+        "target_col": grid_search_context['target_col']
+    }, sort_keys=True)
+
+    # The folds are reused when a search is resumed, so shuffled folds are
+    # the same for every model.
+    if os.path.exists(folds_file):
+        with np.load(folds_file) as folds:
+            if str(folds['spec']) == spec:
+                logger.info("Using the folds in {}.".format(folds_file))
+                return folds_file
+        logger.warning("The folds in {} are for different settings or "
+                       "data. Recomputing them.".format(folds_file))
+
     X_train = grid_search_context['X_train']
     y_train = grid_search_context['y_train']
-    fit_params = grid_search_context['fit_params']
+    splits = _make_splitter(cv, n_splits).split(
+        X_train, y_train.iloc[:, 0].values, groups)
 
-    cross_validation_results = []
-    k_folds = KFold(n_splits=n_splits)
-    for cv_train, cv_test in k_folds.split(X_train):
-            
-        logger.info("Training model {} on cross validation training set."\
-            .format(model_id))
-        cv_train_start = time()
-        estimator.fit(X_train.iloc[cv_train],
-                      y_train.iloc[cv_train],
-                      **fit_params)
-        cv_train_stop = time()
-        logger.info(
-            "Completed training model {} on cross validation "\
-            .format(model_id) + 
-            "training set. Took {:.3f} seconds."\
-                .format(cv_train_stop - cv_train_start))
+    fold_arrays = {"spec": np.array(spec)}
+    for fold, (cv_train, cv_test) in enumerate(splits):
+        fold_arrays["train_{}".format(fold)] = cv_train
+        fold_arrays["test_{}".format(fold)] = cv_test
+
+    tmp_file = "{}.{}.tmp".format(folds_file, os.getpid())
+    with open(tmp_file, 'wb') as folds_out:
+        np.savez(folds_out, **fold_arrays)
+    os.replace(tmp_file, folds_file)
+    logger.info("Wrote {} folds to {}.".format(n_splits, folds_file))
+    return folds_file
+
+# The fold indices this process has loaded, and the fold partitions it has
+# materialized, most recently used last.
+_FOLDS = {}
+_FOLD_FRAMES = OrderedDict()
+
+def _fold_indices(grid_search_context: Dict[str, Any],
+                  fold: int) -> Tuple[np.ndarray, np.ndarray]:
+    folds_file = grid_search_context.get('folds')
+    if folds_file is None:
+        # KFold without shuffling is deterministic, so every task computes
+        # the same splits.
+        X_train, _ = _training_frames(grid_search_context)
+        return list(KFold(n_splits=grid_search_context['cross_validation'])\
+                    .split(X_train))[fold]
+
+    signature = (os.stat(folds_file).st_ino, os.stat(folds_file).st_mtime_ns)
+    if folds_file not in _FOLDS or _FOLDS[folds_file][0] != signature:
+        with np.load(folds_file) as folds:
+            _FOLDS[folds_file] = (
+                signature, 
+                {name: folds[name] for name in folds.files if name != "spec"})
+    fold_arrays = _FOLDS[folds_file][1]
+    cv_train = fold_arrays["train_{}".format(fold)]
+    cv_test = fold_arrays["test_{}".format(fold)]
+
+    # The folds are over the whole training set. Models trained on a subset
+    # of the rows keep each of those rows in its fold.
+    training_rows = grid_search_context.get('training_rows')
+    if training_rows is not None:
+        in_test = np.in1d(training_rows, cv_test)
+        cv_train, cv_test = np.flatnonzero(~in_test), np.flatnonzero(in_test)
+    return cv_train, cv_test
+
+def _fold_frames(grid_search_context: Dict[str, Any],
+                 fold: int) \
+                 -> Tuple[np.ndarray, DataFrame, DataFrame, 
+                          DataFrame, DataFrame]:
+    # The partitions of a fold are materialized once per process and kept for
+    # the next task on the same fold, up to fold_cache folds.
+    cv_train, cv_test = _fold_indices(grid_search_context, fold)
+
+    folds_file = grid_search_context.get('folds')
+    fold_cache = grid_search_context.get('fold_cache', 0)
+    # Subsets of the training rows are identified by a hash computed once
+    # per subset, rather than hashing the rows on every lookup.
+    cacheable = folds_file is not None and fold_cache > 0 and \
+        (grid_search_context.get('training_rows') is None or 
+         'training_rows_key' in grid_search_context)
+    key = (folds_file, 
+           _FOLDS[folds_file][0], 
+           grid_search_context.get('training_rows_key'),
+           fold) if cacheable else None
+    if key in _FOLD_FRAMES:
+        _FOLD_FRAMES.move_to_end(key)
+        return _FOLD_FRAMES[key]
+
+    X_train, y_train = _training_frames(grid_search_context)
+    fold_frames = (cv_train,
+                   X_train.iloc[cv_train],
+                   y_train.iloc[cv_train],
+                   X_train.iloc[cv_test],
+                   y_train.iloc[cv_test])
+    if cacheable:
+        _FOLD_FRAMES[key] = fold_frames
+        while len(_FOLD_FRAMES) > fold_cache:
+            _FOLD_FRAMES.popitem(last=False)
+    return fold_frames
+
+def _cross_validate_fold(estimator: BaseEstimator,
+                         model_id: int,
+                         fold: int,
+                         grid_search_context: Dict[str, Any]) \
+                         -> Dict[str, Any]:
+    cv_train, X_fold_train, y_fold_train, X_fold_test, y_fold_test = \
+        _fold_frames(grid_search_context, fold)
+
+    logger.info("Training model {} on cross validation training set {}."\
+        .format(model_id, fold))
+    cv_train_start = time()
+    _fit_estimator(estimator,
+                   X_fold_train,
+                   y_fold_train,
+                   cv_train,
+                   grid_search_context)
+    cv_train_stop = time()
+    logger.info(
+        "Completed training model {} on cross validation "\
+        .format(model_id) + 
+        "training set {}. Took {:.3f} seconds."\
+            .format(fold, cv_train_stop - cv_train_start))
+    
+    logger.info("Evaluating model {} on cross validation training set {}."\
+        .format(model_id, fold))
+    cv_training_results = \
+        _evaluate_model(
+            estimator,
+            *_scoring_sample(
+                X_fold_train, y_fold_train, cv_train, grid_search_context),
+            grid_search_context,
+            "cross_validation_training")
+    logger.info("Completed evaluating model {} on cross validation "\
+        .format(model_id) +
+        "training set {}. Took {:.3f} seconds for {} records.".format(
+            fold,
+            cv_training_results[
+                "cross_validation_training_total_prediction_time"],
+            cv_training_results[
+                "cross_validation_training_total_prediction_records"]))
         
-        logger.info("Evaluating model {} on cross validation training set."\
-            .format(model_id))
-        cv_training_results = \
-            _evaluate_model(
-                estimator,
-                X_train.iloc[cv_train],
-                y_train.iloc[cv_train],
-                grid_search_context,
-                "cross_validation_training")
-        logger.info("Completed evaluating model {} on cross validation "\
-            .format(model_id) +
-            "training set. Took {:.3f} seconds for {} records.".format(
-                cv_training_results[
-                    "cross_validation_training_total_prediction_time"],
-                cv_training_results[
-                    "cross_validation_training_total_prediction_records"]))
-            
-        logger.info("Evaluating model {} on cross validation test set."\
-            .format(model_id))
-        cv_validation_results = \
-            _evaluate_model(estimator, 
-                            X_train.iloc[cv_test],
-                            y_train.iloc[cv_test],
-                            grid_search_context, 
-                            "cross_validation")
-        logger.info("Completed evaluating model {} on cross validation "\
-            .format(model_id) +
-            "test set. Took {:.3f} seconds for {} records.".format(
-                cv_validation_results[
-                    "cross_validation_total_prediction_time"],
-                cv_validation_results[
-                    "cross_validation_total_prediction_records"]))
-            
-        cross_validation_results.append(
-            {   
-                "cross_validation_training_time_total": 
-                    cv_train_stop - cv_train_start,
-                **cv_training_results,
-                **cv_validation_results
-            })
+    logger.info("Evaluating model {} on cross validation test set {}."\
+        .format(model_id, fold))
+    cv_validation_results = \
+        _evaluate_model(estimator, 
+                        X_fold_test,
+                        y_fold_test,
+                        grid_search_context, 
+                        "cross_validation")
+    logger.info("Completed evaluating model {} on cross validation "\
+        .format(model_id) +
+        "test set {}. Took {:.3f} seconds for {} records.".format(
+            fold,
+            cv_validation_results[
+                "cross_validation_total_prediction_time"],
+            cv_validation_results[
+                "cross_validation_total_prediction_records"]))
+        
+    return {   
+        "cross_validation_training_time_total": 
+            cv_train_stop - cv_train_start,
+        **cv_training_results,
+        **cv_validation_results
+    }
 
-    # Merge the results.
+def _merge_cross_validation(cross_validation_results: List[Dict[str, Any]]) \
+    -> Dict[str, Any]:
     cv_results_merged = merge_with(identity, *cross_validation_results)
-    cv_results = {
+    return {
         # These are the results for the individual folds.
         **(keymap(lambda x: x + "_all", cv_results_merged)),
         # These are the average results.
         **(valmap(lambda x: sum(x) / len(x), cv_results_merged))
     }
+
+def _cross_validate(estimator: BaseEstimator,
+                    model_id: int,
+                    grid_search_context: Dict[str, Any]) -> Dict[str, Any]:
+    n_splits = grid_search_context['cross_validation']
+
+    pruning = grid_search_context.get('pruning')
+    # The completed models the median pruner compares against are read once,
+    # up front.
+    reference = _pruning_reference(pruning, grid_search_context) \
+                if pruning is not None and pruning['method'] == "median" \
+                else []
+    pruned = False
+
+    cross_validation_results = []
+    for fold in range(n_splits):
+        cross_validation_results.append(
+            _cross_validate_fold(estimator,
+                                 model_id,
+                                 fold,
+                                 grid_search_context))
+        
+        if pruning is not None and fold < n_splits - 1 and \
+            _should_prune(cross_validation_results, reference, pruning):
+            logger.info("Pruning model {} after {} folds.".format(
+                model_id, fold + 1))
+            pruned = True
+            break
+
+    # Merge the results.
+    cv_results = _merge_cross_validation(cross_validation_results)
+    if pruning is not None:
+        cv_results["pruned"] = pruned
     logger.info("Cross validation for model {} completed.".format(model_id))
     return cv_results
 
-def _train_and_evaluate(estimator: BaseEstimator,
-                        params: Dict[str, Any],
-                        model_id: int,
-                        grid_search_context: Dict[str, Any]) -> None:
-    # Unpack the grid search context.
-    output_dir = grid_search_context['output_dir']
-    cross_validation = grid_search_context['cross_validation']
-    validation_file = grid_search_context['validation_file']
-    target_col = grid_search_context['target_col']
-    training_file = grid_search_context['training_file']
+def _pruning_reference(pruning: Dict[str, Any],
+                       grid_search_context: Dict[str, Any]) \
+                       -> List[List[float]]:
+    # The per fold scores of every completed model that wasn't pruned.
+    metric_all = "cross_validation_{}_all".format(pruning['metric'])
+    completed_models, _ = _scan_output_dir(grid_search_context['output_dir'])
+    return [
+        results[metric_all] 
+        for results in _read_model_results(
+            sorted(completed_models), grid_search_context).values()
+        if not results.get("pruned", False) and metric_all in results
+    ]
+
+def _should_prune(cross_validation_results: List[Dict[str, Any]],
+                  reference: List[List[float]],
+                  pruning: Dict[str, Any]) -> bool:
+    num_folds = len(cross_validation_results)
+    if num_folds < pruning.get('min_folds', 1):
+        return False
+
+    # Candidates are compared on the running mean of their fold scores.
+    metric = "cross_validation_{}".format(pruning['metric'])
+    running_score = np.mean(
+        [fold_results[metric] for fold_results in cross_validation_results])
     
-    param_str = ", ".join(
-           ["{}={}".format(param_name, param_value)
-            for param_name, param_value in params.items()])
-    logger.info("Training and evaluating model {}: {}"\
-                .format(model_id, param_str))
+    if pruning['method'] == "threshold":
+        return running_score < pruning['threshold']
     
-    model_file = "{}/model_{}.pkl".format(output_dir, model_id)
-    results_file = "{}/results_{}.json".format(output_dir, model_id)
-        
-    # If the results file already exists, skip this pass.
-    if os.path.exists(results_file):
-        logger.info("Model {} already exists, skipping.".format(model_id))
-        return
+    # The median pruner compares the running mean against the median running
+    # mean of the completed models after the same number of folds.
+    if len(reference) < pruning.get('min_completed', 5):
+        return False
+    reference_scores = [np.mean(fold_scores[:num_folds]) 
+                        for fold_scores in reference]
+    return running_score < np.median(reference_scores)
 
-    # Initialize the estimator with the params.
-    estimator.set_params(**params)
+def _fit_final(estimator: BaseEstimator,
+               model_id: int,
+               grid_search_context: Dict[str, Any],
+               saved_params: Dict[str, Any] = None) -> Dict[str, Any]:
+    # The saved params are set on a copy of the estimator before it's written,
+    # so chained models are saved with the params they'd have had without the
+    # chain.
+    output_dir = grid_search_context['output_dir']
+    validation_file = grid_search_context['validation_file']
 
-    cv_results = {}
-    # Perform cross validation if selected.
-    if cross_validation is not None:
-        logger.info("Cross validating model {} for {} folds.".format(
-            model_id, cross_validation))
+    model_file = "{}/model_{}.pkl".format(output_dir, model_id)
 
-        cv_results = \
-            _cross_validate(estimator,
-                            model_id,
-                            grid_search_context)
-       
     logger.info(
         "Training model {} and evaluating the model on the training set."\
         .format(model_id))
@@ -237,8 +1118,8 @@ def _train_and_evaluate(estimator: BaseEstimator,
             "Evaluating model {} on the validation set.".format(model_id))
     validation_results = \
             _evaluate_model(estimator,
-                        grid_search_context['X_validation'],
-                        grid_search_context['y_validation'], 
+                        _get_frame(grid_search_context, 'X_validation'),
+                        _get_frame(grid_search_context, 'y_validation'), 
                         grid_search_context, 
                         "validation") \
         if validation_file is not None else {}
@@ -249,16 +1130,114 @@ def _train_and_evaluate(estimator: BaseEstimator,
             .format(model_id, 
                     validation_results["validation_total_prediction_time"],
                     validation_results["validation_total_prediction_records"]))
+
+    benchmark_results = _benchmark_model(estimator, grid_search_context)
+
+    # The model is written before the results, so a results file always
+    # points at a complete model.
+    logger.info("Writing estimator for model {} to {}."\
+                .format(model_id, model_file))
+    saved_estimator = estimator
+    if saved_params is not None:
+        saved_estimator = copy(estimator)
+        saved_estimator.set_params(**saved_params)
+    persistence_results = \
+        _dump_model(saved_estimator, model_file, grid_search_context)
+
+    return {
+        **training_results,
+        **validation_results,
+        **benchmark_results,
+        **persistence_results
+    }
+
+def _benchmark_model(estimator: BaseEstimator,
+                     grid_search_context: Dict[str, Any]) -> Dict[str, Any]:
+    benchmark = grid_search_context.get('benchmark')
+    if benchmark is None:
+        return {}
+
+    # Models are benchmarked on the validation set if there is one.
+    if grid_search_context['validation_file'] is not None:
+        X = _get_frame(grid_search_context, 'X_validation')
+    else:
+        X = _training_frames(grid_search_context)[0]
+    num_rows = X.shape[0]
+    predict = getattr(estimator, benchmark.get('method', "predict"))
+    warmup = benchmark.get('warmup', 3)
+    trials = benchmark.get('trials', 20)
+
+    results = {}
+    for batch_size in benchmark.get('batch_sizes', BENCHMARK_BATCH_SIZES):
+        batch_rows = num_rows if batch_size == "full" \
+                     else min(batch_size, num_rows)
+        # The batches step through the data, so the trials don't all predict
+        # the same rows. They're sliced before the clock starts.
+        if batch_rows == num_rows:
+            batches = [X] * (warmup + trials)
+        else:
+            batches = [
+                X.iloc[np.arange(start, start + batch_rows) % num_rows]
+                for start in 
+                (np.arange(warmup + trials) * batch_rows) % num_rows
+            ]
+
+        for batch in batches[:warmup]:
+            predict(batch)
+
+        # The latencies are short, so they're timed with the highest 
+        # resolution clock.
+        latencies = []
+        for batch in batches[warmup:]:
+            start = perf_counter()
+            predict(batch)
+            latencies.append(perf_counter() - start)
+
+        prefix = "benchmark_{}".format(batch_size)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        results[prefix + "_p50_latency"] = p50
+        results[prefix + "_p95_latency"] = p95
+        results[prefix + "_p99_latency"] = p99
+        results[prefix + "_rows_per_second"] = \
+            batch_rows * len(latencies) / sum(latencies) \
+            if sum(latencies) > 0 else None
+    return results
+
+def _dump_model(estimator: BaseEstimator,
+                model_file: str,
+                grid_search_context: Dict[str, Any]) -> Dict[str, Any]:
+    persistence = grid_search_context.get('persistence', {})
+    
+    # Compressed models are smaller but can't be memory mapped when they're
+    # loaded.
+    compress = (persistence['compress'], persistence.get('level', 3)) \
+               if persistence.get('compress') is not None else 0
+
+    dump_start = time()
+    joblib.dump(estimator, model_file, compress=compress)
+    dump_stop = time()
+
+    return {
+        "model_file_size": os.path.getsize(model_file),
+        "model_serialization_time": dump_stop - dump_start,
+        "model_mmap": persistence.get('mmap', False)
+    }
+
+def _assemble_results(params: Dict[str, Any],
+                      model_id: int,
+                      cv_results: Dict[str, Any],
+                      final_results: Dict[str, Any],
+                      grid_search_context: Dict[str, Any]) -> Dict[str, Any]:
+    output_dir = grid_search_context['output_dir']
+    validation_file = grid_search_context['validation_file']
     
-    # Construct and write the results for this run.
     results = {
-        "training_file": training_file,
-        "target": target_col,
-        "model_file": model_file,
+        "training_file": grid_search_context['training_file'],
+        "target": grid_search_context['target_col'],
+        "model_file": "{}/model_{}.pkl".format(output_dir, model_id),
         "model_id": model_id,
         **cv_results,
-        **training_results,
-        **validation_results,
+        **final_results,
         **params
     }
 
@@ -266,19 +1245,1059 @@ def _train_and_evaluate(estimator: BaseEstimator,
     if validation_file:
         results["validation_file"] = validation_file
 
-    # Write the results _after_ the model.
-    logger.info("Writing estimator for model {} to {}."\
-                .format(model_id, model_file))
-    joblib.dump(estimator, model_file)
+    # Columns of the training file that aren't features are recorded, so
+    # the jpmml command builds the PMML with the right features.
+    excluded_columns = grid_search_context.get('excluded_columns', [])
+    if len(excluded_columns) > 0:
+        results["excluded_columns"] = excluded_columns
+
+    # Training set metrics computed on a sample record the sample.
+    sample = grid_search_context.get('training_scoring_sample')
+    if sample is not None:
+        results["training_scoring_sample_size"] = sample['size']
+        results["training_scoring_sample_random_state"] = \
+            sample['random_state']
+
+    # Searches can record extra fields for each model (like the rung of a
+    # successive halving search).
+    results.update(
+        grid_search_context.get('model_fields', {}).get(model_id, {}))
+
+    return results
+
+def _write_json(file_name: str, contents: Dict[str, Any]) -> None:
+    # Write to a temporary file and rename it so readers (and other workers)
+    # never see a partially written file.
+    tmp_file = "{}.{}.tmp".format(file_name, os.getpid())
+    with open(tmp_file, 'w') as out:
+        out.write(json.dumps(contents) + "\n")
+    os.replace(tmp_file, file_name)
+
+# The fields of a results record that aren't hyperparameters, and the
+# prefixes of the evaluation fields.
+RESULT_FIELDS = {
+    "model_file_size",
+    "model_serialization_time",
+    "model_mmap",
+    "training_file",
+    "validation_file",
+    "target",
+    "model_file",
+    "model_id",
+    "pruned",
+    "rung",
+    "candidate_id",
+    "halving_resource",
+    "excluded_columns"
+}
+RESULT_PREFIXES = (
+    "training_", 
+    "validation_", 
+    "cross_validation_", 
+    "pmml_", 
+    "benchmark_"
+)
+
+# The key in the metadata of results.parquet recording the size, modification
+# time and inode of the results.json it was written from.
+RESULTS_LOG_METADATA = b"ubergrid.results_log"
+
+# The column types in the results database.
+SQL_TYPES = {
+    "bool": "INTEGER",
+    "integer": "INTEGER",
+    "float": "REAL",
+    "text": "TEXT"
+}
+
+# The results log read by this process so far, for each output directory:
+# the inode of the log, the offset read up to, and the offset of each model's
+# record.
+_RESULTS_INDEX = {}
+
+def _results_file(output_dir: str) -> str:
+    return "{}/results.json".format(output_dir)
+
+def _refresh_results_index(output_dir: str) -> Dict[int, int]:
+    # Each process indexes the results log incrementally: it remembers how far
+    # it has read, and where each model's record starts, so only records
+    # appended since the last call are parsed.
+    results_file = _results_file(output_dir)
+    inode, offset, index = _RESULTS_INDEX.get(output_dir, (None, 0, {}))
     
+    if not os.path.exists(results_file):
+        _RESULTS_INDEX[output_dir] = (None, 0, {})
+        return {}
+    # The log only ever grows during a run. If it was replaced or shrank it
+    # was rewritten, so start over.
+    results_stat = os.stat(results_file)
+    if results_stat.st_ino != inode or results_stat.st_size < offset:
+        offset, index = 0, {}
+
+    with open(results_file, 'rb') as results_in:
+        results_in.seek(offset)
+        for line in results_in:
+            # A record without a newline is still being written (or was torn
+            # by a crash), so it isn't indexed yet.
+            if not line.endswith(b"\n"):
+                break
+            index.setdefault(json.loads(line.decode())['model_id'], offset)
+            offset += len(line)
+
+    _RESULTS_INDEX[output_dir] = (results_stat.st_ino, offset, index)
+    return index
+
+def _results_db(output_dir: str) -> str:
+    return "{}/results.db".format(output_dir)
+
+def _column_type(value: Any) -> str:
+    # Lists (like the cross validation folds) and nulls don't get a column. 
+    # They're in the full record.
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        return "text"
+    return None
+
+def _is_param_column(column: str) -> bool:
+    # Everything in a record that isn't a result field is a hyperparameter.
+    return column not in RESULT_FIELDS and \
+           not column.startswith(RESULT_PREFIXES)
+
+def _quote_column(column: str) -> str:
+    return '"{}"'.format(column.replace('"', '""'))
+
+def _sync_results_db(output_dir: str) -> None:
+    # The results database mirrors the results log. It records how much of the
+    # log it holds, so each sync only inserts the records appended since the
+    # last one. The caller holds the results log lock.
+    results_file = _results_file(output_dir)
+    connection = sqlite3.connect(_results_db(output_dir), timeout=60)
+    try:
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "model_id INTEGER PRIMARY KEY, record TEXT NOT NULL)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS result_columns ("
+                "name TEXT PRIMARY KEY, type TEXT NOT NULL)")
+            connection.execute(
+                "INSERT OR IGNORE INTO result_columns "
+                "VALUES ('model_id', 'integer')")
+            # Databases from older versions don't record the inode, so
+            # their log table is replaced (and the results rebuilt).
+            log_columns = [column[1] for column in connection.execute(
+                "PRAGMA table_info(results_log)").fetchall()]
+            if log_columns and "inode" not in log_columns:
+                connection.execute("DROP TABLE results_log")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results_log ("
+                "size INTEGER NOT NULL, mtime INTEGER NOT NULL, "
+                "inode INTEGER NOT NULL)")
+            
+            synced = connection.execute(
+                "SELECT size, mtime, inode FROM results_log").fetchone()
+            columns = dict(connection.execute(
+                "SELECT name, type FROM result_columns").fetchall())
+
+            log_stat = os.stat(results_file)
+            with open(results_file, 'rb') as results_in:
+                # The log only grows in place during a run. If it was replaced
+                # (by the jpmml command, say), shrank, or was rewritten at the
+                # same size, the database is rebuilt. An append always grows
+                # the log, and the synced offset lands on the end of a record.
+                offset = 0
+                if synced is not None:
+                    size, mtime, inode = synced
+                    appended = log_stat.st_ino == inode and \
+                               log_stat.st_mtime_ns >= mtime and \
+                               (log_stat.st_size > size or 
+                                log_stat.st_mtime_ns == mtime)
+                    if appended and size > 0:
+                        results_in.seek(size - 1)
+                        appended = results_in.read(1) == b"\n"
+                    if appended:
+                        offset = size
+                if offset == 0:
+                    results_in.seek(0)
+                    connection.execute("DELETE FROM results")
+
+                for line in results_in:
+                    if not line.endswith(b"\n"):
+                        break
+                    record = json.loads(line.decode())
+                    offset += len(line)
+
+                    record_columns = {
+                        column: value for column, value in record.items()
+                        if column not in columns and 
+                           _column_type(value) is not None
+                    }
+                    for column, value in record_columns.items():
+                        column_type = _column_type(value)
+                        connection.execute(
+                            "ALTER TABLE results ADD COLUMN {} {}".format(
+                                _quote_column(column), 
+                                SQL_TYPES[column_type]))
+                        connection.execute(
+                            "INSERT INTO result_columns VALUES (?, ?)",
+                            (column, column_type))
+                        # Hyperparameters are indexed for get_model.
+                        if _is_param_column(column):
+                            connection.execute(
+                                "CREATE INDEX {} ON results ({})".format(
+                                    _quote_column("results_" + column),
+                                    _quote_column(column)))
+                        columns[column] = column_type
+
+                    values = {
+                        column: value for column, value in record.items()
+                        if column in columns and 
+                           _column_type(value) is not None
+                    }
+                    connection.execute(
+                        "INSERT OR REPLACE INTO results ({}) VALUES ({})"\
+                        .format(", ".join(["record"] + 
+                                          [_quote_column(column) 
+                                           for column in values.keys()]),
+                                ", ".join(["?"] * (len(values) + 1))),
+                        [json.dumps(record)] + list(values.values()))
+
+            connection.execute("DELETE FROM results_log")
+            connection.execute("INSERT INTO results_log VALUES (?, ?, ?)",
+                               (offset, 
+                                log_stat.st_mtime_ns, 
+                                log_stat.st_ino))
+    except sqlite3.Error as error:
+        # results.json is what the run resumes from, so a failed sync is only
+        # a warning. The next one catches up.
+        logger.warning("Couldn't update {}: {}".format(
+            _results_db(output_dir), error))
+    finally:
+        connection.close()
+
+def _append_results(results: Dict[str, Any], output_dir: str) -> bool:
+    # Records are appended to the log under an exclusive lock, so concurrent
+    # workers never interleave writes or write the same model twice.
+    with open(_results_file(output_dir), 'ab') as results_out:
+        fcntl.flock(results_out, fcntl.LOCK_EX)
+        try:
+            if results['model_id'] in _refresh_results_index(output_dir):
+                return False
+
+            # Anything past the last complete record was torn by a crash, and
+            # is dropped so the new record starts on its own line.
+            _, offset, _ = _RESULTS_INDEX[output_dir]
+            if os.fstat(results_out.fileno()).st_size > offset:
+                results_out.truncate(offset)
+
+            results_out.write((json.dumps(results) + "\n").encode())
+            results_out.flush()
+            _sync_results_db(output_dir)
+        finally:
+            fcntl.flock(results_out, fcntl.LOCK_UN)
+    return True
+
+def _write_results(results: Dict[str, Any],
+                   grid_search_context: Dict[str, Any]) -> None:
+    output_dir = grid_search_context['output_dir']
+    model_id = results['model_id']
+
     logger.info("Writing results for model {} to {}."\
-                .format(model_id, results_file))
-    with open(results_file, 'w') as results_out:
-        results_out.write(
-            json.dumps(results) + "\n")
+                .format(model_id, _results_file(output_dir)))
+    if not _append_results(results, output_dir):
+        logger.info("Results for model {} already written, skipping."\
+                    .format(model_id))
+
+def _sync_results(output_dir: str) -> None:
+    # Brings the results database up to date with the log, for runs that
+    # crashed between the two or were written before the database existed.
+    with open(_results_file(output_dir), 'ab') as results_out:
+        fcntl.flock(results_out, fcntl.LOCK_EX)
+        try:
+            _sync_results_db(output_dir)
+        finally:
+            fcntl.flock(results_out, fcntl.LOCK_UN)
+
+def _write_results_parquet(output_dir: str) -> None:
+    # A columnar copy of the results lets read_results_frame read only the
+    # columns it's asked for. pyarrow is optional, so without it there's no
+    # copy (and the frame is read from the database).
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        logger.info("pyarrow isn't installed, not writing results.parquet.")
+        return
+
+    results_parquet = "{}/results.parquet".format(output_dir)
+    with open(_results_file(output_dir), 'ab') as results_out:
+        fcntl.flock(results_out, fcntl.LOCK_SH)
+        try:
+            log_stat = os.stat(_results_file(output_dir))
+            with open(_results_file(output_dir), 'r') as results_in:
+                records = [json.loads(line) for line in results_in]
+        finally:
+            fcntl.flock(results_out, fcntl.LOCK_UN)
+
+    # Like the database, the lists (and nulls) are left out.
+    results_frame = DataFrame.from_records([
+        {column: value for column, value in record.items()
+         if _column_type(value) is not None}
+        for record in sorted(records, key=lambda r: r['model_id'])
+    ])
+    results_frame = results_frame[sorted(results_frame.columns)]
+
+    try:
+        table = pyarrow.Table.from_pandas(results_frame, preserve_index=False)
+    except (pyarrow.ArrowException, TypeError, ValueError) as error:
+        # Columns that mix types (like max_features) can't be written.
+        logger.warning("Couldn't write {}: {}".format(results_parquet, error))
+        return
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        RESULTS_LOG_METADATA: json.dumps(
+            [log_stat.st_size, 
+             log_stat.st_mtime_ns, 
+             log_stat.st_ino]).encode()
+    })
+
+    tmp_file = "{}.{}.tmp".format(results_parquet, os.getpid())
+    pyarrow.parquet.write_table(table, tmp_file)
+    os.replace(tmp_file, results_parquet)
+
+def _migrate_results_files(output_dir: str) -> None:
+    # Runs from older versions left one results file per model until the end
+    # of the run. Fold any that are left over into the log.
+    for file_name in sorted(os.listdir(output_dir)):
+        if re.match(r"^results_(\d+)\.json$", file_name) is None:
+            continue
+        with open(os.path.join(output_dir, file_name), 'r') as results_in:
+            _append_results(json.load(results_in), output_dir)
+        os.remove(os.path.join(output_dir, file_name))
+
+def _model_completed(model_id: int,
+                     grid_search_context: Dict[str, Any]) -> bool:
+    return model_id in \
+        _refresh_results_index(grid_search_context['output_dir'])
+
+def _part_file(model_id: int,
+               part: str,
+               grid_search_context: Dict[str, Any]) -> str:
+    return "{}/part_{}_{}.json".format(
+        grid_search_context['output_dir'], model_id, part)
+
+def _model_parts(grid_search_context: Dict[str, Any]) -> List[str]:
+    cross_validation = grid_search_context['cross_validation']
+    folds = range(cross_validation) if cross_validation is not None else []
+    return ["fold_{}".format(fold) for fold in folds] + ["final"]
+
+def _consolidate_model(params: Dict[str, Any],
+                       model_id: int,
+                       grid_search_context: Dict[str, Any]) -> None:
+    # Whichever task finishes a model's last part writes its results. Every
+    # other task returns early.
+    if _model_completed(model_id, grid_search_context):
+        return
+
+    part_files = [_part_file(model_id, part, grid_search_context)
+                  for part in _model_parts(grid_search_context)]
+    if not all(os.path.exists(part_file) for part_file in part_files):
+        return
+
+    try:
+        parts = []
+        for part_file in part_files:
+            with open(part_file, 'r') as part_in:
+                parts.append(json.load(part_in))
+    except FileNotFoundError:
+        # Another task consolidated this model (and deleted the parts) while
+        # these were being read.
+        return
+
+    fold_results, final_results = parts[:-1], parts[-1]
+    cv_results = _merge_cross_validation(fold_results) \
+                 if len(fold_results) > 0 else {}
+    if len(fold_results) > 0:
+        logger.info(
+            "Cross validation for model {} completed.".format(model_id))
+
+    _write_results(
+        _assemble_results(params, 
+                          model_id, 
+                          cv_results, 
+                          final_results, 
+                          grid_search_context),
+        grid_search_context)
+
+    # The parts are deleted _after_ the results are written. Two tasks can
+    # finish a model at the same time, and the other one may have deleted
+    # them already.
+    for part_file in part_files:
+        try:
+            os.remove(part_file)
+        except FileNotFoundError:
+            pass
+
+def _run_fold(estimator: BaseEstimator,
+              params: Dict[str, Any],
+              model_id: int,
+              fold: int,
+              grid_search_context: Dict[str, Any]) -> None:
+    part_file = _part_file(
+        model_id, "fold_{}".format(fold), grid_search_context)
+    
+    if _model_completed(model_id, grid_search_context) or \
+        os.path.exists(part_file):
+        logger.info("Model {} fold {} already exists, skipping.".format(
+            model_id, fold))
+        return
+
+    estimator.set_params(**params)
+
+    _write_json(part_file,
+                _cross_validate_fold(estimator,
+                                     model_id,
+                                     fold,
+                                     grid_search_context))
+    _consolidate_model(params, model_id, grid_search_context)
+
+def _run_final(estimator: BaseEstimator,
+               params: Dict[str, Any],
+               model_id: int,
+               grid_search_context: Dict[str, Any]) -> None:
+    part_file = _part_file(model_id, "final", grid_search_context)
+
+    if _model_completed(model_id, grid_search_context) or \
+        os.path.exists(part_file):
+        logger.info("Model {} already trained, skipping.".format(model_id))
+        return
+
+    param_str = ", ".join(
+           ["{}={}".format(param_name, param_value)
+            for param_name, param_value in params.items()])
+    logger.info("Training and evaluating model {}: {}"\
+                .format(model_id, param_str))
+
+    estimator.set_params(**params)
+
+    _write_json(part_file, 
+                _fit_final(estimator, model_id, grid_search_context))
+    _consolidate_model(params, model_id, grid_search_context)
+
+def _train_and_evaluate(estimator: BaseEstimator,
+                        params: Dict[str, Any],
+                        model_id: int,
+                        grid_search_context: Dict[str, Any]) -> None:
+    # Unpack the grid search context.
+    cross_validation = grid_search_context['cross_validation']
+    
+    param_str = ", ".join(
+           ["{}={}".format(param_name, param_value)
+            for param_name, param_value in params.items()])
+    logger.info("Training and evaluating model {}: {}"\
+                .format(model_id, param_str))
+        
+    # If the results file already exists, skip this pass.
+    if _model_completed(model_id, grid_search_context):
+        logger.info("Model {} already exists, skipping.".format(model_id))
+        return
+
+    # Initialize the estimator with the params.
+    estimator.set_params(**params)
+
+    cv_results = {}
+    # Perform cross validation if selected.
+    if cross_validation is not None:
+        logger.info("Cross validating model {} for {} folds.".format(
+            model_id, cross_validation))
+
+        cv_results = \
+            _cross_validate(estimator,
+                            model_id,
+                            grid_search_context)
+    
+    # Pruned models skip the final fit. They still get results, so they
+    # aren't retried when the search is resumed.
+    if cv_results.get("pruned", False):
+        pruned_results = _assemble_results(params,
+                                           model_id,
+                                           cv_results,
+                                           {},
+                                           grid_search_context)
+        pruned_results["model_file"] = None
+        _write_results(pruned_results, grid_search_context)
+        return
+
+    final_results = _fit_final(estimator, model_id, grid_search_context)
+    
+    # Write the results _after_ the model.
+    _write_results(
+        _assemble_results(params,
+                          model_id,
+                          cv_results,
+                          final_results,
+                          grid_search_context),
+        grid_search_context)
+
+def _chain_mode(estimator: BaseEstimator,
+                incremental: str,
+                metrics: List[str],
+                chain_param: str = "n_estimators") -> str:
+    warm_start = "warm_start" in estimator.get_params().keys()
+
+    # Regularization paths only warm start the solvers that converge to the
+    # same solution from any starting point.
+    if chain_param in PATH_PARAMS:
+        if incremental in {"auto", "path"} and warm_start and \
+            isinstance(estimator, PATH_ESTIMATORS):
+            return "path"
+        return "none"
+
+    # A staged chain is one fit, a warm started chain is one (smaller) fit per
+    # stage. Staged chains only have estimated training times for their
+    # stages, so they're only used when they're asked for.
+    methods, _ = _prediction_methods(estimator, metrics)
+    staged = all(hasattr(estimator, "staged_" + method) 
+                 for method in methods.values())
+
+    if incremental == "staged" and staged:
+        return "staged"
+    if incremental in {"auto", "warm_start"} and warm_start:
+        return "warm_start"
+    return "none"
+
+def _incremental_chains(estimator: BaseEstimator,
+                        models: List[Tuple[int, Dict[str, Any]]],
+                        incremental: str,
+                        metrics: List[str]) \
+                        -> Tuple[List[Tuple[str, 
+                                            List[Tuple[int, Dict[str, Any]]]]],
+                                 List[Tuple[int, Dict[str, Any]]]]:
+    # Models that only differ in a chain parameter are trained as one chain.
+    # Everything else is trained on its own.
+    chain_modes = {
+        chain_param: _chain_mode(estimator, incremental, metrics, chain_param)
+        for chain_param in WARM_START_PARAMS + sorted(PATH_PARAMS.keys())
+    }
+
+    groups = {}
+    for model_id, params in models:
+        chain_params = [chain_param 
+                        for chain_param, chain_mode in chain_modes.items()
+                        if chain_mode != "none" and 
+                           chain_param in params.keys()]
+        if len(chain_params) == 0 or "warm_start" in params.keys():
+            groups[(None, model_id)] = [(model_id, params)]
+            continue
+        chain_param = chain_params[0]
+        fixed_params = sorted((param_name, repr(param_value))
+                              for param_name, param_value in params.items()
+                              if param_name != chain_param)
+        groups.setdefault((chain_param, repr(fixed_params)), [])\
+              .append((model_id, params))
+
+    chains = []
+    singles = []
+    for (chain_param, _), group in groups.items():
+        if len(group) > 1:
+            # Ensembles grow from the fewest estimators, regularization paths
+            # start from the strongest regularization.
+            chains.append((
+                chain_modes[chain_param],
+                sorted(group, 
+                       key=lambda model: model[1][chain_param],
+                       reverse=PATH_PARAMS.get(chain_param, False))))
+        else:
+            singles.extend(group)
+    return chains, singles
+
+def _chain_str(chain: List[Tuple[int, Dict[str, Any]]]) -> str:
+    return ", ".join(str(model_id) for model_id, _ in chain)
+
+def _grow_stage(estimator: BaseEstimator,
+                X: DataFrame,
+                y: DataFrame,
+                grid_search_context: Dict[str, Any]) -> float:
+    # Stages that already have results are fit (so later stages can grow from
+    # them) but not evaluated or written again.
+    start = time()
+    estimator.fit(X, y, **grid_search_context['fit_params'])
+    return time() - start
+
+def _run_chain_fold(estimator: BaseEstimator,
+                    chain: List[Tuple[int, Dict[str, Any]]],
+                    fold: int,
+                    grid_search_context: Dict[str, Any],
+                    cumulative_time: bool = True) -> None:
+    part = "fold_{}".format(fold)
+    pending = _pending_stages(chain, part, grid_search_context)
+    if not any(pending):
+        logger.info("Chain {} fold {} already exists, skipping.".format(
+            _chain_str(chain), fold))
+        return
+
+    _, X_fold_train, y_fold_train, _, _ = \
+        _fold_frames(grid_search_context, fold)
+
+    # Every stage up to the last pending one is fit, since each stage grows
+    # the one before it.
+    last_stage = max(stage for stage, is_pending in enumerate(pending)
+                     if is_pending)
+    warm_start = estimator.get_params()['warm_start']
+    estimator.set_params(warm_start=True)
+    chain_training_time = 0.0
+    for stage, (model_id, params) in enumerate(chain[:last_stage + 1]):
+        estimator.set_params(**params)
+        if not pending[stage]:
+            chain_training_time += _grow_stage(estimator,
+                                               X_fold_train,
+                                               y_fold_train,
+                                               grid_search_context)
+            continue
+
+        fold_results = _cross_validate_fold(estimator,
+                                            model_id,
+                                            fold,
+                                            grid_search_context)
+        # The training time of a stage includes the stages it grew from.
+        chain_training_time += \
+            fold_results["cross_validation_training_time_total"]
+        if cumulative_time:
+            fold_results["cross_validation_training_time_total"] = \
+                chain_training_time
+
+        _write_json(_part_file(model_id, part, grid_search_context),
+                    fold_results)
+        _consolidate_model(params, model_id, grid_search_context)
+    
+    estimator.set_params(warm_start=warm_start)
+
+def _run_chain_final(estimator: BaseEstimator,
+                     chain: List[Tuple[int, Dict[str, Any]]],
+                     grid_search_context: Dict[str, Any],
+                     cumulative_time: bool = True) -> None:
+    pending = _pending_stages(chain, "final", grid_search_context)
+    if not any(pending):
+        logger.info("Chain {} already trained, skipping.".format(
+            _chain_str(chain)))
+        return
+
+    logger.info("Training and evaluating chain {}.".format(_chain_str(chain)))
+
+    last_stage = max(stage for stage, is_pending in enumerate(pending)
+                     if is_pending)
+    # The saved models get the warm_start they had before the chain, so they
+    # refit from scratch like any other model.
+    warm_start = estimator.get_params()['warm_start']
+    estimator.set_params(warm_start=True)
+    chain_training_time = 0.0
+    for stage, (model_id, params) in enumerate(chain[:last_stage + 1]):
+        estimator.set_params(**params)
+        if not pending[stage]:
+            chain_training_time += _grow_stage(
+                estimator, 
+                *_training_frames(grid_search_context), 
+                grid_search_context)
+            continue
+
+        final_results = _fit_final(estimator, 
+                                   model_id, 
+                                   grid_search_context,
+                                   saved_params={"warm_start": warm_start})
+        chain_training_time += final_results["training_time_total"]
+        if cumulative_time:
+            final_results["training_time_total"] = chain_training_time
+
+        _write_json(_part_file(model_id, "final", grid_search_context),
+                    final_results)
+        _consolidate_model(params, model_id, grid_search_context)
+
+    estimator.set_params(warm_start=warm_start)
+
+def _pending_stages(chain: List[Tuple[int, Dict[str, Any]]],
+                    part: str,
+                    grid_search_context: Dict[str, Any]) -> List[bool]:
+    return [
+        not _model_completed(model_id, grid_search_context) and 
+        not os.path.exists(_part_file(model_id, part, grid_search_context))
+        for model_id, _ in chain
+    ]
+
+def _run_staged_fold(estimator: BaseEstimator,
+                     chain: List[Tuple[int, Dict[str, Any]]],
+                     fold: int,
+                     grid_search_context: Dict[str, Any]) -> None:
+    part = "fold_{}".format(fold)
+    pending = _pending_stages(chain, part, grid_search_context)
+    if not any(pending):
+        logger.info("Chain {} fold {} already exists, skipping.".format(
+            _chain_str(chain), fold))
+        return
+
+    cv_train, X_fold_train, y_fold_train, X_fold_test, y_fold_test = \
+        _fold_frames(grid_search_context, fold)
+
+    # The whole chain is one fit with the biggest model.
+    estimator.set_params(**chain[-1][1])
+    logger.info("Training chain {} on cross validation training set {}."\
+        .format(_chain_str(chain), fold))
+    fit_time = _grow_stage(estimator,
+                           X_fold_train,
+                           y_fold_train,
+                           grid_search_context)
+    
+    stages = {params['n_estimators']: (model_id, params)
+              for (model_id, params), is_pending in zip(chain, pending)
+              if is_pending}
+    logger.info("Evaluating chain {} on cross validation fold {}.".format(
+        _chain_str(chain), fold))
+    training_results = _evaluate_stages(estimator,
+                                        *_scoring_sample(X_fold_train,
+                                                         y_fold_train,
+                                                         cv_train,
+                                                         grid_search_context),
+                                        list(stages.keys()),
+                                        grid_search_context,
+                                        "cross_validation_training")
+    validation_results = _evaluate_stages(estimator,
+                                          X_fold_test,
+                                          y_fold_test,
+                                          list(stages.keys()),
+                                          grid_search_context,
+                                          "cross_validation")
+
+    for n_estimators, (model_id, params) in stages.items():
+        _write_json(_part_file(model_id, part, grid_search_context), {
+            # Boosting stages take about the same time each, so the training
+            # time is estimated by prorating the fit time by the number of
+            # stages. The measured time is the fit of the whole chain.
+            "cross_validation_training_time_total": 
+                fit_time * n_estimators / chain[-1][1]['n_estimators'],
+            "cross_validation_training_chain_time_total": fit_time,
+            **training_results[n_estimators],
+            **validation_results[n_estimators]
+        })
+        _consolidate_model(params, model_id, grid_search_context)
+
+def _run_staged_final(estimator: BaseEstimator,
+                      chain: List[Tuple[int, Dict[str, Any]]],
+                      grid_search_context: Dict[str, Any]) -> None:
+    output_dir = grid_search_context['output_dir']
+    validation_file = grid_search_context['validation_file']
+
+    pending = _pending_stages(chain, "final", grid_search_context)
+    if not any(pending):
+        logger.info("Chain {} already trained, skipping.".format(
+            _chain_str(chain)))
+        return
+
+    logger.info("Training and evaluating chain {}.".format(_chain_str(chain)))
+    X_train, y_train = _training_frames(grid_search_context)
+    estimator.set_params(**chain[-1][1])
+    fit_time = _grow_stage(estimator, X_train, y_train, grid_search_context)
+    logger.info("Chain {} trained in {:.3f} seconds.".format(
+        _chain_str(chain), fit_time))
+
+    stages = {params['n_estimators']: (model_id, params)
+              for (model_id, params), is_pending in zip(chain, pending)
+              if is_pending}
+    training_results = _evaluate_stages(estimator,
+                                        *_scoring_sample(X_train,
+                                                         y_train,
+                                                         None,
+                                                         grid_search_context),
+                                        list(stages.keys()),
+                                        grid_search_context,
+                                        "training")
+    validation_results = \
+        _evaluate_stages(estimator,
+                         _get_frame(grid_search_context, 'X_validation'),
+                         _get_frame(grid_search_context, 'y_validation'),
+                         list(stages.keys()),
+                         grid_search_context,
+                         "validation") \
+        if validation_file is not None else {}
+
+    for n_estimators, (model_id, params) in stages.items():
+        model_file = "{}/model_{}.pkl".format(output_dir, model_id)
+        logger.info("Writing estimator for model {} to {}."\
+                    .format(model_id, model_file))
+        persistence_results = _dump_model(
+            _truncate_ensemble(estimator, n_estimators), 
+            model_file, 
+            grid_search_context)
+
+        _write_json(_part_file(model_id, "final", grid_search_context), {
+            "training_time_total": 
+                fit_time * n_estimators / chain[-1][1]['n_estimators'],
+            "training_chain_time_total": fit_time,
+            "training_time_estimated": True,
+            **training_results[n_estimators],
+            **validation_results.get(n_estimators, {}),
+            **_benchmark_model(_truncate_ensemble(estimator, n_estimators),
+                               grid_search_context),
+            **persistence_results
+        })
+        _consolidate_model(params, model_id, grid_search_context)
+
+def _chain_tasks(estimator: BaseEstimator,
+                 chain: List[Tuple[int, Dict[str, Any]]],
+                 grid_search_context: Dict[str, Any],
+                 completed_parts: Set[Tuple[int, str]] = set(),
+                 chain_mode: str = "warm_start"):
+    # A chain is scheduled like a model, with one task per fold and one for 
+    # the final fit.
+    run_fold = _run_staged_fold if chain_mode == "staged" \
+               else _run_chain_fold
+    run_final = _run_staged_final if chain_mode == "staged" \
+                else _run_chain_final
+    # Stages of a regularization path are each a full fit (that starts from
+    # a better place), so their training time isn't cumulative.
+    run_kwargs = {"cumulative_time": False} if chain_mode == "path" else {}
+    cross_validation = grid_search_context['cross_validation']
+    parts = ["fold_{}".format(fold) for fold in range(cross_validation)] \
+            if cross_validation is not None else []
+    for part in parts + ["final"]:
+        if all((model_id, part) in completed_parts for model_id, _ in chain):
+            continue
+        if part == "final":
+            yield delayed(run_final)(clone(estimator),
+                                     chain,
+                                     grid_search_context,
+                                     **run_kwargs)
+        else:
+            yield delayed(run_fold)(clone(estimator),
+                                    chain,
+                                    int(part[len("fold_"):]),
+                                    grid_search_context,
+                                    **run_kwargs)
+
+def _scan_output_dir(output_dir: str) \
+    -> Tuple[Set[int], Set[Tuple[int, str]]]:
+    # The completed models come from the results log, and one pass over the
+    # output directory finds every completed part of a model that's still in
+    # progress.
+    completed_models = set(_refresh_results_index(output_dir).keys())
+    completed_parts = set()
+    for file_name in os.listdir(output_dir):
+        part_match = re.match(r"^part_(\d+)_(\w+)\.json$", file_name)
+        if part_match:
+            completed_parts.add(
+                (int(part_match.group(1)), part_match.group(2)))
+    return completed_models, completed_parts
+
+def _model_tasks(estimator: BaseEstimator,
+                 params: Dict[str, Any],
+                 model_id: int,
+                 grid_search_context: Dict[str, Any],
+                 completed_parts: Set[Tuple[int, str]] = set()):
+    # Pruning needs the folds of a model to run in order, so each model is
+    # one task.
+    if grid_search_context.get('pruning') is not None:
+        yield delayed(_train_and_evaluate)(clone(estimator),
+                                           params,
+                                           model_id,
+                                           grid_search_context)
+        return
+
+    # Each cross validation fold is its own task, as is the fit on the full
+    # training set. The last one of these to finish writes the results.
+    cross_validation = grid_search_context['cross_validation']
+    if cross_validation is not None:
+        for fold in range(cross_validation):
+            if (model_id, "fold_{}".format(fold)) in completed_parts:
+                continue
+            yield delayed(_run_fold)(clone(estimator),
+                                     params,
+                                     model_id,
+                                     fold,
+                                     grid_search_context)
+    if (model_id, "final") not in completed_parts:
+        yield delayed(_run_final)(clone(estimator),
+                                  params,
+                                  model_id,
+                                  grid_search_context)
+
+def _run_models(estimator: BaseEstimator,
+                models: List[Tuple[int, Dict[str, Any]]],
+                grid_search_context: Dict[str, Any],
+                n_jobs: int) -> None:
+    output_dir = grid_search_context['output_dir']
+
+    # Completed models are filtered out here, before anything is sent to a
+    # worker.
+    completed_models, completed_parts = _scan_output_dir(output_dir)
+    pending_models = [(model_id, params) 
+                      for model_id, params in models
+                      if model_id not in completed_models]
+    logger.info("Skipping {} completed models. {} models to run.".format(
+        len(models) - len(pending_models), len(pending_models)))
+
+    # Models with every part completed were interrupted before their results
+    # were written, and just need to be consolidated.
+    model_parts = _model_parts(grid_search_context)
+    for model_id, params in pending_models:
+        if all((model_id, part) in completed_parts for part in model_parts):
+            _consolidate_model(params, model_id, grid_search_context)
+
+    # Pruning runs each model on its own, so it doesn't chain.
+    incremental = grid_search_context.get('incremental', "none") \
+                  if grid_search_context.get('pruning') is None else "none"
+    chains, single_models = _incremental_chains(
+        estimator, pending_models, incremental, grid_search_context['metrics'])
+    for chain_mode, chain in chains:
+        logger.info("Training models {} as one {} chain.".format(
+            _chain_str(chain), chain_mode))
+
+    # Tasks are scheduled at the (model, fold) level rather than per model so
+    # every job stays busy regardless of the shape of the grid.
+    Parallel(n_jobs=n_jobs)(
+        [task
+         for chain_mode, chain in chains
+         for task in _chain_tasks(estimator,
+                                  chain,
+                                  grid_search_context,
+                                  completed_parts,
+                                  chain_mode)] +
+        [task
+         for model_id, params in single_models
+         for task in _model_tasks(estimator,
+                                  params,
+                                  model_id,
+                                  grid_search_context,
+                                  completed_parts)])
+
+def _read_model_results(model_ids: List[int],
+                        grid_search_context: Dict[str, Any]) \
+                        -> Dict[int, Dict[str, Any]]:
+    output_dir = grid_search_context['output_dir']
+    index = _refresh_results_index(output_dir)
+
+    model_results = {}
+    with open(_results_file(output_dir), 'rb') as results_in:
+        for model_id in model_ids:
+            results_in.seek(index[model_id])
+            model_results[model_id] = json.loads(results_in.readline().decode())
+    return model_results
+
+def _selection_score(results: Dict[str, Any],
+                     metric: str,
+                     grid_search_context: Dict[str, Any]) -> float:
+    # Models are compared on the cross validation score if there is one, then
+    # the validation score, then the training score. All of the metrics are
+    # greater-is-better.
+    if grid_search_context['cross_validation'] is not None:
+        prefix = "cross_validation"
+    elif grid_search_context['validation_file']:
+        prefix = "validation"
+    else:
+        prefix = "training"
+    
+    score = results[prefix + "_" + metric]
+    return score if not np.isnan(score) else -np.inf
+
+def _halving_schedule(n_candidates: int,
+                      halving: Dict[str, Any],
+                      max_resource: int) -> List[Tuple[int, int]]:
+    # Each rung is the number of candidates and the resource they get. The
+    # candidates are cut by the factor and the resource is raised by it until
+    # one candidate is left or the resource is maxed out.
+    factor = halving.get('factor', 3)
+    n_rung_candidates = n_candidates
+    resource = halving['min_resource']
+    
+    schedule = []
+    while True:
+        resource = min(resource, max_resource)
+        schedule.append((n_rung_candidates, resource))
+        if n_rung_candidates == 1 or resource >= max_resource:
+            break
+        n_rung_candidates = int(math.ceil(n_rung_candidates / factor))
+        resource = resource * factor
+
+    return schedule
+
+def _halving_max_resource(halving: Dict[str, Any],
+                          grid_search_context: Dict[str, Any]) -> int:
+    if halving['resource'] == "n_samples":
+        return halving.get('max_resource', 
+            _get_frame(grid_search_context, 'X_train').shape[0])
+    return halving['max_resource']
+
+def _run_halving(estimator: BaseEstimator,
+                 candidates: List[Dict[str, Any]],
+                 halving: Dict[str, Any],
+                 grid_search_context: Dict[str, Any],
+                 n_jobs: int) -> None:
+    resource = halving['resource']
+    metric = halving.get('metric', grid_search_context['metrics'][0])
+    schedule = _halving_schedule(
+        len(candidates),
+        halving,
+        _halving_max_resource(halving, grid_search_context))
+
+    # Rungs subsampling the training set use nested prefixes of the same
+    # permutation of the rows.
+    num_rows = _get_frame(grid_search_context, 'X_train').shape[0]
+    row_order = np.random.RandomState(halving.get('random_state', 0))\
+                         .permutation(num_rows)
+
+    # The model ids are deterministic so an interrupted search resumes where
+    # it left off.
+    survivors = list(range(len(candidates)))
+    for rung, (n_rung_candidates, rung_resource) in enumerate(schedule):
+        survivors = survivors[:n_rung_candidates]
+        model_ids = {candidate: rung * len(candidates) + candidate
+                     for candidate in survivors}
+        
+        logger.info("Halving rung {}: {} candidates with {} = {}.".format(
+            rung, len(survivors), resource, rung_resource))
+
+        rung_context = {
+            **grid_search_context,
+            "model_fields": {
+                model_ids[candidate]: {
+                    "rung": rung,
+                    "candidate_id": candidate,
+                    "halving_resource": rung_resource
+                } for candidate in survivors
+            }
+        }
+        
+        if resource == "n_samples":
+            rung_context["training_rows"] = \
+                np.sort(row_order[:rung_resource])
+            rung_context["training_rows_key"] = \
+                joblib.hash(rung_context["training_rows"])
+            models = [(model_ids[candidate], candidates[candidate])
+                      for candidate in survivors]
+        else:
+            models = [(model_ids[candidate], 
+                       {**candidates[candidate], resource: rung_resource})
+                      for candidate in survivors]
+
+        _run_models(estimator, models, rung_context, n_jobs)
+
+        # Rank the candidates on the rung's results, best first.
+        rung_results = _read_model_results(
+            [model_ids[candidate] for candidate in survivors], rung_context)
+        survivors = sorted(
+            survivors,
+            key=lambda candidate: _selection_score(
+                rung_results[model_ids[candidate]], metric, rung_context),
+            reverse=True)
+
+    logger.info("Halving search completed. Best candidate is {}.".format(
+        survivors[0]))
 
-def _dry_run(grid: ParameterGrid,
-             grid_search_context: Dict[str, Any]):
+def _dry_run(grid: List[Dict[str, Any]],
+             grid_search_context: Dict[str, Any],
+             schedule: List[Tuple[int, int]] = None):
     # Unpack the grid search context.
     output_dir = grid_search_context['output_dir']
     fit_params = grid_search_context['fit_params']
@@ -304,6 +2323,486 @@ def _dry_run(grid: ParameterGrid,
             for param_name, param_value in params.items()])
         logger.info("Dry run: Model {} trained and evaluated with {}.".format(
             model_id, param_str))
+    if schedule is not None:
+        for rung, (n_rung_candidates, rung_resource) in enumerate(schedule):
+            logger.info(
+                "Dry run: Halving rung {} trains {} candidates with {}."\
+                .format(rung, n_rung_candidates, rung_resource))
+
+def _make_distribution(param_name: str, declaration: Any) -> Any:
+    # Lists are sampled uniformly, dicts declare a scipy distribution.
+    if isinstance(declaration, list):
+        return declaration
+    if declaration.get('distribution') not in DISTRIBUTIONS:
+        logger.critical("{} has an unknown distribution. Use one of {}."\
+            .format(param_name, ", ".join(sorted(DISTRIBUTIONS))))
+        raise ValueError("{} has an unknown distribution.".format(param_name))
+    return DISTRIBUTIONS[declaration['distribution']](declaration)
+
+def _to_python(value: Any) -> Any:
+    # Sampled values need to be plain python so they can go in the results.
+    return value.item() if isinstance(value, np.generic) else value
+
+def _sobol_samples(n_iter: int,
+                   n_dims: int,
+                   random_state: int) -> np.ndarray:
+    if n_dims > len(SOBOL_DIRECTIONS) + 1:
+        logger.critical("Sobol sampling supports up to {} parameters.".format(
+            len(SOBOL_DIRECTIONS) + 1))
+        raise ValueError("Sobol sampling supports up to {} parameters."\
+                         .format(len(SOBOL_DIRECTIONS) + 1))
+
+    directions = [[1 << (SOBOL_BITS - 1 - bit) for bit in range(SOBOL_BITS)]]
+    for degree, coefficients, initial in SOBOL_DIRECTIONS[:n_dims - 1]:
+        dim_directions = [m << (SOBOL_BITS - 1 - bit) 
+                          for bit, m in enumerate(initial)]
+        for bit in range(degree, SOBOL_BITS):
+            direction = dim_directions[bit - degree] ^ \
+                        (dim_directions[bit - degree] >> degree)
+            for k in range(1, degree):
+                if (coefficients >> (degree - 1 - k)) & 1:
+                    direction ^= dim_directions[bit - k]
+            dim_directions.append(direction)
+        directions.append(dim_directions)
+
+    # The sequence is scrambled with a random digital shift, which keeps its
+    # stratification.
+    rng = np.random.RandomState(random_state)
+    point = [int(shift) 
+             for shift in rng.randint(0, 2**SOBOL_BITS, size=n_dims)]
+    samples = []
+    for index in range(n_iter):
+        samples.append(point)
+        # The points are generated in Gray code order, so each one flips the
+        # direction of the lowest zero bit of the index.
+        bit = 0
+        while (index >> bit) & 1:
+            bit += 1
+        point = [coordinate ^ directions[dim][bit]
+                 for dim, coordinate in enumerate(point)]
+    return np.array(samples, dtype=float) / 2**SOBOL_BITS
+
+def _unit_samples(sampler: str, 
+                  n_iter: int,
+                  n_dims: int,
+                  random_state: int) -> np.ndarray:
+    if sampler == "sobol":
+        return _sobol_samples(n_iter, n_dims, random_state)
+    
+    # Latin hypercube: each dimension gets exactly one sample in each of the
+    # n_iter equal width strata, in a random order.
+    rng = np.random.RandomState(random_state)
+    return np.column_stack([
+        (rng.permutation(n_iter) + rng.uniform(size=n_iter)) / n_iter
+        for _ in range(n_dims)])
+
+def _declared_distributions(search_params: Dict[str, Any]) \
+    -> Tuple[List[str], Dict[str, Any]]:
+    param_names = sorted(search_params['param_distributions'].keys())
+    distributions = {
+        param_name: _make_distribution(
+            param_name, search_params['param_distributions'][param_name])
+        for param_name in param_names
+    }
+    return param_names, distributions
+
+def _decode_unit_sample(unit_sample: np.ndarray,
+                        param_names: List[str],
+                        distributions: Dict[str, Any]) -> Dict[str, Any]:
+    # Points on the unit hypercube are mapped through each distribution's
+    # inverse CDF.
+    candidate = {}
+    for param_name, u in zip(param_names, unit_sample):
+        distribution = distributions[param_name]
+        if isinstance(distribution, list):
+            candidate[param_name] = distribution[
+                min(int(u * len(distribution)), len(distribution) - 1)]
+        else:
+            value = distribution.ppf(u)
+            # Discrete distributions give whole numbers as floats.
+            if isinstance(distribution.dist, stats.rv_discrete):
+                value = int(value)
+            candidate[param_name] = _to_python(value)
+    return candidate
+
+def _encode_candidate(candidate: Dict[str, Any],
+                      param_names: List[str],
+                      distributions: Dict[str, Any]) -> np.ndarray:
+    # The inverse of _decode_unit_sample, up to rounding.
+    unit_sample = []
+    for param_name in param_names:
+        distribution = distributions[param_name]
+        value = candidate[param_name]
+        if isinstance(distribution, list):
+            unit_sample.append(
+                (distribution.index(value) + 0.5) / len(distribution))
+        else:
+            unit_sample.append(distribution.cdf(value))
+    return np.array(unit_sample)
+
+def _sample_candidates(search_params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    n_iter = search_params['n_iter']
+    sampler = search_params.get('sampler', 'random')
+    # The samples are seeded so the model ids are the same when a search is
+    # resumed.
+    random_state = search_params.get('random_state', 0)
+
+    if sampler not in SAMPLERS:
+        logger.critical("{} is not an available sampler. Use one of {}."\
+            .format(sampler, ", ".join(sorted(SAMPLERS))))
+        raise ValueError("{} is not an available sampler.".format(sampler))
+
+    param_names, distributions = _declared_distributions(search_params)
+
+    if sampler == "random":
+        candidates = list(ParameterSampler(distributions, 
+                                           n_iter, 
+                                           random_state=random_state))
+    else:
+        unit_samples = _unit_samples(
+            sampler, n_iter, len(param_names), random_state)
+        candidates = [
+            _decode_unit_sample(unit_sample, param_names, distributions)
+            for unit_sample in unit_samples
+        ]
+
+    return [{param_name: _to_python(value) 
+             for param_name, value in candidate.items()}
+            for candidate in candidates]
+
+def _expected_improvement(mean: np.ndarray,
+                          std: np.ndarray,
+                          best: float,
+                          xi: float) -> np.ndarray:
+    improvement = mean - best - xi
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = improvement / std
+        expected_improvement = \
+            improvement * stats.norm.cdf(z) + std * stats.norm.pdf(z)
+    expected_improvement[std == 0.0] = 0.0
+    return expected_improvement
+
+def _suggest_candidate(observed: List[Tuple[Dict[str, Any], float]],
+                       pending: List[Dict[str, Any]],
+                       param_names: List[str],
+                       distributions: Dict[str, Any],
+                       bayesian: Dict[str, Any],
+                       rng: np.random.RandomState) -> Dict[str, Any]:
+    X = np.array([_encode_candidate(candidate, param_names, distributions)
+                  for candidate, _ in observed])
+    y = np.array([score for _, score in observed])
+    # Scores that couldn't be computed are treated as the worst observed.
+    finite = np.isfinite(y)
+    y[~finite] = y[finite].min() if finite.any() else 0.0
+
+    # Candidates that are still training are "constant liars": they're added
+    # with the mean score so the next suggestion moves away from them instead
+    # of waiting for them to finish.
+    if len(pending) > 0:
+        X = np.vstack([X] + [
+            _encode_candidate(candidate, param_names, distributions)
+            for candidate in pending])
+        y = np.concatenate([y, np.repeat(y.mean(), len(pending))])
+
+    surrogate = GaussianProcessRegressor(
+        kernel=ConstantKernel() * Matern(nu=2.5) + WhiteKernel(),
+        normalize_y=True,
+        n_restarts_optimizer=2,
+        random_state=rng)
+    surrogate.fit(X, y)
+
+    # Random candidates are decoded and re-encoded so discrete and list
+    # parameters are snapped to values that can actually be trained.
+    candidates = [
+        _decode_unit_sample(unit_sample, param_names, distributions)
+        for unit_sample in rng.uniform(
+            size=(bayesian.get('n_candidates', 1000), len(param_names)))
+    ]
+    X_candidates = np.array([
+        _encode_candidate(candidate, param_names, distributions)
+        for candidate in candidates])
+    
+    mean, std = surrogate.predict(X_candidates, return_std=True)
+    expected_improvement = _expected_improvement(
+        mean, std, y.max(), bayesian.get('xi', 0.01))
+    return candidates[int(np.argmax(expected_improvement))]
+
+def _read_suggestions(output_dir: str) -> Dict[int, Dict[str, Any]]:
+    suggestions_file = "{}/suggestions.json".format(output_dir)
+    suggestions = {}
+    if os.path.exists(suggestions_file):
+        with open(suggestions_file, 'r') as suggestions_in:
+            for line in suggestions_in:
+                suggestion = json.loads(line)
+                suggestions[suggestion['model_id']] = suggestion['params']
+    return suggestions
+
+def _write_suggestion(output_dir: str,
+                      model_id: int,
+                      params: Dict[str, Any]) -> None:
+    with open("{}/suggestions.json".format(output_dir), 'a') as suggestions_out:
+        suggestions_out.write(
+            json.dumps({"model_id": model_id, "params": params}) + "\n")
+
+def _run_bayesian(estimator: BaseEstimator,
+                  initial_candidates: List[Dict[str, Any]],
+                  search_params: Dict[str, Any],
+                  grid_search_context: Dict[str, Any],
+                  n_jobs: int) -> None:
+    output_dir = grid_search_context['output_dir']
+    bayesian = search_params.get('bayesian', {})
+    metric = bayesian.get('metric', grid_search_context['metrics'][0])
+    n_iter = search_params['n_iter']
+    param_names, distributions = _declared_distributions(search_params)
+    rng = np.random.RandomState(search_params.get('random_state', 0))
+
+    # On a restart the surrogate is rebuilt from the models that completed,
+    # and the suggestions that didn't complete are trained first.
+    suggestions = _read_suggestions(output_dir)
+    completed_models, _ = _scan_output_dir(output_dir)
+    completed_results = _read_model_results(
+        sorted(completed_models & set(suggestions.keys())), 
+        grid_search_context)
+    observed = {
+        model_id: (suggestions[model_id], 
+                   _selection_score(results, metric, grid_search_context))
+        for model_id, results in completed_results.items()
+    }
+    resumed = [model_id for model_id in sorted(suggestions.keys())
+               if model_id not in observed]
+    next_model_id = max(suggestions.keys()) + 1 if len(suggestions) > 0 else 0
+    logger.info("Bayesian search: {} models completed, {} resumed.".format(
+        len(observed), len(resumed)))
+
+    n_workers = n_jobs if n_jobs > 0 else max(1, cpu_count() + 1 + n_jobs)
+    # A single worker runs in a thread, so it's the same as running serially.
+    executor = ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 \
+               else ThreadPoolExecutor(max_workers=1)
+    
+    in_flight = {}
+    with executor:
+        while len(observed) < n_iter:
+            # A new suggestion is made as soon as a worker is free, rather than
+            # waiting for a whole batch to finish.
+            while len(in_flight) < n_workers and \
+                len(observed) + len(in_flight) < n_iter:
+                if len(resumed) > 0:
+                    model_id = resumed.pop(0)
+                    params = suggestions[model_id]
+                else:
+                    model_id = next_model_id
+                    next_model_id += 1
+                    if model_id < len(initial_candidates):
+                        params = initial_candidates[model_id]
+                    elif len(observed) == 0:
+                        # There's nothing to fit the surrogate to until the
+                        # first model finishes.
+                        params = _decode_unit_sample(
+                            rng.uniform(size=len(param_names)),
+                            param_names,
+                            distributions)
+                    else:
+                        params = _suggest_candidate(
+                            list(observed.values()),
+                            [suggestions[m] for m in in_flight.values()],
+                            param_names,
+                            distributions,
+                            bayesian,
+                            rng)
+                    suggestions[model_id] = params
+                    _write_suggestion(output_dir, model_id, params)
+                
+                future = executor.submit(_train_and_evaluate,
+                                         clone(estimator),
+                                         params,
+                                         model_id,
+                                         grid_search_context)
+                in_flight[future] = model_id
+
+            done, _ = wait(list(in_flight.keys()), return_when=FIRST_COMPLETED)
+            for future in done:
+                model_id = in_flight.pop(future)
+                # Raise any exception from the worker.
+                future.result()
+                results = _read_model_results([model_id], 
+                                              grid_search_context)[model_id]
+                observed[model_id] = (
+                    suggestions[model_id],
+                    _selection_score(results, metric, grid_search_context))
+                logger.info("Bayesian search: model {} scored {:.5f}. "\
+                    .format(model_id, observed[model_id][1]) + 
+                    "{} of {} models completed.".format(
+                        len(observed), n_iter))
+
+    # n_iter is validated, but there's no best model to report without any.
+    if len(observed) == 0:
+        logger.info("Bayesian search completed without any models.")
+        return
+    best_model_id = max(observed.keys(), key=lambda m: observed[m][1])
+    logger.info("Bayesian search completed. Best model is {}.".format(
+        best_model_id))
+
+def _validate_benchmark(search_params: Dict[str, Any],
+                        search_params_file: str) -> None:
+    benchmark = search_params['benchmark']
+    for batch_size in benchmark.get('batch_sizes', BENCHMARK_BATCH_SIZES):
+        if batch_size != "full" and \
+            (not isinstance(batch_size, int) or batch_size < 1):
+            logger.critical("The benchmark batch sizes in {} must be "\
+                            "positive integers or \"full\".".format(
+                                search_params_file))
+            raise ValueError("{} is not a benchmark batch size.".format(
+                batch_size))
+
+    if benchmark.get('trials', 20) < 1:
+        logger.critical("The benchmark in {} needs at least one trial."\
+                        .format(search_params_file))
+        raise ValueError("The benchmark needs at least one trial.")
+
+    if benchmark.get('method', "predict") not in BENCHMARK_METHODS:
+        logger.critical("The benchmark method in {} must be one of {}."\
+                        .format(search_params_file, 
+                                ", ".join(sorted(BENCHMARK_METHODS))))
+        raise ValueError("{} is not a benchmark method.".format(
+            benchmark['method']))
+
+def _validate_persistence(search_params: Dict[str, Any],
+                          search_params_file: str) -> None:
+    persistence = search_params['persistence']
+    compress = persistence.get('compress')
+    if compress is not None and compress not in COMPRESSORS:
+        logger.critical("{} in {} is not an available compressor. Use one "\
+                        "of {}.".format(compress, 
+                                        search_params_file,
+                                        ", ".join(sorted(COMPRESSORS))))
+        raise ValueError(
+            "{} is not an available compressor.".format(compress))
+
+    # A bad level would only fail in joblib.dump, after the model is trained.
+    level = persistence.get('level', 3)
+    if isinstance(level, bool) or not isinstance(level, int) or \
+        not 0 <= level <= 9:
+        logger.critical("The compression level in {} must be an integer "\
+                        "from 0 to 9.".format(search_params_file))
+        raise ValueError("{} is not a compression level.".format(level))
+    
+    if compress is not None and persistence.get('mmap', False):
+        logger.critical("Compressed models in {} can't be memory mapped."\
+                        .format(search_params_file))
+        raise ValueError("Compressed models can't be memory mapped.")
+
+def _validate_cv(search_params: Dict[str, Any],
+                 search_params_file: str,
+                 cross_validation: int,
+                 training_columns: List[str],
+                 target_col: str) -> None:
+    cv = search_params['cv']
+    if cross_validation is None:
+        logger.critical("The cv settings in {} require cross validation."\
+                        .format(search_params_file))
+        raise ValueError("The cv settings require cross validation.")
+
+    splitter = cv.get('splitter', "kfold")
+    if splitter not in SPLITTERS:
+        logger.critical("The cv splitter in {} must be one of {}.".format(
+            search_params_file, ", ".join(sorted(SPLITTERS))))
+        raise ValueError("{} is not a cv splitter.".format(splitter))
+
+    if splitter == "group" and \
+        (cv.get('groups') not in training_columns or 
+         cv.get('groups') == target_col):
+        logger.critical("The group splitter in {} needs a \"groups\" "\
+                        "column.".format(search_params_file))
+        raise ValueError("The group splitter needs a \"groups\" column.")
+
+    if splitter == "group" and cv.get('shuffle', False):
+        logger.critical("The group splitter in {} can't shuffle.".format(
+            search_params_file))
+        raise ValueError("The group splitter can't shuffle.")
+
+    fold_cache = cv.get('fold_cache', 1)
+    if not isinstance(fold_cache, int) or fold_cache < 0:
+        logger.critical("The cv fold_cache in {} must be a non-negative "\
+                        "integer.".format(search_params_file))
+        raise ValueError("{} is not a fold cache size.".format(fold_cache))
+
+def _validate_training_scoring_sample(search_params: Dict[str, Any],
+                                     search_params_file: str) -> None:
+    size = search_params['training_scoring_sample'].get('size')
+    if not isinstance(size, int) or size < 1:
+        logger.critical("The training_scoring_sample in {} needs a positive "\
+                        "integer \"size\".".format(search_params_file))
+        raise ValueError("{} is not a training scoring sample size.".format(
+            size))
+
+def _validate_transformer_cache(search_params: Dict[str, Any],
+                                search_params_file: str) -> None:
+    max_bytes = search_params['transformer_cache'].get(
+        'max_bytes', TRANSFORMER_CACHE_MAX_BYTES)
+    if not isinstance(max_bytes, int) or max_bytes < 1:
+        logger.critical("The transformer cache max_bytes in {} must be a "\
+                        "positive integer.".format(search_params_file))
+        raise ValueError("{} is not a transformer cache size.".format(
+            max_bytes))
+
+def _validate_pruning(search_params: Dict[str, Any],
+                      search_params_file: str,
+                      cross_validation: int) -> None:
+    pruning = search_params['pruning']
+    if pruning.get('method') not in PRUNERS:
+        logger.critical("The pruning method in {} must be one of {}."\
+            .format(search_params_file, ", ".join(sorted(PRUNERS))))
+        raise ValueError("The pruning method in {} must be one of {}."\
+            .format(search_params_file, ", ".join(sorted(PRUNERS))))
+
+    if pruning['method'] == "threshold" and "threshold" not in pruning:
+        logger.critical(
+            "The pruning in {} needs a \"threshold\" field."\
+            .format(search_params_file))
+        raise ValueError(
+            "The pruning in {} needs a \"threshold\" field."\
+            .format(search_params_file))
+
+    if pruning.get('metric', search_params['scoring'][0]) not in \
+        search_params['scoring']:
+        logger.critical("The pruning metric {} isn't in scoring.".format(
+            pruning['metric']))
+        raise ValueError("The pruning metric {} isn't in scoring.".format(
+            pruning['metric']))
+
+    if cross_validation is None:
+        logger.critical("Pruning requires cross validation.")
+        raise ValueError("Pruning requires cross validation.")
+
+def _validate_halving(search_params: Dict[str, Any],
+                      search_params_file: str) -> None:
+    halving = search_params.get('halving', {})
+    for field in ["resource", "min_resource"]:
+        if field not in halving:
+            logger.critical(
+                "The halving search in {} needs a \"{}\" field."\
+                .format(search_params_file, field))
+            raise ValueError(
+                "The halving search in {} needs a \"{}\" field."\
+                .format(search_params_file, field))
+
+    resource = halving['resource']
+    if resource != "n_samples" and 'max_resource' not in halving:
+        logger.critical(
+            "The halving search in {} needs a \"max_resource\" for {}."\
+            .format(search_params_file, resource))
+        raise ValueError(
+            "The halving search in {} needs a \"max_resource\" for {}."\
+            .format(search_params_file, resource))
+
+    if resource in search_params.get('param_grid', {}) or \
+        resource in search_params.get('param_distributions', {}):
+        logger.critical(
+            "The halving resource {} can't also be a searched parameter."\
+            .format(resource))
+        raise ValueError(
+            "The halving resource {} can't also be a searched parameter."\
+            .format(resource))
 
 def _main(search_params_file: str,
           target_col: str,
@@ -342,18 +2841,21 @@ def _main(search_params_file: str,
             "{} does not exist. Creating {}.".format(output_dir, output_dir))
         os.mkdir(output_dir)
 
-    training_set = read_csv(training_file)
-    validation_set = read_csv(validation_file) if validation_file else None
+    # Only the headers are read to validate the columns, so bad inputs fail
+    # before any data is loaded.
+    training_columns = _read_columns(training_file)
+    validation_columns = _read_columns(validation_file) \
+                         if validation_file else None
 
     # Validate that the training data contains the target column.
-    if target_col not in training_set.columns:
+    if target_col not in training_columns:
         logger.critical(
             "Target column {} is not in the training data.".format(target_col))
         raise ValueError(
             "Target column {} not in training data.".format(target_col))
     
     # Validate that the validation data contains the target column.
-    if validation_file and target_col not in validation_set.columns:
+    if validation_file and target_col not in validation_columns:
         logger.critical(
             "Target column {} is not in the validation data."\
             .format(target_col))
@@ -361,12 +2863,24 @@ def _main(search_params_file: str,
             "Target column {} not in validation data.".format(target_col))
 
     if validation_file and \
-        set(training_set.columns) != set(validation_set.columns):
+        set(training_columns) != set(validation_columns):
         logger.critical(
             "Validation set doesn't have the same columns as the training set.")
         raise ValueError("Validation set doesn't have the same columns as "
             "the training set.")
 
+    # Csv files are read with a schema inferred from the training set. The
+    # other formats carry their own types.
+    schema = _load_schema(training_file, 
+                          target_col, 
+                          output_dir, 
+                          save = not dry_run) \
+             if _file_format(training_file) == "csv" else None
+    training_set = _read_input(training_file, schema, target_col)
+    validation_set = \
+        _read_input(validation_file, schema, target_col, training_columns) \
+        if validation_file else None
+
     if "estimator" not in search_params.keys():
         logger.critical(
             "The search params file {} needs an \"estimator\" field."\
@@ -375,20 +2889,104 @@ def _main(search_params_file: str,
             "The search params file {} needs an \"estimator\" field."\
             .format(search_params_file))
     
-    if "param_grid" not in search_params.keys():
+    search = search_params.get('search', 'grid')
+    if search not in SEARCH_MODES:
+        logger.critical("{} is not an available search. Use one of {}."\
+                        .format(search, ", ".join(sorted(SEARCH_MODES))))
+        raise ValueError("{} is not an available search.".format(search))
+
+    # Grid searches need a grid, random and bayesian searches need 
+    # distributions. Halving searches can use either.
+    if search == "grid" or (search == "halving" and \
+        "param_distributions" not in search_params.keys()):
+        candidate_field = "param_grid"
+    else:
+        candidate_field = "param_distributions"
+
+    if candidate_field not in search_params.keys():
+        logger.critical(
+            "The search params file {} needs a \"{}\" field."\
+            .format(search_params_file, candidate_field))
+        raise ValueError(
+            "The search params file {} needs a \"{}\" field."\
+            .format(search_params_file, candidate_field))
+
+    if candidate_field == "param_distributions" and \
+        "n_iter" not in search_params.keys():
+        logger.critical(
+            "The search params file {} needs an \"n_iter\" field."\
+            .format(search_params_file))
+        raise ValueError(
+            "The search params file {} needs an \"n_iter\" field."\
+            .format(search_params_file))
+
+    if candidate_field == "param_distributions" and \
+        (not isinstance(search_params['n_iter'], int) or 
+         search_params['n_iter'] < 1):
         logger.critical(
-            "The search params file {} needs a \"param_grid\" field."\
+            "The \"n_iter\" field in {} must be a positive integer."\
             .format(search_params_file))
         raise ValueError(
-            "The search params file {} needs a \"param_grid\" field."\
+            "The \"n_iter\" field in {} must be a positive integer."\
             .format(search_params_file))
     
-    grid = ParameterGrid(search_params['param_grid'])
+    if search == "halving":
+        _validate_halving(search_params, search_params_file)
+
+    if "pruning" in search_params.keys():
+        _validate_pruning(search_params, search_params_file, cross_validation)
+
+    if "persistence" in search_params.keys():
+        _validate_persistence(search_params, search_params_file)
+
+    if "benchmark" in search_params.keys():
+        _validate_benchmark(search_params, search_params_file)
+
+    if "transformer_cache" in search_params.keys():
+        _validate_transformer_cache(search_params, search_params_file)
+
+    if "training_scoring_sample" in search_params.keys():
+        _validate_training_scoring_sample(search_params, search_params_file)
+
+    if "cv" in search_params.keys():
+        _validate_cv(search_params, 
+                     search_params_file, 
+                     cross_validation,
+                     training_columns,
+                     target_col)
+
+    incremental = search_params.get('incremental', "auto")
+    if incremental not in INCREMENTAL_MODES:
+        logger.critical("{} is not an available incremental mode. Use one of "\
+                        "{}.".format(incremental, 
+                                     ", ".join(sorted(INCREMENTAL_MODES))))
+        raise ValueError(
+            "{} is not an available incremental mode.".format(incremental))
+
+    # Bayesian searches start from a sample of the space before the
+    # surrogate takes over.
+    if search == "bayesian":
+        candidates = _sample_candidates({
+            **search_params,
+            "n_iter": min(search_params['n_iter'], 
+                search_params.get('bayesian', {}).get('n_initial_points', 10))
+        })
+    elif candidate_field == "param_grid":
+        candidates = list(ParameterGrid(search_params['param_grid']))
+    else:
+        candidates = _sample_candidates(search_params)
     fit_params = search_params['fit_params'] \
                  if 'fit_params' in search_params.keys() else {}
     
-    # Get the feature columns.
-    feature_cols = [c for c in training_set.columns if c != target_col]
+    # Get the feature columns. The group splitter's column is only used to
+    # split the folds, unless it's asked for as a feature too.
+    cv = search_params.get('cv', {})
+    groups_col = cv['groups'] if cv.get('splitter') == "group" else None
+    excluded_cols = [groups_col] \
+                    if groups_col is not None and \
+                       not cv.get('groups_feature', False) else []
+    feature_cols = [c for c in training_set.columns 
+                    if c != target_col and c not in excluded_cols]
 
     X_train = training_set[feature_cols]
     y_train = training_set[[target_col]]
@@ -410,33 +3008,110 @@ def _main(search_params_file: str,
         "cross_validation": cross_validation,
         "training_file": training_file,
         "validation_file": validation_file,
-        "target_col": target_col
+        "target_col": target_col,
+        "incremental": incremental,
+        "persistence": search_params.get('persistence', {}),
+        "benchmark": search_params.get('benchmark'),
+        # The pruning metric defaults to the first scoring metric.
+        "pruning": {
+            "metric": search_params['scoring'][0],
+            **search_params['pruning']
+        } if "pruning" in search_params.keys() else None,
+        "transformer_cache": {
+            "dir": "{}/transformer_cache".format(output_dir),
+            "max_bytes": search_params['transformer_cache'].get(
+                'max_bytes', TRANSFORMER_CACHE_MAX_BYTES),
+            # Cached transformers are only valid for the same training data.
+            "fingerprint": joblib.hash([
+                os.path.abspath(training_file),
+                os.stat(training_file).st_size,
+                os.stat(training_file).st_mtime_ns,
+                target_col])
+        } if "transformer_cache" in search_params.keys() else None,
+        # Each worker keeps the partitions of this many folds. By default
+        # that's the fold it's working on, so only one copy is made.
+        "fold_cache": cv.get('fold_cache', 1),
+        "excluded_columns": excluded_cols,
+        "training_scoring_sample": _training_scoring_sample(
+            X_train, y_train, search_params['training_scoring_sample'])
+            if "training_scoring_sample" in search_params.keys() else None
     }
 
     # Step through the dry run _after_ validating all of the inputs.
     if dry_run:
-        _dry_run(grid, grid_search_context)
+        _dry_run(candidates, 
+                 grid_search_context,
+                 _halving_schedule(
+                    len(candidates),
+                    search_params['halving'],
+                    _halving_max_resource(search_params['halving'], 
+                                          grid_search_context))
+                 if search == "halving" else None)
         # Exit the program.
         return
+
+    # Completed models are appended to results.json as they finish.
+    _RESULTS_INDEX.pop(output_dir, None)
+    _migrate_results_files(output_dir)
+    _sync_results(output_dir)
+
+    # The folds are computed once, here, and every task reads their indices
+    # from output_dir.
+    if cross_validation is not None:
+        grid_search_context = {
+            **grid_search_context,
+            "folds": _write_folds(
+                grid_search_context, 
+                cv,
+                training_set[groups_col].values 
+                if groups_col is not None else None)
+        }
     
-    # This is an extremely sophisticated model ID scheme. Do note that things
-    # will be overwritten if there's already stuff in the output directory, 
-    # possibly. It will be bad if there's stuff from a different run (meaning
-    # a run for a different estimator / parameter grid).
-    Parallel(n_jobs=n_jobs)(delayed(_train_and_evaluate)\
-        # All the args to _train_and_evaluate.
-        (joblib.load(search_params['estimator']),
-         params,
-         model_id,
-         grid_search_context)
-        for model_id, params in enumerate(grid))
-
-    # Unify all of the results files into one.
-    logger.info("Consolidating results.")
-    results_glob = glob("{}/results_*.json".format(output_dir))
-    
-    with open('{}/results.json'.format(output_dir), 'w') as outfile:
-        subprocess.run(['cat'] + results_glob, stdout=outfile)
-
-    logger.info("Deleting intermediate results.")
-    subprocess.run(["rm"] + results_glob)
\ No newline at end of file
+    # The workers get handles to a memory mapped copy of the data rather than
+    # their own pickled copy of it for every task.
+    grid_search_context = _store_frames(grid_search_context)
+
+    # The estimator is loaded once, and each task gets an unfitted clone of
+    # it.
+    estimator = joblib.load(search_params['estimator'])
+
+    transformer_cache = grid_search_context['transformer_cache']
+    if transformer_cache is not None:
+        if not isinstance(estimator, Pipeline):
+            logger.warning("The transformer cache only applies to Pipeline "
+                           "estimators, not using it.")
+            grid_search_context = {
+                **grid_search_context, 
+                "transformer_cache": None
+            }
+        elif not os.path.exists(transformer_cache['dir']):
+            os.mkdir(transformer_cache['dir'])
+
+    if search == "halving":
+        _run_halving(estimator, 
+                     candidates, 
+                     search_params['halving'], 
+                     grid_search_context, 
+                     n_jobs)
+    elif search == "bayesian":
+        _run_bayesian(estimator,
+                      candidates,
+                      search_params,
+                      grid_search_context,
+                      n_jobs)
+    else:
+        # This is an extremely sophisticated model ID scheme. Do note that 
+        # things will be overwritten if there's already stuff in the output
+        # directory, possibly. It will be bad if there's stuff from a 
+        # different run (meaning a run for a different estimator / parameter
+        # grid).
+        _run_models(estimator,
+                    list(enumerate(candidates)),
+                    grid_search_context,
+                    n_jobs)
+
+    logger.info("Search completed. {} models in {}.".format(
+        len(_refresh_results_index(output_dir)), _results_file(output_dir)))
+    # Let go of the fold partitions this process materialized.
+    _FOLD_FRAMES.clear()
+    _write_results_parquet(output_dir)
\ No newline at end of file
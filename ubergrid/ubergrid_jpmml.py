@@ -2,14 +2,16 @@ import subprocess
 import logging
 import os
 import json
+import shutil
 import sys
+import tempfile
 
 from time import time
 
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
 
 from sklearn.externals import joblib
-from sklearn.externals.joblib import delayed
+from sklearn.externals.joblib import Parallel, delayed
 
 logging.basicConfig(format="%(asctime)s %(message)s", 
                     datefmt="%Y-%m-%d %H:%M:%S",
@@ -27,41 +29,107 @@ except Exception as e:
 
 from sklearn_pandas import DataFrameMapper
 
+# The training files are read the way ubergrid run reads them. The tests
+# import the modules directly rather than through the package.
+if __package__:
+    from .ubergrid_core import _read_columns
+else:
+    from ubergrid_core import _read_columns
+
+# The number of untimed passes over the file before the timed ones, so the
+# JIT has compiled the scoring code by the time it's measured.
+PMML_WARMUP = 3
+PMML_REPEATS = 5
+
+EVALUATOR_CLASS = "UbergridEvaluator"
+
+# A long lived evaluator that scores every model in one JVM. It's compiled
+# against the evaluator jar when the timing starts.
+EVALUATOR_SOURCE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 
+    "resources", 
+    EVALUATOR_CLASS + ".java")
+
 def _count_lines(filename: str) -> int:
-    input_file = subprocess.Popen(["cat", filename], stdout=subprocess.PIPE)
-    word_counter = subprocess.Popen(["wc", "-l"], 
-        stdin=input_file.stdout,
-        stdout=subprocess.PIPE)
-    num_lines = int(word_counter.communicate()[0].strip())
+    num_lines = 0
+    with open(filename, 'rb') as file_in:
+        for block in iter(lambda: file_in.read(1 << 20), b''):
+            num_lines += block.count(b'\n')
     
     return num_lines
 
-def _make_pmml(model_results: Dict[str,Any]) -> str:
+def _feature_key(model_results: Dict[str, Any]) -> Tuple[Any, ...]:
+    # Models with the same training file, target and excluded columns have
+    # the same features.
+    return (model_results['training_file'], 
+            model_results['target'],
+            tuple(model_results.get('excluded_columns', [])))
+
+def _pmml_file(model_file: str) -> str:
+    return os.path.splitext(model_file)[0] + '.pmml'
+
+def _pmml_current(model_file: str) -> bool:
+    # A PMML file written after its model was is up to date.
+    pmml_file = _pmml_file(model_file)
+    return os.path.exists(pmml_file) and \
+           os.path.getmtime(pmml_file) >= os.path.getmtime(model_file)
+
+def _make_pmml(model_results: Dict[str,Any], 
+               feature_cols: List[str] = None) -> str:
     training_file = model_results['training_file']
     target = model_results['target']
     model_file = model_results['model_file']
 
     estimator = joblib.load(model_file)
 
-    training_in = open(training_file, 'r')
-    header = next(training_in)
-    training_in.close()
-
-    # Grab the feature columns for the DataFrameMapper.
-    feature_cols = \
-        [c.strip() for c in header.strip().split(",") if c.strip() != target]
+    # Grab the feature columns for the DataFrameMapper, unless the caller
+    # already has them.
+    if feature_cols is None:
+        excluded_columns = model_results.get('excluded_columns', [])
+        feature_cols = \
+            [c for c in _read_columns(training_file) 
+             if c != target and c not in excluded_columns]
 
     df_mapper = DataFrameMapper([(feature_cols, None)])
     estimator_pipeline = PMMLPipeline([
         ("mapper", df_mapper),
         ("estimator", estimator)])
 
-    pmml_file = os.path.splitext(model_file)[0] + '.pmml'
-    sklearn2pmml(estimator_pipeline, pmml_file)
+    pmml_file = _pmml_file(model_file)
+    # Write to a temporary file and rename it, so an interrupted conversion
+    # never leaves a PMML file that looks up to date.
+    tmp_file = "{}.{}.tmp".format(pmml_file, os.getpid())
+    sklearn2pmml(estimator_pipeline, tmp_file)
+    os.replace(tmp_file, pmml_file)
     return pmml_file
 
-def _time_pmml(pmml_file: str, pmml_evaluator: str, file_to_evaluate: str) -> \
-    Dict[str, Any]:
+def _output_file(pmml_file: str) -> str:
+    # Each model gets its own scratch output, so timings don't collide.
+    return os.path.splitext(pmml_file)[0] + '.pmml_output.csv'
+
+def _timing_results(total_time: float, 
+                    num_records: int, 
+                    timing_mode: str,
+                    load_time: float = None) -> Dict[str, Any]:
+    return {
+        "pmml_total_prediction_time": total_time,
+        "pmml_total_prediction_records": num_records,
+        "pmml_records_per_second": 
+            num_records / total_time if total_time > 0 else None,
+        "pmml_load_time": load_time,
+        # Session timings leave out JVM startup and reading the input,
+        # subprocess timings include them.
+        "pmml_timing_mode": timing_mode
+    }
+
+def _time_pmml(pmml_file: str, 
+               pmml_evaluator: str, 
+               file_to_evaluate: str,
+               num_records: int = None) -> Dict[str, Any]:
+    if num_records is None:
+        num_records = _count_lines(file_to_evaluate) - 1
+
+    output_file = _output_file(pmml_file)
     start = time()
     subprocess.run([
         "java",
@@ -73,18 +141,91 @@ def _time_pmml(pmml_file: str, pmml_evaluator: str, file_to_evaluate: str) -> \
         "--input",
         file_to_evaluate,
         "--output",
-        "output.csv"])
+        output_file])
     stop = time()
 
-    subprocess.run(["rm", "-rf", "output.csv"])
-    return {
-        "pmml_total_prediction_time": stop - start,
-        "pmml_total_prediction_records": _count_lines(file_to_evaluate) - 1
-    }
+    if os.path.exists(output_file):
+        os.remove(output_file)
+    # This includes JVM startup and reading the input, and there's no
+    # separate load time.
+    return _timing_results(stop - start, num_records, "subprocess")
+
+def _start_evaluator(pmml_evaluator: str, 
+                     work_dir: str) -> subprocess.Popen:
+    """ Compiles the evaluator session against the evaluator jar and starts
+        it. Returns None if there's no JDK or the compilation fails, in which
+        case the models are timed with a JVM each.
+    """
+    if shutil.which("javac") is None or shutil.which("java") is None:
+        logger.warning("No javac found, timing each model in its own JVM.")
+        return None
+
+    compiled = subprocess.run(
+        ["javac", "-cp", pmml_evaluator, "-d", work_dir, EVALUATOR_SOURCE],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True)
+    if compiled.returncode != 0:
+        logger.warning("Unable to compile the evaluator session, timing each "
+                       "model in its own JVM: {}".format(compiled.stderr))
+        return None
+
+    return subprocess.Popen(
+        ["java", 
+         "-cp", 
+         os.pathsep.join([pmml_evaluator, work_dir]), 
+         EVALUATOR_CLASS],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        universal_newlines=True)
+
+def _stop_evaluator(evaluator: subprocess.Popen) -> None:
+    evaluator.stdin.close()
+    evaluator.wait()
+
+def _time_pmml_session(evaluator: subprocess.Popen,
+                       pmml_file: str,
+                       file_to_evaluate: str,
+                       warmup: int = PMML_WARMUP,
+                       repeats: int = PMML_REPEATS) -> Dict[str, Any]:
+    """ Times a PMML file in a running evaluator session. The prediction
+        time is the mean over the timed passes, after the warmup passes.
+        The number of records is the session's count of the parsed input.
+        Returns None if the session couldn't time the model.
+    """
+    output_file = _output_file(pmml_file)
+    try:
+        evaluator.stdin.write("\t".join(
+            [os.path.abspath(pmml_file),
+             os.path.abspath(file_to_evaluate),
+             os.path.abspath(output_file),
+             str(warmup),
+             str(repeats)]) + "\n")
+        evaluator.stdin.flush()
+        response = evaluator.stdout.readline().rstrip("\n").split("\t")
+    except (BrokenPipeError, OSError) as e:
+        response = ["error", str(e)]
+    finally:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+
+    if response[0] != "ok":
+        logger.warning("Evaluator session failed on {}: {}".format(
+            pmml_file, 
+            response[1] if len(response) > 1 else "session exited"))
+        return None
+    
+    return _timing_results(float(response[3]), 
+                           int(response[1]), 
+                           "session",
+                           load_time=float(response[2]))
 
 def _main(results_dir: str,
           pmml_evaluator: str = None,
-          file_to_evaluate: str = None) -> None:
+          file_to_evaluate: str = None,
+          n_jobs: int = 1,
+          warmup: int = PMML_WARMUP,
+          repeats: int = PMML_REPEATS) -> None:
     results_file = results_dir + "/results.json"
     # Validate the inputs.
     if not os.path.exists(results_file):
@@ -107,26 +248,94 @@ def _main(results_dir: str,
             "File {} does not exist.".format(file_to_evaluate))
         raise ValueError(
             "File {} does not exist.".format(file_to_evaluate))
+
+    if warmup < 0 or repeats < 1:
+        logger.critical("PMML timing requires at least one timed pass and "
+                        "no negative warmup passes, got {} and {}."\
+                        .format(repeats, warmup))
+        raise ValueError("PMML timing requires at least one timed pass and "
+                         "no negative warmup passes, got {} and {}."\
+                         .format(repeats, warmup))
     
     logger.info("Reading results file {}.".format(results_file))
     results_in = open(results_file, 'r')
     results = [json.loads(r) for r in results_in]
     results_in.close()
 
+    # The feature columns are read once for each training file rather than
+    # once for each model.
+    feature_cols = {}
+    headers = {}
+    for result in results:
+        key = _feature_key(result)
+        if key not in feature_cols:
+            if result['training_file'] not in headers:
+                headers[result['training_file']] = \
+                    _read_columns(result['training_file'])
+            feature_cols[key] = [c for c in headers[result['training_file']]
+                                 if c != result['target'] and 
+                                    c not in result.get('excluded_columns', [])]
+
+    # Pruned models were never fit, so there's nothing to convert. Models
+    # with an up to date PMML file were converted by a previous run.
+    to_convert = []
+    for result in results:
+        if result.get("pruned", False):
+            logger.info("Skipping pruned model {}.".format(result["model_id"]))
+        elif _pmml_current(result['model_file']):
+            logger.info("PMML file for model {} already exists, skipping."\
+                        .format(result["model_id"]))
+        else:
+            to_convert.append(result)
+    
+    logger.info("Creating PMML files for {} models.".format(len(to_convert)))
+    # Each conversion starts its own JVM, so they're spread over processes.
+    Parallel(n_jobs=n_jobs)(
+        delayed(_make_pmml)(
+            result, 
+            feature_cols[_feature_key(result)])
+        for result in to_convert)
+
+    evaluator = None
+    work_dir = None
+    if pmml_evaluator:
+        # The records are counted once rather than once for each model.
+        num_records = _count_lines(file_to_evaluate) - 1
+        # One JVM scores every model, so the timings leave out JVM startup.
+        work_dir = tempfile.mkdtemp(prefix="ubergrid_evaluator_")
+        evaluator = _start_evaluator(pmml_evaluator, work_dir)
+
     new_results = []
     for result in results:
+        if result.get("pruned", False):
+            new_results.append(result)
+            continue
 
-        logger.info("Creating PMML file for model {}.".format(
-            result["model_id"]))
-        pmml_file = _make_pmml(result)
         # Add the PMML file to the result.
-        result['pmml_file'] = pmml_file
+        result['pmml_file'] = _pmml_file(result['model_file'])
 
         if pmml_evaluator:
             logger.info("Timing PMML file for model {}.".format(
                 result["model_id"]))
-            pmml_results = \
-                _time_pmml(pmml_file, pmml_evaluator, file_to_evaluate)
+            pmml_results = None
+            if evaluator is not None:
+                pmml_results = \
+                    _time_pmml_session(evaluator,
+                                       result['pmml_file'],
+                                       file_to_evaluate,
+                                       warmup=warmup,
+                                       repeats=repeats)
+                if evaluator.poll() is not None:
+                    logger.warning("Evaluator session exited, timing the "
+                                   "remaining models in their own JVMs. "
+                                   "These timings include JVM startup.")
+                    evaluator = None
+            if pmml_results is None:
+                pmml_results = \
+                    _time_pmml(result['pmml_file'], 
+                               pmml_evaluator, 
+                               file_to_evaluate,
+                               num_records)
             logger.info(
                 "Done timing model {}. Took {:.3f} seconds for {} records."\
                 .format(result['model_id'], 
@@ -134,9 +343,16 @@ def _main(results_dir: str,
                         pmml_results['pmml_total_prediction_records']))
             # Integrate the results.
             result = { **result, **pmml_results }
-            new_results.append(result)
+        new_results.append(result)
+
+    if evaluator is not None:
+        _stop_evaluator(evaluator)
+    if work_dir is not None:
+        shutil.rmtree(work_dir, ignore_errors=True)
     
-    # Now write all of the results back to disk, overwriting the previous file.
-    with open(results_file, 'w') as results_out:
+    # Now write all of the results back to disk, replacing the previous file.
+    tmp_file = "{}.{}.tmp".format(results_file, os.getpid())
+    with open(tmp_file, 'w') as results_out:
         for result in new_results:
-            results_out.write(json.dumps(result) + "\n")
\ No newline at end of file
+            results_out.write(json.dumps(result) + "\n")
+    os.replace(tmp_file, results_file)